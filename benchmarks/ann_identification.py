@@ -0,0 +1,73 @@
+"""
+قياس الاسترجاع (recall) وزمن البحث لفهرس IVF مقارنة بالبحث الدقيق
+
+يُولَّد معرض اصطناعي من هويات حول مراكز عشوائية، ويُستعلم بتشفير مشوش
+لهوية مسجلة كما يحدث عند التقاط صورة جديدة لطالب.
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.ann_identification
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn.functional as F
+
+from face_ann_index import IVFIndex
+
+
+def synthetic_gallery(size, dim, generator, spread=2.0):
+    """تشفيرات مطبّعة متجمعة حول مراكز عشوائية (تشبه توزيع الوجوه الحقيقية)"""
+    n_clusters = max(1, size // 50)
+    centers = F.normalize(torch.randn(n_clusters, dim, generator=generator), dim=1)
+    assignment = torch.randint(0, n_clusters, (size,), generator=generator)
+    noise = torch.randn(size, dim, generator=generator) / dim ** 0.5
+    return F.normalize(centers[assignment] + spread * noise, dim=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--noise', type=float, default=0.5,
+                        help='نسبة الضجيج المضاف إلى تشفير الاستعلام')
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    dim = 512
+    print(f"{'gallery':>8} {'n_probe':>7} {'lists':>6} {'build_s':>8} {'exact_ms':>9} "
+          f"{'ann_ms':>7} {'recall@1':>9} {'recall@k':>9}")
+    for size in args.sizes:
+        gallery = synthetic_gallery(size, dim, generator)
+        ids = [str(i) for i in range(size)]
+        targets = torch.randint(0, size, (args.queries,), generator=generator)
+        queries = F.normalize(gallery[targets] + args.noise * torch.randn(args.queries, dim, generator=generator)
+                              / dim ** 0.5, dim=1)
+
+        start = time.perf_counter()
+        exact = [torch.topk(gallery @ query, args.k).indices.tolist() for query in queries]
+        exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        for n_probe in args.n_probe:
+            index = IVFIndex(dim=dim, n_probe=n_probe, train_threshold=min(2048, size))
+            start = time.perf_counter()
+            index.build(ids, gallery)
+            build_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = [index.search(query, args.k) for query in queries]
+            ann_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+            hits_at_1 = sum(int(result[0][0]) == truth[0] for result, truth in zip(results, exact))
+            hits_at_k = sum(len({int(i) for i, _ in result} & set(truth))
+                            for result, truth in zip(results, exact))
+            print(f"{size:>8} {n_probe:>7} {index.n_lists:>6} {build_s:>8.2f} {exact_ms:>9.3f} "
+                  f"{ann_ms:>7.3f} {hits_at_1 / args.queries:>9.3f} "
+                  f"{hits_at_k / (args.queries * args.k):>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
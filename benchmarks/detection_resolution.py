@@ -0,0 +1,93 @@
+"""
+مقارنة زمن اكتشاف الوجه بالدقة الأصلية وبالصورة المصغرة (JPEG draft)
+وتطابق التشفيرات الناتجة من المسارين
+
+التشغيل من جذر المشروع على مجلد صور محلي:
+    python -m benchmarks.detection_resolution --images path/to/selfies
+بدون مجلد تُولَّد صور JPEG اصطناعية بدقة 12 ميجابكسل (للزمن فقط، لا وجوه فيها).
+"""
+
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from facenet_pytorch import MTCNN, InceptionResnetV1
+from PIL import Image
+
+from face_preprocessing import decode_image, detect_faces
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_payloads(folder, count):
+    """بايتات الصور كما تصل إلى الخادم"""
+    if folder:
+        names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+        return [(name, open(os.path.join(folder, name), 'rb').read()) for name in names]
+
+    generator = np.random.default_rng(0)
+    payloads = []
+    for i in range(count):
+        pixels = generator.integers(0, 255, (3024, 4032, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        payloads.append((f'synthetic_{i}.jpg', buffer.getvalue()))
+    return payloads
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default=None, help='مجلد صور محلية')
+    parser.add_argument('--synthetic-count', type=int, default=3)
+    parser.add_argument('--max-edges', type=int, nargs='+', default=[640, 800, 1024])
+    parser.add_argument('--pretrained', action='store_true',
+                        help='استخدام أوزان vggface2 (تتطلب تنزيلها مسبقًا)')
+    args = parser.parse_args()
+
+    mtcnn = MTCNN(image_size=160, margin=20, keep_all=False, min_face_size=40,
+                  thresholds=[0.6, 0.7, 0.8], factor=0.709, post_process=True, device='cpu')
+    resnet = InceptionResnetV1(pretrained='vggface2' if args.pretrained else None).eval()
+
+    print(f"{'image':<24} {'path':>9} {'decode_ms':>10} {'detect_ms':>10} {'cosine':>8}")
+    totals = {}
+    for name, payload in load_payloads(args.images, args.synthetic_count):
+        full, full_decode_ms = timed(lambda: decode_image(io.BytesIO(payload)))
+        full_face, full_detect_ms = timed(lambda: detect_faces(mtcnn, full))
+        print(f"{name[:24]:<24} {'full':>9} {full_decode_ms:>10.1f} {full_detect_ms:>10.1f} {'':>8}")
+        totals.setdefault('full', []).append(full_decode_ms + full_detect_ms)
+
+        full_embedding = None
+        if full_face is not None:
+            with torch.no_grad():
+                full_embedding = resnet(full_face.unsqueeze(0))[0]
+
+        for max_edge in args.max_edges:
+            proxy, decode_ms = timed(lambda: decode_image(io.BytesIO(payload), max_edge))
+            face, detect_ms = timed(lambda: detect_faces(mtcnn, proxy))
+            agreement = ''
+            if face is not None and full_embedding is not None:
+                with torch.no_grad():
+                    embedding = resnet(face.unsqueeze(0))[0]
+                agreement = f"{F.cosine_similarity(embedding, full_embedding, dim=0).item():.4f}"
+            elif (face is None) != (full_embedding is None):
+                agreement = 'mismatch'
+            print(f"{'':<24} {max_edge:>9} {decode_ms:>10.1f} {detect_ms:>10.1f} {agreement:>8}")
+            totals.setdefault(max_edge, []).append(decode_ms + detect_ms)
+
+    print()
+    for path, samples in totals.items():
+        print(f"mean decode+detect ms ({path}): {sum(samples) / len(samples):.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+زمن كشف التسجيلات المكررة في المعرض كاملًا: الحلقة الزوجية البسيطة
+(مقدّرة من عينة) مقابل الضرب على كتل ومع تصفية IVF، واسترجاع الأزواج المزروعة
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.duplicate_detection --sizes 10000 100000
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn.functional as F
+
+from face_duplicates import find_duplicates
+from benchmarks.ann_identification import synthetic_gallery
+
+
+def plant_duplicates(gallery, count, noise, generator):
+    """استبدال أول count صفوف بنسخ مشوشة من صفوف أخرى؛ يُرجع الأزواج المزروعة"""
+    size, dim = gallery.shape
+    sources = torch.randint(count, size, (count,), generator=generator)
+    gallery[:count] = F.normalize(gallery[sources] + noise * torch.randn(count, dim, generator=generator)
+                                  / dim ** 0.5, dim=1)
+    return {tuple(sorted((str(i), str(source)))) for i, source in enumerate(sources.tolist())}
+
+
+def naive_seconds(gallery, threshold, sample_rows):
+    """زمن الحلقة الزوجية (زوج بزوج) مقدّرًا للمعرض كاملًا من عينة صفوف"""
+    size = gallery.shape[0]
+    started = time.perf_counter()
+    compared = 0
+    for i in range(sample_rows):
+        for j in range(i + 1, size):
+            if torch.dot(gallery[i], gallery[j]).item() >= threshold:
+                pass
+            compared += 1
+    elapsed = time.perf_counter() - started
+    return elapsed / compared * size * (size - 1) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--duplicates', type=int, default=100)
+    parser.add_argument('--noise', type=float, default=0.5, help='ضجيج النسخة المكررة')
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--block-size', type=int, default=4096)
+    parser.add_argument('--n-probe', type=int, default=3)
+    parser.add_argument('--naive-sample-rows', type=int, default=2)
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    print(f"threads: {torch.get_num_threads()}")
+    print(f"{'gallery':>8} {'method':<8} {'seconds':>10} {'pairs':>7} {'recall':>7}")
+    for size in args.sizes:
+        gallery = synthetic_gallery(size, 512, generator)
+        planted = plant_duplicates(gallery, args.duplicates, args.noise, generator)
+        ids = [str(i) for i in range(size)]
+
+        estimate = naive_seconds(gallery, args.threshold * 2 - 1, args.naive_sample_rows)
+        print(f"{size:>8} {'naive*':<8} {estimate:>10.1f} {'-':>7} {'-':>7}")
+
+        for method, use_ivf in (('blocked', False), ('ivf', True)):
+            started = time.perf_counter()
+            pairs = find_duplicates(ids, gallery, args.threshold, args.block_size, use_ivf, args.n_probe)
+            elapsed = time.perf_counter() - started
+            found = {(pair['student_a'], pair['student_b']) for pair in pairs}
+            recall = len(found & planted) / len(planted)
+            print(f"{size:>8} {method:<8} {elapsed:>10.1f} {len(pairs):>7} {recall:>7.3f}")
+
+    print("\n* naive: مقدّر من عينة صفوف")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+زمن كل مرحلة من مسار الوجه كما ينفذه الخادم: فك base64 وفك JPEG والاكتشاف
+والاقتصاص والتشفير والمطابقة مع المعرض، دون أي اتصال بالشبكة
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.face_pipeline --resolutions 640x480 1920x1080 \
+        --batch-sizes 1 16 --gallery-sizes 1 10000 1000000 --threads 1 4 \
+        --json results/face_pipeline.json
+مع --images تُستخدم صور محلية بدقتها الأصلية بدل الصور الاصطناعية (التي لا
+وجوه فيها، فيُقتص مربع ثابت في منتصف الصورة لقياس الاقتصاص).
+المخرج JSON يحمل إصدار الشيفرة والبيئة لمقارنة النتائج بين الإيداعات.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from facenet_pytorch import MTCNN, InceptionResnetV1
+from PIL import Image
+
+from face_gallery import FaceGallery, TemplateBank
+from face_metrics import percentiles
+from face_preprocessing import decode_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_payloads(folder, resolutions):
+    """(وسم الدقة، بايتات JPEG) لكل صورة"""
+    if folder:
+        names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+        payloads = []
+        for name in names:
+            with open(os.path.join(folder, name), 'rb') as f:
+                payload = f.read()
+            width, height = Image.open(io.BytesIO(payload)).size
+            payloads.append((f'{width}x{height}', payload))
+        return payloads
+
+    generator = np.random.default_rng(0)
+    payloads = []
+    for resolution in resolutions:
+        width, height = (int(value) for value in resolution.split('x'))
+        buffer = io.BytesIO()
+        Image.fromarray(generator.integers(0, 255, (height, width, 3), dtype=np.uint8)).save(
+            buffer, format='JPEG', quality=90)
+        payloads.append((resolution, buffer.getvalue()))
+    return payloads
+
+
+def measure(function, iterations):
+    """تشغيل الدالة وإرجاع آخر نتيجة وعينات الزمن بالمللي ثانية"""
+    samples = []
+    result = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, samples
+
+
+def summarize(samples):
+    summary = percentiles(samples)
+    return {
+        'samples': len(samples),
+        'mean_ms': sum(samples) / len(samples),
+        'p50_ms': summary['p50'],
+        'p99_ms': summary['p99'],
+        'max_ms': summary['max']
+    }
+
+
+def synthetic_gallery(size, dim=512, templates_per_student=1):
+    """معرض وبنك قوالب بتشفيرات عشوائية مطبّعة"""
+    generator = torch.Generator().manual_seed(size)
+    embeddings = F.normalize(torch.randn(size, dim, generator=generator), p=2, dim=1)
+    ids = [str(i) for i in range(size)]
+    gallery = FaceGallery(dim=dim, capacity=max(1, size))
+    gallery.add_many(ids, embeddings)
+    bank = TemplateBank(dim=dim, max_templates=templates_per_student, capacity=1)
+    bank.add(ids[0], embeddings[0])
+    return ids, gallery, bank
+
+
+def run_image_stages(mtcnn, payloads, max_detection_edge, iterations, record):
+    """فك الترميز والاكتشاف والاقتصاص لكل صورة؛ يُرجع قصاصة وجه لكل صورة"""
+    faces = []
+    for resolution, payload in payloads:
+        encoded = base64.b64encode(payload)
+        raw, samples = measure(lambda: base64.b64decode(encoded), iterations)
+        record('base64_decode', samples, resolution=resolution)
+
+        decoded, samples = measure(lambda: decode_image(io.BytesIO(raw), max_detection_edge), iterations)
+        record('jpeg_decode', samples, resolution=resolution)
+
+        detection, samples = measure(lambda: mtcnn.detect(decoded.proxy), iterations)
+        record('detect', samples, resolution=resolution)
+
+        boxes = detection[0]
+        if boxes is not None:
+            box = boxes[:1] * np.array([decoded.scale_x, decoded.scale_y, decoded.scale_x, decoded.scale_y])
+        else:
+            # لا وجه في الصور الاصطناعية: مربع ثابت في المنتصف
+            width, height = decoded.image.size
+            side = min(width, height) / 3
+            box = np.array([[width / 2 - side / 2, height / 2 - side / 2, width / 2 + side / 2, height / 2 + side / 2]])
+        face, samples = measure(lambda: mtcnn.extract(decoded.image, box, None), iterations)
+        record('crop', samples, resolution=resolution)
+        faces.append(face)
+    return faces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default=None, help='مجلد صور محلية')
+    parser.add_argument('--resolutions', nargs='+', default=['640x480', '1280x960', '4032x3024'])
+    parser.add_argument('--max-detection-edge', type=int, default=800)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[1, 1000, 100000])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1])
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--model', default=None, help='نموذج TorchScript (الافتراضي أوزان عشوائية)')
+    parser.add_argument('--json', default=None, help='مسار ملف النتائج بصيغة JSON')
+    args = parser.parse_args()
+
+    mtcnn = MTCNN(image_size=160, margin=20, keep_all=False, min_face_size=40,
+                  thresholds=[0.6, 0.7, 0.8], factor=0.709, post_process=True, device='cpu')
+    resnet = torch.jit.load(args.model).eval() if args.model else InceptionResnetV1(pretrained=None).eval()
+    payloads = load_payloads(args.images, args.resolutions)
+
+    results = []
+    print(f"{'stage':<16} {'threads':>7} {'param':>16} {'p50_ms':>9} {'p99_ms':>9}")
+
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+
+        def record(stage, samples, **params):
+            entry = {'stage': stage, 'threads': threads, 'resolution': None,
+                     'batch_size': None, 'gallery_size': None}
+            entry.update(params)
+            entry.update(summarize(samples))
+            results.append(entry)
+            label = ' '.join(str(value) for value in params.values())
+            print(f"{stage:<16} {threads:>7} {label:>16} {entry['p50_ms']:>9.2f} {entry['p99_ms']:>9.2f}")
+
+        with torch.no_grad():
+            faces = run_image_stages(mtcnn, payloads, args.max_detection_edge, args.iterations, record)
+
+            for batch_size in args.batch_sizes:
+                batch = torch.stack([faces[i % len(faces)] for i in range(batch_size)])
+                embeddings, samples = measure(lambda: resnet(batch), args.iterations)
+                record('embed', samples, batch_size=batch_size)
+
+        probe = embeddings[0]
+        for gallery_size in args.gallery_sizes:
+            ids, gallery, bank = synthetic_gallery(gallery_size)
+            query = F.normalize(probe.reshape(1, -1), p=2, dim=1)[0]
+
+            # التحقق 1:1: التشابه مع قوالب الطالب ومتوسط التشابه مع باقي المعرض
+            _, samples = measure(lambda: (bank.score(ids[0], probe),
+                                          gallery.impostor_mean_similarity(probe, ids[0])), args.iterations)
+            record('match_verify', samples, gallery_size=gallery_size)
+
+            # التعرف 1:N بالبحث الدقيق في المعرض كاملًا
+            _, samples = measure(lambda: torch.topk(gallery.matrix @ query, min(5, gallery_size)), args.iterations)
+            record('match_identify', samples, gallery_size=gallery_size)
+
+    if args.json:
+        output = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'torch': torch.__version__,
+                'cpu_count': os.cpu_count(),
+                'platform': platform.platform(),
+                'model': args.model or 'InceptionResnetV1(random)',
+                'images': args.images or 'synthetic',
+                'max_detection_edge': args.max_detection_edge,
+                'iterations': args.iterations
+            },
+            'results': results
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"\nwrote {len(results)} results to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
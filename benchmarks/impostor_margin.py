@@ -0,0 +1,68 @@
+"""
+قياس زمن حساب متوسط التشابه مع الوجوه الأخرى مع نمو المعرض
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.impostor_margin
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn.functional as F
+
+from face_gallery import FaceGallery
+
+
+def legacy_impostor_mean(embedding, student_id, face_embeddings):
+    """الطريقة القديمة: حلقة calculate_similarity على كل الطلاب الآخرين"""
+    other_similarities = []
+    for other_id, other_embedding in face_embeddings.items():
+        if other_id != student_id:
+            embedding1_normalized = F.normalize(embedding.unsqueeze(0), p=2, dim=1)
+            embedding2_normalized = F.normalize(other_embedding.unsqueeze(0), p=2, dim=1)
+            cosine_similarity = torch.mm(embedding1_normalized, embedding2_normalized.t()).item()
+            other_similarities.append((cosine_similarity + 1) / 2)
+    return sum(other_similarities) / len(other_similarities)
+
+
+def time_call(fn, repeats):
+    """متوسط زمن الاستدعاء بالميلي ثانية"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help='أكبر حجم معرض تُقاس عنده الطريقة القديمة')
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    print(f"{'gallery':>8} {'running_sum_ms':>15} {'legacy_ms':>10} {'abs_diff':>10}")
+    for size in args.sizes:
+        embeddings = torch.randn(size, 512)
+        face_embeddings = {str(i): embeddings[i] for i in range(size)}
+        gallery = FaceGallery()
+        for student_id, embedding in face_embeddings.items():
+            gallery.add(student_id, embedding)
+
+        probe = torch.randn(512)
+        fast_ms = time_call(lambda: gallery.impostor_mean_similarity(probe, '0'), args.repeats)
+        fast_value = gallery.impostor_mean_similarity(probe, '0')
+
+        legacy_ms, diff = float('nan'), float('nan')
+        if size <= args.legacy_max:
+            legacy_repeats = max(1, args.repeats * 100 // size)
+            legacy_ms = time_call(lambda: legacy_impostor_mean(probe, '0', face_embeddings), legacy_repeats)
+            diff = abs(legacy_impostor_mean(probe, '0', face_embeddings) - fast_value)
+
+        print(f"{size:>8} {fast_ms:>15.4f} {legacy_ms:>10.2f} {diff:>10.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+مقارنة نموذج التشفير fp32 بالنسختين المكممتين (dynamic وstatic int8):
+زمن الاستدلال وحجم النموذج وتطابق التشفيرات (جيب التمام) مع fp32
+
+التشغيل من جذر المشروع على مجلد صور وجوه محلي:
+    python -m benchmarks.quantized_embedder --images path/to/faces --pretrained
+بدون مجلد تُستخدم قصاصات عشوائية (للزمن والحجم فقط؛ التطابق عليها لا يمثل وجوهًا).
+يُعاير النموذج الثابت على أول جزء من القصاصات ويُقاس التطابق على الباقي.
+"""
+
+import argparse
+import io
+import time
+
+import torch
+import torch.nn.functional as F
+from facenet_pytorch import MTCNN, InceptionResnetV1
+
+from face_metrics import percentiles
+from face_quantization import load_calibration_faces, quantize_embedder
+
+
+def load_faces(folder, count):
+    if folder:
+        mtcnn = MTCNN(image_size=160, margin=20, min_face_size=40, thresholds=[0.6, 0.7, 0.8],
+                      factor=0.709, post_process=True, device='cpu')
+        return load_calibration_faces(folder, mtcnn, count)
+    return torch.randn(count, 3, 160, 160, generator=torch.Generator().manual_seed(0))
+
+
+def script(model, example):
+    """تحويل النموذج إلى TorchScript مجمد كما يُحمّله الخادم، مع حجمه المحفوظ"""
+    with torch.no_grad():
+        frozen = torch.jit.freeze(torch.jit.trace(model.eval(), example))
+    buffer = io.BytesIO()
+    torch.jit.save(frozen, buffer)
+    return frozen, len(buffer.getvalue()) / 1e6
+
+
+def latency_ms(model, batch_size, iterations):
+    batch = torch.randn(batch_size, 3, 160, 160)
+    samples = []
+    with torch.no_grad():
+        model(batch)
+        for _ in range(iterations):
+            started = time.perf_counter()
+            model(batch)
+            samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)['p50']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default=None, help='مجلد صور وجوه أو قصاصات 160x160')
+    parser.add_argument('--count', type=int, default=64, help='أقصى عدد قصاصات')
+    parser.add_argument('--calibration-fraction', type=float, default=0.5)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--backend', default='x86')
+    parser.add_argument('--pretrained', action='store_true',
+                        help='استخدام أوزان vggface2 (تتطلب تنزيلها مسبقًا)')
+    args = parser.parse_args()
+
+    torch.backends.quantized.engine = args.backend
+    faces = load_faces(args.images, args.count)
+    split = max(1, min(faces.shape[0] - 1, int(faces.shape[0] * args.calibration_fraction)))
+    calibration, evaluation = (faces[:split], faces[split:]) if faces.shape[0] > 1 else (faces, faces)
+
+    source = InceptionResnetV1(pretrained='vggface2' if args.pretrained else None).eval()
+    variants = {
+        'fp32': source,
+        'int8-dynamic': quantize_embedder(source, 'dynamic'),
+        'int8-static': quantize_embedder(source, 'static', calibration, args.backend)
+    }
+
+    with torch.no_grad():
+        reference = source(evaluation)
+
+    print(f"calibration faces: {calibration.shape[0]}, evaluation faces: {evaluation.shape[0]}, "
+          f"threads: {torch.get_num_threads()}")
+    header = f"{'model':<14} {'size_mb':>8}"
+    for batch_size in args.batch_sizes:
+        header += f" {f'p50_ms@{batch_size}':>11}"
+    print(header + f" {'cos_mean':>9} {'cos_min':>8}")
+
+    for name, model in variants.items():
+        scripted, size_mb = script(model, evaluation[:1])
+        with torch.no_grad():
+            agreement = F.cosine_similarity(scripted(evaluation), reference, dim=1)
+        row = f"{name:<14} {size_mb:>8.1f}"
+        for batch_size in args.batch_sizes:
+            row += f" {latency_ms(scripted, batch_size, args.iterations):>11.1f}"
+        print(row + f" {agreement.mean().item():>9.4f} {agreement.min().item():>8.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+إنتاجية التحقق (صور في الثانية) داخل خيوط العملية الواحدة مقابل عمال
+الاستدلال المستقلين، بعدد متزايد من الطلبات المتزامنة
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.worker_pool_throughput --workers 1 2 4 8 16
+بدون --image تُستخدم صورة اصطناعية (لا وجه فيها: يُقاس فك الترميز
+والاكتشاف فقط)، ومع صورة وجه حقيقية يُقاس التشفير أيضًا.
+"""
+
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from facenet_pytorch import MTCNN, InceptionResnetV1
+from PIL import Image
+
+from face_inference_scheduler import InferenceScheduler
+from face_preprocessing import decode_image, detect_faces
+from face_worker_pool import InferenceWorkerPool
+
+
+def load_payload(path):
+    if path:
+        with open(path, 'rb') as f:
+            return f.read()
+    generator = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray(generator.integers(0, 255, (1280, 960, 3), dtype=np.uint8)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def run(handler, payload, requests, concurrency):
+    """تشغيل الطلبات بعدد خيوط متزامنة وإرجاع الإنتاجية"""
+    with ThreadPoolExecutor(concurrency) as executor:
+        started = time.perf_counter()
+        list(executor.map(lambda _: handler(payload), range(requests)))
+        return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default=None, help='صورة وجه محلية')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--max-detection-edge', type=int, default=800)
+    args = parser.parse_args()
+
+    # النموذج يُحمّل مرة واحدة قبل أي fork
+    mtcnn = MTCNN(image_size=160, margin=20, keep_all=False, min_face_size=40,
+                  thresholds=[0.6, 0.7, 0.8], factor=0.709, post_process=True, device='cpu')
+    resnet = InceptionResnetV1(pretrained=None).eval()
+    payload = load_payload(args.image)
+
+    pools = {workers: InferenceWorkerPool(mtcnn, resnet, workers, args.threads_per_worker, warmup_iterations=1)
+             for workers in args.workers}
+
+    scheduler = InferenceScheduler(resnet).start()
+
+    def in_process(data):
+        face = detect_faces(mtcnn, decode_image(io.BytesIO(data), args.max_detection_edge))
+        return scheduler.embed(face) if face is not None else None
+
+    print(f"cpus: {len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()}, "
+          f"torch threads (in-process): {torch.get_num_threads()}")
+    print(f"{'mode':<16} {'concurrency':>11} {'req/s':>8}")
+    for workers, pool in pools.items():
+        concurrency = workers * 2
+        in_process_rps = run(in_process, payload, args.requests, concurrency)
+        pool_rps = run(lambda data: pool.embed_image(data, args.max_detection_edge), payload,
+                       args.requests, concurrency)
+        print(f"{'in-process':<16} {concurrency:>11} {in_process_rps:>8.1f}")
+        print(f"{f'{workers} workers':<16} {concurrency:>11} {pool_rps:>8.1f}")
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+فهرس بحث تقريبي عن أقرب الجيران (IVF) لتشفيرات الوجوه المطبّعة
+"""
+
+import math
+import threading
+
+import torch
+import torch.nn.functional as F
+
+
+class _InvertedList:
+    def __init__(self, dim, capacity=16):
+        """قائمة معكوسة: معرفات وتشفيرات مطبّعة لعنقود واحد"""
+        self.ids = []
+        self.vectors = torch.zeros(capacity, dim)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def matrix(self):
+        return self.vectors[:len(self.ids)]
+
+    def append(self, student_id, vector):
+        """إضافة تشفير وإرجاع موضعه"""
+        position = len(self.ids)
+        if position == self.vectors.shape[0]:
+            grown = torch.zeros(position * 2, self.vectors.shape[1])
+            grown[:position] = self.vectors
+            self.vectors = grown
+        self.vectors[position] = vector
+        self.ids.append(student_id)
+        return position
+
+    def remove(self, position):
+        """حذف تشفير بنقل الأخير مكانه؛ يُرجع معرف التشفير المنقول أو None"""
+        last = len(self.ids) - 1
+        moved = None
+        if position != last:
+            self.vectors[position] = self.vectors[last]
+            self.ids[position] = self.ids[last]
+            moved = self.ids[position]
+        self.ids.pop()
+        return moved
+
+
+class IVFIndex:
+    def __init__(self, dim=512, n_probe=8, train_threshold=2048, retrain_growth=4.0,
+                 train_sample=20000, kmeans_iterations=10):
+        """
+        تهيئة الفهرس
+
+        قبل أن يبلغ المعرض train_threshold يبقى الفهرس قائمة واحدة (بحث
+        دقيق). بعدها تُدرَّب مراكز العناقيد بـ k-means كروي ويُعاد التدريب
+        كلما تضاعف الحجم بمعامل retrain_growth.
+
+        Args:
+            dim: طول التشفير
+            n_probe: عدد العناقيد التي تُفحص في كل بحث
+            train_threshold: حجم المعرض الذي يبدأ عنده التجميع
+            retrain_growth: معامل النمو الذي يُعاد عنده التدريب
+            train_sample: أقصى عدد من التشفيرات المستخدمة في التدريب
+            kmeans_iterations: عدد تكرارات k-means
+        """
+        self.dim = dim
+        self.n_probe = n_probe
+        self.train_threshold = train_threshold
+        self.retrain_growth = retrain_growth
+        self.train_sample = train_sample
+        self.kmeans_iterations = kmeans_iterations
+        self._centroids = None
+        self._trained_size = 0
+        self._lists = [_InvertedList(dim)]
+        self._where = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._where)
+
+    @property
+    def n_lists(self):
+        return len(self._lists)
+
+    @property
+    def centroids(self):
+        """مراكز العناقيد المطبّعة أو None قبل التدريب"""
+        return self._centroids
+
+    def build(self, student_ids, vectors):
+        """
+        بناء الفهرس من المعرض كاملًا
+
+        Args:
+            student_ids: معرفات الطلاب
+            vectors: مصفوفة التشفيرات المطبّعة بنفس الترتيب
+        """
+        with self._lock:
+            self._centroids = None
+            self._trained_size = 0
+            student_ids = list(student_ids)
+            inverted = _InvertedList(self.dim, capacity=max(16, len(student_ids)))
+            inverted.vectors[:len(student_ids)] = vectors
+            inverted.ids = student_ids
+            self._lists = [inverted]
+            self._where = {student_id: (0, position) for position, student_id in enumerate(student_ids)}
+            if len(self._where) >= self.train_threshold:
+                self._train()
+
+    def add(self, student_id, vector):
+        """
+        إضافة تشفير مطبّع أو استبداله (إدراج تزايدي عند تسجيل وجه)
+
+        Args:
+            student_id: معرف الطالب
+            vector: التشفير المطبّع
+        """
+        with self._lock:
+            if student_id in self._where:
+                self._remove(student_id)
+            list_index = self._assign(vector.unsqueeze(0))[0].item() if self._centroids is not None else 0
+            position = self._lists[list_index].append(student_id, vector)
+            self._where[student_id] = (list_index, position)
+
+            if self._centroids is None:
+                if len(self._where) >= self.train_threshold:
+                    self._train()
+            elif len(self._where) >= self._trained_size * self.retrain_growth:
+                self._train()
+
+    def search(self, query, k=5):
+        """
+        البحث عن أقرب k تشفيرات
+
+        Args:
+            query: التشفير المطبّع للوجه المدخل
+            k: عدد المرشحين
+
+        Returns:
+            results: قائمة (معرف الطالب، تشابه الجيب تمام) مرتبة تنازليًا
+        """
+        with self._lock:
+            if self._centroids is None:
+                probed = self._lists
+            else:
+                n_probe = min(self.n_probe, len(self._lists))
+                probe = torch.topk(self._centroids @ query, n_probe).indices.tolist()
+                probed = [self._lists[i] for i in probe]
+
+            probed = [inverted for inverted in probed if len(inverted)]
+            if not probed:
+                return []
+            ids = [student_id for inverted in probed for student_id in inverted.ids]
+            candidates = torch.cat([inverted.matrix for inverted in probed])
+
+        scores = candidates @ query
+        top = torch.topk(scores, min(k, len(ids)))
+        return [(ids[i], score) for score, i in zip(top.values.tolist(), top.indices.tolist())]
+
+    def _assign(self, vectors):
+        """أقرب مركز عنقود لكل تشفير"""
+        return torch.argmax(vectors @ self._centroids.t(), dim=1)
+
+    def _remove(self, student_id):
+        list_index, position = self._where.pop(student_id)
+        moved = self._lists[list_index].remove(position)
+        if moved is not None:
+            self._where[moved] = (list_index, position)
+
+    def _train(self):
+        """تدريب مراكز العناقيد بـ k-means كروي ثم إعادة توزيع القوائم"""
+        ids = [student_id for inverted in self._lists for student_id in inverted.ids]
+        vectors = torch.cat([inverted.matrix for inverted in self._lists])
+        n_lists = max(1, int(math.sqrt(len(ids))))
+
+        generator = torch.Generator().manual_seed(0)
+        sample = vectors
+        if len(ids) > self.train_sample:
+            sample = vectors[torch.randperm(len(ids), generator=generator)[:self.train_sample]]
+
+        centroids = sample[torch.randperm(sample.shape[0], generator=generator)[:n_lists]].clone()
+        for _ in range(self.kmeans_iterations):
+            assignment = torch.argmax(sample @ centroids.t(), dim=1)
+            sums = torch.zeros_like(centroids).index_add_(0, assignment, sample)
+            counts = torch.bincount(assignment, minlength=n_lists)
+            # العناقيد الفارغة تحتفظ بمركزها السابق
+            sums[counts == 0] = centroids[counts == 0]
+            centroids = F.normalize(sums, p=2, dim=1)
+
+        self._centroids = centroids
+        self._trained_size = len(ids)
+        assignment = self._assign(vectors)
+        order = torch.argsort(assignment, stable=True)
+        counts = torch.bincount(assignment, minlength=n_lists).tolist()
+        self._lists = []
+        self._where = {}
+        start = 0
+        for list_index, count in enumerate(counts):
+            rows = order[start:start + count]
+            start += count
+            inverted = _InvertedList(self.dim, capacity=max(16, count))
+            inverted.vectors[:count] = vectors[rows]
+            inverted.ids = [ids[row] for row in rows.tolist()]
+            for position, student_id in enumerate(inverted.ids):
+                self._where[student_id] = (list_index, position)
+            self._lists.append(inverted)
@@ -0,0 +1,173 @@
+"""
+مخزن قصاصات الوجوه المحاذاة (160x160) المستخدمة عند التسجيل، لإعادة حساب
+التشفيرات بنموذج جديد دون أن يعيد الطلاب التسجيل
+
+الملف face_crops.bin سجل إلحاق فقط؛ كل سجل يحمل مفتاح القالب وقصاصاته
+بصيغة uint8 (ربع حجم float32) ثم CRC32. السجل الأحدث لنفس المفتاح يلغي ما قبله.
+القصاصات مستقلة عن النموذج فيبقى الملف في مجلد البيانات الرئيسي لكل الإصدارات.
+"""
+
+import logging
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+CROPS_FILE = 'face_crops.bin'
+FACE_SIZE = 160
+CROP_BYTES = 3 * FACE_SIZE * FACE_SIZE
+
+# طول المفتاح ثم المفتاح ثم عدد القصاصات ثم البايتات ثم CRC32 للسجل كاملًا
+RECORD_KEY_LENGTH = struct.Struct('<H')
+RECORD_COUNT = struct.Struct('<H')
+RECORD_CRC = struct.Struct('<I')
+
+
+def crops_to_uint8(faces):
+    """
+    تحويل قصاصات MTCNN المطبّعة ((x - 127.5) / 128) إلى بكسلات uint8
+
+    Args:
+        faces: قصاصة (3 x 160 x 160) أو عدة قصاصات (N x 3 x 160 x 160)
+
+    Returns:
+        pixels: مصفوفة numpy uint8 (N x 3 x 160 x 160)
+    """
+    faces = faces.detach().float().reshape(-1, 3, FACE_SIZE, FACE_SIZE)
+    return (faces * 128.0 + 127.5).round().clamp(0, 255).to(torch.uint8).numpy()
+
+
+def crops_from_uint8(pixels):
+    """بكسلات uint8 إلى قصاصات مطبّعة كما يُخرجها MTCNN (post_process)"""
+    return (torch.from_numpy(np.asarray(pixels, dtype=np.float32)) - 127.5) / 128.0
+
+
+class CropStore:
+    def __init__(self, directory, read_only=False):
+        """
+        تهيئة المخزن
+
+        Args:
+            directory: مجلد البيانات
+            read_only: لا يُقتطع الملف عند سجل تالف؛ لعملية أخرى غير الخادم
+                (face_reembed.py) قد ترى سجلًا ما زال الخادم يكتبه
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, CROPS_FILE)
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, key, faces):
+        """
+        حفظ قصاصات قالب (قصاصة واحدة، أو عدة لقطات سُجل متوسط تشفيراتها)
+
+        Args:
+            key: مفتاح القالب كما في مخزن التشفيرات
+            faces: قصاصة أو قصاصات مطبّعة
+        """
+        pixels = crops_to_uint8(faces)
+        key_bytes = str(key).encode('utf-8')
+        body = (RECORD_KEY_LENGTH.pack(len(key_bytes)) + key_bytes +
+                RECORD_COUNT.pack(pixels.shape[0]) + pixels.tobytes())
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                start = f.seek(0, os.SEEK_END)
+                try:
+                    f.write(body + RECORD_CRC.pack(zlib.crc32(body)))
+                    f.flush()
+                    os.fsync(f.fileno())
+                except OSError:
+                    # سجل ناقص يحجب كل ما يُلحق بعده عن index
+                    f.truncate(start)
+                    raise
+
+    def index(self):
+        """
+        أحدث سجل لكل مفتاح
+
+        تُقرأ السجلات واحدًا تلو الآخر (ترويسة ثم بكسلات للتحقق من CRC) دون
+        تحميل الملف كاملًا. السجل غير المكتمل أو التالف يُقتطع من الملف مع
+        كل ما بعده (إلا في وضع القراءة فقط) حتى لا تُلحق السجلات الجديدة
+        بعد بايتات لا يتجاوزها الفهرس.
+
+        Returns:
+            entries: قاموس {مفتاح القالب: (موضع البكسلات في الملف، عدد القصاصات)}
+        """
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+
+        with self._lock:
+            # ما قبل هذا الحجم سجلات كاملة كتبها هذا المخزن (الإلحاق تحت القفل)
+            size = os.path.getsize(self.path)
+
+        offset = 0
+        with open(self.path, 'rb') as f:
+            while offset < size:
+                record = self._read_record(f, offset, size)
+                if record is None:
+                    break
+                key, count, end = record
+                entries[key] = (end - count * CROP_BYTES, count)
+                offset = end + RECORD_CRC.size
+
+        if offset < size:
+            if self.read_only:
+                logger.warning(f"تجاهل {size - offset} بايت غير مكتملة أو تالفة في {self.path}")
+            else:
+                with self._lock:
+                    logger.warning(f"اقتطاع {os.path.getsize(self.path) - offset} بايت "
+                                   f"غير مكتملة أو تالفة من {self.path}")
+                    with open(self.path, 'r+b') as f:
+                        f.truncate(offset)
+        return entries
+
+    def _read_record(self, f, offset, size):
+        """
+        قراءة سجل واحد يبدأ عند offset والتحقق من CRC
+
+        Returns:
+            (المفتاح، عدد القصاصات، نهاية البكسلات) أو None لسجل ناقص أو تالف
+        """
+        f.seek(offset)
+        header = f.read(RECORD_KEY_LENGTH.size)
+        if len(header) < RECORD_KEY_LENGTH.size:
+            return None
+        (key_length,) = RECORD_KEY_LENGTH.unpack(header)
+        key_bytes = f.read(key_length)
+        count_bytes = f.read(RECORD_COUNT.size)
+        if len(key_bytes) < key_length or len(count_bytes) < RECORD_COUNT.size:
+            return None
+        (count,) = RECORD_COUNT.unpack(count_bytes)
+        end = offset + RECORD_KEY_LENGTH.size + key_length + RECORD_COUNT.size + count * CROP_BYTES
+        if end + RECORD_CRC.size > size:
+            return None
+
+        crc = zlib.crc32(header + key_bytes + count_bytes)
+        for _ in range(count):
+            crc = zlib.crc32(f.read(CROP_BYTES), crc)
+        (expected,) = RECORD_CRC.unpack(f.read(RECORD_CRC.size))
+        if crc != expected:
+            return None
+        try:
+            return key_bytes.decode('utf-8'), count, end
+        except UnicodeDecodeError:
+            return None
+
+    def read(self, entry):
+        """
+        قراءة قصاصات سجل من index
+
+        Returns:
+            faces: قصاصات مطبّعة (N x 3 x 160 x 160)
+        """
+        offset, count = entry
+        pixels = np.memmap(self.path, dtype=np.uint8, mode='r', offset=offset,
+                           shape=(count, 3, FACE_SIZE, FACE_SIZE))
+        return crops_from_uint8(pixels)
@@ -0,0 +1,208 @@
+"""
+كشف الوجوه المسجلة لأكثر من حساب: كل أزواج الطلاب التي يتجاوز تشابهها
+العتبة في المعرض كاملًا (مثل تسجيل وجه صديق تحت حساب ثانٍ)
+
+    python face_duplicates.py --threshold 0.8 --output reports/duplicates.json
+    python face_duplicates.py --ivf --n-probe 3          # تصفية تقريبية أسرع
+
+تُقارن التشفيرات المطبّعة بضرب مصفوفات على كتل (block_size x block_size)
+للمثلث العلوي فقط، فتبقى الذاكرة محدودة بحجم الكتلة مهما كبر المعرض. مع
+--ivf يُقسم المعرض إلى عناقيد ويُسند كل تشفير إلى أقرب n_probe عناقيد، ولا
+تُقارن إلا التشفيرات المشتركة في عنقود (قد تفوت أزواج نادرة على حدود العناقيد).
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import torch
+
+from face_ann_index import IVFIndex
+from face_embedding_store import EmbeddingStore, active_gallery_directory
+from face_gallery import TemplateBank
+
+logger = logging.getLogger(__name__)
+
+
+def blocked_pairs(vectors, threshold, block_size=4096, groups=None):
+    """
+    كل الأزواج (a < b) التي يبلغ تشابه جيب التمام بينها العتبة
+
+    Args:
+        vectors: تشفيرات مطبّعة (N x dim)
+        threshold: أقل تشابه جيب تمام
+        block_size: عدد الصفوف في كل كتلة
+        groups: رقم مجموعة لكل صف (N)؛ أزواج المجموعة الواحدة (قوالب نفس
+            الطالب) تُستبعد
+
+    Returns:
+        rows_a, rows_b, cosines: ثلاث مصفوفات بطول عدد الأزواج
+    """
+    count = vectors.shape[0]
+    found_a, found_b, found_cosines = [], [], []
+    for start in range(0, count, block_size):
+        block = vectors[start:start + block_size]
+        for other in range(start, count, block_size):
+            scores = block @ vectors[other:other + block_size].t()
+            if other == start:
+                # المثلث العلوي فقط داخل الكتلة القطرية
+                scores = scores.masked_fill(torch.ones_like(scores, dtype=torch.bool).tril(), -2.0)
+            hits = torch.nonzero(scores >= threshold)
+            if hits.shape[0] == 0:
+                continue
+            rows_a = hits[:, 0] + start
+            rows_b = hits[:, 1] + other
+            cosines = scores[hits[:, 0], hits[:, 1]]
+            if groups is not None:
+                keep = groups[rows_a] != groups[rows_b]
+                rows_a, rows_b, cosines = rows_a[keep], rows_b[keep], cosines[keep]
+            found_a.append(rows_a)
+            found_b.append(rows_b)
+            found_cosines.append(cosines)
+
+    if not found_a:
+        empty = torch.zeros(0, dtype=torch.long)
+        return empty, empty, torch.zeros(0)
+    return torch.cat(found_a), torch.cat(found_b), torch.cat(found_cosines)
+
+
+def ivf_pairs(vectors, threshold, n_probe=3, block_size=4096, groups=None):
+    """
+    مثل blocked_pairs لكن داخل عناقيد IVF فقط (تقريبي)
+
+    Args:
+        n_probe: عدد العناقيد التي يُسند إليها كل تشفير
+
+    Returns:
+        rows_a, rows_b, cosines: ثلاث مصفوفات بطول عدد الأزواج
+    """
+    index = IVFIndex(dim=vectors.shape[1], train_threshold=1)
+    index.build(range(vectors.shape[0]), vectors)
+    n_lists = index.n_lists
+    assignment = torch.topk(vectors @ index.centroids.t(), min(n_probe, n_lists), dim=1).indices
+    del index
+
+    pairs = {}
+    for cluster in range(n_lists):
+        members = torch.nonzero((assignment == cluster).any(dim=1)).flatten()
+        if members.shape[0] < 2:
+            continue
+        member_groups = groups[members] if groups is not None else None
+        rows_a, rows_b, cosines = blocked_pairs(vectors[members], threshold, block_size, member_groups)
+        for a, b, cosine in zip(members[rows_a].tolist(), members[rows_b].tolist(), cosines.tolist()):
+            pairs[(min(a, b), max(a, b))] = cosine
+
+    if not pairs:
+        empty = torch.zeros(0, dtype=torch.long)
+        return empty, empty, torch.zeros(0)
+    rows = torch.tensor(list(pairs.keys()))
+    return rows[:, 0], rows[:, 1], torch.tensor(list(pairs.values()))
+
+
+def load_rows(data_dir, per_template=False, max_templates=5):
+    """
+    صفوف المقارنة من المعرض النشط
+
+    Args:
+        data_dir: مجلد البيانات
+        per_template: صف لكل قالب بدل مركز كل طالب (يكشف قالبًا غريبًا
+            واحدًا بين قوالب الطالب، بتكلفة أعلى)
+        max_templates: أقصى عدد قوالب للطالب (FACE_MAX_TEMPLATES في الخادم)
+
+    Returns:
+        student_ids: معرف الطالب لكل صف
+        vectors: التشفيرات المطبّعة
+    """
+    bank = TemplateBank(max_templates=max_templates)
+    bank.load(EmbeddingStore(active_gallery_directory(data_dir)).load())
+    if not per_template:
+        return bank.ids, bank.centroids.clone()
+
+    student_ids, vectors = [], []
+    for student_id in bank.ids:
+        templates = bank.templates(student_id)
+        student_ids.extend([student_id] * templates.shape[0])
+        vectors.append(templates)
+    return student_ids, torch.cat(vectors) if vectors else torch.zeros(0, bank.dim)
+
+
+def find_duplicates(student_ids, vectors, threshold, block_size=4096, use_ivf=False, n_probe=3):
+    """
+    أزواج الطلاب المشتبه بها مرتبة تنازليًا بالتشابه
+
+    Args:
+        student_ids: معرف الطالب لكل صف
+        vectors: التشفيرات المطبّعة
+        threshold: أقل تشابه (0-1) بنفس مقياس عتبة التحقق في الخادم
+
+    Returns:
+        pairs: قائمة {'student_a', 'student_b', 'similarity'}، زوج واحد لكل
+            طالبين بأعلى تشابه بين قوالبهما
+    """
+    numbers = {}
+    groups = torch.tensor([numbers.setdefault(student_id, len(numbers)) for student_id in student_ids],
+                          dtype=torch.long)
+    cosine_threshold = threshold * 2 - 1
+    if use_ivf:
+        rows_a, rows_b, cosines = ivf_pairs(vectors, cosine_threshold, n_probe, block_size, groups)
+    else:
+        rows_a, rows_b, cosines = blocked_pairs(vectors, cosine_threshold, block_size, groups)
+
+    best = {}
+    for a, b, cosine in zip(rows_a.tolist(), rows_b.tolist(), cosines.tolist()):
+        pair = tuple(sorted((student_ids[a], student_ids[b])))
+        similarity = (cosine + 1) / 2
+        if similarity > best.get(pair, -1.0):
+            best[pair] = similarity
+    return [
+        {'student_a': pair[0], 'student_b': pair[1], 'similarity': similarity}
+        for pair, similarity in sorted(best.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='كشف الوجوه المسجلة لأكثر من حساب')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--threshold', type=float, default=0.8,
+                        help='أقل تشابه (0-1)؛ الافتراضي عتبة التحقق في الخادم')
+    parser.add_argument('--block-size', type=int, default=4096)
+    parser.add_argument('--templates', action='store_true', help='مقارنة كل القوالب بدل مراكز الطلاب')
+    parser.add_argument('--max-templates', type=int, default=int(os.environ.get('FACE_MAX_TEMPLATES', 5)))
+    parser.add_argument('--ivf', action='store_true', help='تصفية تقريبية بعناقيد IVF')
+    parser.add_argument('--n-probe', type=int, default=3)
+    parser.add_argument('--output', default=os.path.join('reports', 'duplicates.json'))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    student_ids, vectors = load_rows(args.data_dir, args.templates, args.max_templates)
+    logger.info(f"تحميل {vectors.shape[0]} تشفير لـ {len(set(student_ids))} طالب")
+
+    pairs = find_duplicates(student_ids, vectors, args.threshold, args.block_size, args.ivf, args.n_probe)
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'gallery': active_gallery_directory(args.data_dir),
+            'rows': vectors.shape[0],
+            'students': len(set(student_ids)),
+            'threshold': args.threshold,
+            'per_template': args.templates,
+            'ivf': args.ivf,
+            'n_probe': args.n_probe if args.ivf else None,
+            'seconds': round(elapsed, 2)
+        },
+        'pairs': pairs
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for pair in pairs[:20]:
+        print(f"{pair['student_a']:>12} {pair['student_b']:>12} {pair['similarity']:.4f}")
+    logger.info(f"{len(pairs)} زوج مشتبه به في {elapsed:.1f} ثانية؛ التقرير في {args.output}")
@@ -0,0 +1,388 @@
+"""
+مخزن ثنائي لتشفيرات الوجوه: لقطة float32 قابلة للربط بالذاكرة وسجل إلحاق فقط
+
+الملفات داخل مجلد المخزن:
+    face_embeddings.<N>.bin لقطة: ترويسة + فهرس المعرفات + مصفوفة float32 (صف لكل طالب)
+    face_embeddings.current اسم اللقطة الحالية (face_embeddings.bin إن لم يوجد)
+    face_embeddings.log   سجل إلحاق للتشفيرات الجديدة أو المحدثة منذ آخر ضغط
+    face_embeddings.model إصدار النموذج الذي أنتج تشفيرات المعرض
+
+إصدارات المعرض المعاد تشفيرها بنموذج جديد (face_reembed.py) تُبنى في
+galleries/<الإصدار>/ بجانب المعرض الحالي مع نسخة من النموذج (ونسخته المكممة
+إن وُجدت)، ويحدد الملف
+face_gallery.current في مجلد البيانات الإصدار النشط (يُستبدل ذريًا).
+
+التشغيل من سطر الأوامر:
+    python face_embedding_store.py import data/face_embeddings.json
+    python face_embedding_store.py compact
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = 'face_embeddings.bin'
+# كل ضغط يكتب لقطة باسم جيل جديد ثم يستبدل المؤشر ذريًا، فلا يُكتب فوق ملف
+# ما زال مربوطًا بالذاكرة (يفشل على Windows)
+SNAPSHOT_POINTER_FILE = 'face_embeddings.current'
+SNAPSHOT_GENERATION_FILE = 'face_embeddings.{}.bin'
+LOG_FILE = 'face_embeddings.log'
+ROTATED_LOG_FILE = 'face_embeddings.log.compacting'
+MODEL_VERSION_FILE = 'face_embeddings.model'
+GALLERY_POINTER_FILE = 'face_gallery.current'
+GALLERY_VERSIONS_DIR = 'galleries'
+GALLERY_MODEL_FILE = 'model.pt'
+GALLERY_QUANTIZED_MODEL_FILE = 'model.int8.pt'
+
+SNAPSHOT_MAGIC = b'FEMB'
+SNAPSHOT_VERSION = 1
+# magic, version, dim, count, طول فهرس المعرفات
+SNAPSHOT_HEADER = struct.Struct('<4sIIII')
+# بداية المصفوفة محاذاة على 64 بايت حتى تُربط بالذاكرة مباشرة
+MATRIX_ALIGNMENT = 64
+
+# طول المعرف ثم المعرف ثم التشفير ثم CRC32 للسجل كاملًا
+LOG_ID_LENGTH = struct.Struct('<H')
+LOG_CRC = struct.Struct('<I')
+
+
+def active_gallery_directory(data_dir):
+    """
+    مجلد المعرض النشط
+
+    Args:
+        data_dir: مجلد البيانات الرئيسي
+
+    Returns:
+        directory: المجلد الذي يشير إليه face_gallery.current، أو data_dir نفسه
+    """
+    pointer_path = os.path.join(data_dir, GALLERY_POINTER_FILE)
+    if not os.path.exists(pointer_path):
+        return data_dir
+    with open(pointer_path, 'r') as f:
+        relative = f.read().strip()
+    return os.path.join(data_dir, relative) if relative else data_dir
+
+
+def activate_gallery(data_dir, directory):
+    """
+    جعل مجلد معرض مكتمل هو النشط باستبدال ملف المؤشر ذريًا
+
+    Args:
+        data_dir: مجلد البيانات الرئيسي
+        directory: مجلد إصدار المعرض الجديد
+    """
+    pointer_path = os.path.join(data_dir, GALLERY_POINTER_FILE)
+    tmp_path = pointer_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(os.path.relpath(directory, data_dir))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pointer_path)
+
+
+class EmbeddingStore:
+    def __init__(self, directory, dim=512, compact_every=1000):
+        """
+        تهيئة المخزن
+
+        Args:
+            directory: مجلد ملفات المخزن
+            dim: طول التشفير
+            compact_every: عدد سجلات الإلحاق التي يُقترح بعدها الضغط
+        """
+        self.directory = directory
+        self.dim = dim
+        self.compact_every = compact_every
+        self.snapshot_pointer_path = os.path.join(directory, SNAPSHOT_POINTER_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.rotated_log_path = os.path.join(directory, ROTATED_LOG_FILE)
+        self.model_version_path = os.path.join(directory, MODEL_VERSION_FILE)
+        self.pending_records = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self):
+        """هل يحتوي المجلد على مخزن سابق"""
+        return any(os.path.exists(path) for path in
+                   (self.snapshot_path, self.log_path, self.rotated_log_path))
+
+    @property
+    def snapshot_path(self):
+        """مسار اللقطة الحالية كما يحدده ملف المؤشر"""
+        if not os.path.exists(self.snapshot_pointer_path):
+            return os.path.join(self.directory, SNAPSHOT_FILE)
+        with open(self.snapshot_pointer_path, 'r') as f:
+            return os.path.join(self.directory, f.read().strip())
+
+    def model_version(self):
+        """إصدار النموذج المسجل للمعرض أو None إذا لم يُسجل بعد"""
+        if not os.path.exists(self.model_version_path):
+            return None
+        with open(self.model_version_path, 'r') as f:
+            return f.read().strip() or None
+
+    def set_model_version(self, model_version):
+        """
+        تسجيل إصدار النموذج الذي أنتج تشفيرات المعرض
+
+        Args:
+            model_version: نص الإصدار (FACE_MODEL_VERSION)
+        """
+        tmp_path = self.model_version_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(model_version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.model_version_path)
+
+    def load(self):
+        """
+        تحميل كل التشفيرات: اللقطة عبر الربط بالذاكرة ثم إعادة تطبيق السجلات
+
+        Returns:
+            embeddings: قاموس {معرف الطالب: تشفير}؛ تشفيرات اللقطة عروض
+                على الملف المربوط بالذاكرة دون نسخ
+        """
+        embeddings = {}
+        ids, matrix = self._load_snapshot()
+        for row, student_id in enumerate(ids):
+            embeddings[student_id] = matrix[row]
+
+        # السجل المدوّر موجود فقط إذا انقطع ضغط سابق قبل اكتماله
+        replayed = self._replay(self.rotated_log_path, embeddings)
+        self.pending_records = self._replay(self.log_path, embeddings) + replayed
+        return embeddings
+
+    def append(self, student_id, embedding):
+        """
+        إلحاق تشفير جديد أو محدث بالسجل
+
+        يجب تحديث حالة الذاكرة التي تُمرر لاحقًا إلى compact قبل استدعاء
+        هذه الدالة حتى لا يضيع السجل إذا تزامن مع الضغط.
+
+        Args:
+            student_id: معرف الطالب
+            embedding: تشفير الوجه
+        """
+        record = self._encode_record(student_id, embedding)
+        with self._lock:
+            with open(self.log_path, 'ab') as f:
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending_records += 1
+
+    def needs_compaction(self):
+        """هل تجاوز السجل حد الضغط ولا يوجد ضغط جارٍ"""
+        return self.pending_records >= self.compact_every and not self._compacting
+
+    def compact(self, embeddings):
+        """
+        كتابة لقطة جديدة من حالة الذاكرة واستبدال السجل
+
+        يُدوَّر السجل ويُؤخذ نسخة من القاموس تحت القفل، ثم تُكتب اللقطة
+        خارجه وتُستبدل ذريًا، فلا يتوقف الإلحاق أثناء الضغط.
+
+        Args:
+            embeddings: قاموس {معرف الطالب: تشفير} يمثل الحالة الحالية
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            if os.path.exists(self.log_path) and not os.path.exists(self.rotated_log_path):
+                os.replace(self.log_path, self.rotated_log_path)
+            items = list(embeddings.items())
+            self.pending_records = 0
+
+        try:
+            ids = [student_id for student_id, _ in items]
+            if items:
+                matrix = torch.stack([embedding.float() for _, embedding in items]).numpy()
+            else:
+                matrix = np.zeros((0, self.dim), dtype=np.float32)
+            self._write_snapshot(ids, matrix)
+            if os.path.exists(self.rotated_log_path):
+                os.remove(self.rotated_log_path)
+            logger.info(f"تم ضغط مخزن التشفيرات إلى {len(ids)} تشفير في {self.snapshot_path}")
+        finally:
+            self._compacting = False
+
+    def import_json(self, json_path):
+        """
+        استيراد ملف face_embeddings.json القديم إلى لقطة ثنائية (مرة واحدة)
+
+        Args:
+            json_path: مسار ملف JSON
+
+        Returns:
+            count: عدد التشفيرات المستوردة
+        """
+        with open(json_path, 'r') as f:
+            data = json.load(f)
+
+        embeddings = {student_id: torch.tensor(embedding_list, dtype=torch.float32)
+                      for student_id, embedding_list in data.items()}
+        self.compact(embeddings)
+        logger.info(f"تم استيراد {len(embeddings)} تشفير وجه من {json_path}")
+        return len(embeddings)
+
+    def _load_snapshot(self):
+        """قراءة فهرس المعرفات وربط المصفوفة بالذاكرة"""
+        path = self.snapshot_path
+        if not os.path.exists(path):
+            return [], torch.zeros(0, self.dim)
+
+        with open(path, 'rb') as f:
+            magic, version, dim, count, ids_length = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f"ملف لقطة غير صالح: {path}")
+            if dim != self.dim:
+                raise ValueError(f"طول التشفير في اللقطة {dim} لا يطابق {self.dim}")
+            ids = json.loads(f.read(ids_length).decode('utf-8'))
+
+        if count == 0:
+            return ids, torch.zeros(0, self.dim)
+
+        # وضع النسخ عند الكتابة: الصفحات تُقرأ عند الحاجة ولا يُعدل الملف أبدًا
+        matrix = np.memmap(path, dtype=np.float32, mode='c',
+                           offset=self._matrix_offset(ids_length), shape=(count, dim))
+        return ids, torch.from_numpy(matrix)
+
+    def _write_snapshot(self, ids, matrix):
+        """
+        كتابة اللقطة في ملف جيل جديد ثم تحويل المؤشر إليه ذريًا
+
+        اللقطة السابقة قد تكون مربوطة بالذاكرة (تشفيرات load عروض عليها)،
+        فلا يُكتب فوقها؛ تُحذف بعد التحويل، وعلى Windows تبقى حتى يُحرر
+        ربطها فتُحذف في ضغط لاحق.
+        """
+        previous = os.path.basename(self.snapshot_path)
+        name = SNAPSHOT_GENERATION_FILE.format(self._generation(previous) + 1)
+        path = os.path.join(self.directory, name)
+
+        ids_bytes = json.dumps(ids).encode('utf-8')
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.dim, len(ids), len(ids_bytes))
+        padding = self._matrix_offset(len(ids_bytes)) - len(header) - len(ids_bytes)
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(ids_bytes)
+            f.write(b'\0' * padding)
+            f.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        pointer_tmp_path = self.snapshot_pointer_path + '.tmp'
+        with open(pointer_tmp_path, 'w') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp_path, self.snapshot_pointer_path)
+        self._remove_stale_snapshots(name)
+
+    def _generation(self, name):
+        """رقم جيل اللقطة من اسمها (0 لـ face_embeddings.bin)"""
+        prefix, suffix = SNAPSHOT_GENERATION_FILE.split('{}')
+        if name.startswith(prefix) and name.endswith(suffix):
+            number = name[len(prefix):len(name) - len(suffix)]
+            if number.isdigit():
+                return int(number)
+        return 0
+
+    def _remove_stale_snapshots(self, current):
+        """حذف اللقطات السابقة (ولقطات جيل لم يكتمل تحويل المؤشر إليه)"""
+        prefix, suffix = SNAPSHOT_GENERATION_FILE.split('{}')
+        for name in os.listdir(self.directory):
+            stale = name == SNAPSHOT_FILE or (name.startswith(prefix) and name.endswith(suffix)
+                                              and self._generation(name) > 0)
+            if not stale or name == current:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as e:
+                # Windows: ما زالت مربوطة بالذاكرة؛ تُحذف في الضغط التالي
+                logger.debug(f"تعذر حذف اللقطة السابقة {name}: {e}")
+
+    def _matrix_offset(self, ids_length):
+        """موضع بداية المصفوفة بعد الترويسة وفهرس المعرفات"""
+        end = SNAPSHOT_HEADER.size + ids_length
+        return (end + MATRIX_ALIGNMENT - 1) // MATRIX_ALIGNMENT * MATRIX_ALIGNMENT
+
+    def _encode_record(self, student_id, embedding):
+        """ترميز سجل إلحاق واحد"""
+        id_bytes = str(student_id).encode('utf-8')
+        vector = embedding.detach().reshape(-1).float().numpy()
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"طول التشفير {vector.shape[0]} لا يطابق {self.dim}")
+        body = LOG_ID_LENGTH.pack(len(id_bytes)) + id_bytes + vector.tobytes()
+        return body + LOG_CRC.pack(zlib.crc32(body))
+
+    def _replay(self, path, embeddings):
+        """
+        إعادة تطبيق سجل على القاموس
+
+        السجل الأخير غير المكتمل (كتابة منقطعة) يُتجاهل ويُقتطع من الملف.
+
+        Returns:
+            count: عدد السجلات الصالحة
+        """
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        vector_size = self.dim * 4
+        offset = 0
+        count = 0
+        while offset + LOG_ID_LENGTH.size <= len(data):
+            (id_length,) = LOG_ID_LENGTH.unpack_from(data, offset)
+            end = offset + LOG_ID_LENGTH.size + id_length + vector_size
+            if end + LOG_CRC.size > len(data):
+                break
+            (crc,) = LOG_CRC.unpack_from(data, end)
+            if crc != zlib.crc32(data[offset:end]):
+                break
+            id_start = offset + LOG_ID_LENGTH.size
+            student_id = data[id_start:id_start + id_length].decode('utf-8')
+            vector = np.frombuffer(data, dtype=np.float32, count=self.dim, offset=id_start + id_length)
+            embeddings[student_id] = torch.from_numpy(vector.copy())
+            offset = end + LOG_CRC.size
+            count += 1
+
+        if offset < len(data):
+            logger.warning(f"تجاهل {len(data) - offset} بايت غير مكتملة في نهاية {path}")
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+
+        return count
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='إدارة مخزن تشفيرات الوجوه')
+    parser.add_argument('command', choices=['import', 'compact'])
+    parser.add_argument('json_path', nargs='?', default=os.path.join('data', 'face_embeddings.json'))
+    parser.add_argument('--data-dir', default='data')
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.data_dir)
+    if args.command == 'import':
+        store.import_json(args.json_path)
+    else:
+        store.compact(store.load())
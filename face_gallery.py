@@ -0,0 +1,541 @@
+"""
+معرض تشفيرات الوجوه المطبّعة مسبقًا مع مجموع تراكمي لحساب هامش الأمان،
+وبنك قوالب متعددة لكل طالب مع مركز مخزن، ومجموعات مقارنة لكل مقرر
+"""
+
+import threading
+
+import torch
+import torch.nn.functional as F
+
+# مفتاح القالب في المخزن: معرف الطالب ثم الفاصل ثم رقم القالب
+TEMPLATE_KEY_SEPARATOR = '#'
+EVICTION_POLICIES = ('oldest', 'least_used')
+
+
+def normalize_embedding(embedding):
+    """
+    تطبيع تشفير واحد بنفس طريقة calculate_similarity
+
+    Args:
+        embedding: تشفير بطول 512
+
+    Returns:
+        unit: التشفير بطول وحدة
+    """
+    return F.normalize(embedding.reshape(1, -1).float(), p=2, dim=1)[0]
+
+
+def match_faces_to_roster(probes, roster, threshold):
+    """
+    مطابقة وجوه صورة جماعية مع قائمة طلاب المقرر دفعة واحدة
+
+    تُحسب مصفوفة التشابه كاملة بضرب مصفوفتين، ثم يُعيَّن لكل وجه طالب
+    واحد على الأكثر بترتيب تنازلي للتشابه (لا يُعيَّن الطالب لوجهين).
+
+    Args:
+        probes: تشفيرات الوجوه المكتشفة المطبّعة (F x 512)
+        roster: تشفيرات طلاب المقرر المطبّعة (R x 512)
+        threshold: أقل تشابه (0-1) لقبول المطابقة
+
+    Returns:
+        matches: قائمة (رقم الوجه، رقم الطالب، التشابه)
+    """
+    if probes.shape[0] == 0 or roster.shape[0] == 0:
+        return []
+
+    # تحويل التشابه إلى نطاق 0-1
+    similarity = (probes @ roster.t() + 1) / 2
+    candidates = torch.nonzero(similarity >= threshold)
+    scores = similarity[candidates[:, 0], candidates[:, 1]]
+    order = torch.argsort(scores, descending=True)
+
+    matches = []
+    used_probes, used_students = set(), set()
+    for probe_index, student_index in candidates[order].tolist():
+        if probe_index in used_probes or student_index in used_students:
+            continue
+        used_probes.add(probe_index)
+        used_students.add(student_index)
+        matches.append((probe_index, student_index, similarity[probe_index, student_index].item()))
+    return matches
+
+
+def pairwise_similarity(embeddings):
+    """
+    مصفوفة التشابه (0-1) بين كل زوج من التشفيرات بضرب مصفوفتين
+
+    Args:
+        embeddings: تشفيرات غير مطبّعة (k x 512)
+
+    Returns:
+        similarity: مصفوفة k x k
+        minimum: أقل تشابه بين تشفيرين مختلفين (1.0 عند تشفير واحد)
+    """
+    units = F.normalize(embeddings.float(), p=2, dim=1)
+    similarity = (units @ units.t() + 1) / 2
+    if units.shape[0] < 2:
+        return similarity, 1.0
+    off_diagonal = ~torch.eye(units.shape[0], dtype=torch.bool)
+    return similarity, similarity[off_diagonal].min().item()
+
+
+class FaceGallery:
+    def __init__(self, dim=512, capacity=1024):
+        """
+        تهيئة معرض التشفيرات
+
+        Args:
+            dim: طول التشفير
+            capacity: السعة الابتدائية لمصفوفة التشفيرات
+        """
+        self.dim = dim
+        self._matrix = torch.zeros(capacity, dim)
+        self._ids = []
+        self._rows = {}
+        # مجموع التشفيرات المطبّعة بدقة مزدوجة حتى لا تتراكم أخطاء التقريب
+        self._sum = torch.zeros(dim, dtype=torch.float64)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, student_id):
+        return student_id in self._rows
+
+    @property
+    def ids(self):
+        """معرفات الطلاب بترتيب صفوف المصفوفة"""
+        return list(self._ids)
+
+    @property
+    def matrix(self):
+        """مصفوفة التشفيرات المطبّعة (صف لكل طالب)"""
+        return self._matrix[:len(self._ids)]
+
+    def row(self, student_id):
+        """التشفير المطبّع لطالب معين"""
+        return self._matrix[self._rows[student_id]]
+
+    def subset(self, student_ids):
+        """
+        التشفيرات المطبّعة لمجموعة من الطلاب (مثل طلاب مقرر واحد)
+
+        Args:
+            student_ids: معرفات الطلاب المطلوبة
+
+        Returns:
+            present_ids: المعرفات المسجلة فعلًا في المعرض
+            matrix: تشفيراتها المطبّعة بنفس الترتيب
+        """
+        with self._lock:
+            present_ids = [student_id for student_id in student_ids if student_id in self._rows]
+            rows = [self._rows[student_id] for student_id in present_ids]
+            return present_ids, self._matrix[rows]
+
+    def add(self, student_id, embedding):
+        """
+        إضافة تشفير طالب أو استبداله مع تحديث المجموع التراكمي
+
+        Args:
+            student_id: معرف الطالب
+            embedding: تشفير الوجه (غير مطبّع)
+        """
+        unit = normalize_embedding(embedding)
+        with self._lock:
+            row = self._rows.get(student_id)
+            if row is None:
+                row = len(self._ids)
+                if row == self._matrix.shape[0]:
+                    self._grow()
+                self._ids.append(student_id)
+                self._rows[student_id] = row
+            else:
+                # إزالة مساهمة التشفير القديم قبل الاستبدال
+                self._sum -= self._matrix[row].double()
+            self._matrix[row] = unit
+            self._sum += unit.double()
+
+    def add_many(self, student_ids, embeddings):
+        """
+        إضافة عدة تشفيرات دفعة واحدة بعملية تطبيع واحدة
+
+        Args:
+            student_ids: قائمة معرفات الطلاب
+            embeddings: مصفوفة التشفيرات (صف لكل معرف)
+        """
+        student_ids = list(student_ids)
+        if len(student_ids) == 0:
+            return
+        with self._lock:
+            if any(student_id in self._rows for student_id in student_ids) or \
+                    len(set(student_ids)) != len(student_ids):
+                for student_id, embedding in zip(student_ids, embeddings):
+                    self.add(student_id, embedding)
+                return
+
+            units = F.normalize(embeddings.reshape(len(student_ids), -1).float(), p=2, dim=1)
+            start = len(self._ids)
+            while start + len(student_ids) > self._matrix.shape[0]:
+                self._grow()
+            self._matrix[start:start + len(student_ids)] = units
+            for offset, student_id in enumerate(student_ids):
+                self._rows[student_id] = start + offset
+            self._ids.extend(student_ids)
+            self._sum += units.double().sum(dim=0)
+
+    def impostor_mean_similarity(self, embedding, student_id):
+        """
+        متوسط التشابه بين التشفير وجميع الطلاب الآخرين في المعرض
+
+        يساوي متوسط calculate_similarity على كل الطلاب الآخرين، لكنه يُحسب
+        بضرب نقطي واحد مع المجموع التراكمي بدل حلقة على المعرض كاملًا.
+
+        Args:
+            embedding: تشفير الوجه المدخل
+            student_id: معرف الطالب المُدّعى (يُستثنى من المتوسط)
+
+        Returns:
+            similarity: متوسط التشابه (0-1) أو None إذا لم يوجد طلاب آخرون
+        """
+        query = normalize_embedding(embedding).double()
+        with self._lock:
+            others_sum = self._sum
+            others_count = len(self._ids)
+            row = self._rows.get(student_id)
+            if row is not None:
+                others_sum = others_sum - self._matrix[row].double()
+                others_count -= 1
+            if others_count == 0:
+                return None
+            mean_cosine = torch.dot(query, others_sum).item() / others_count
+
+        # تحويل التشابه إلى نطاق 0-1
+        return (mean_cosine + 1) / 2
+
+    def _grow(self):
+        """مضاعفة سعة المصفوفة"""
+        grown = torch.zeros(self._matrix.shape[0] * 2, self.dim)
+        grown[:self._matrix.shape[0]] = self._matrix
+        self._matrix = grown
+
+
+def template_key(student_id, slot):
+    """مفتاح قالب الطالب في مخزن التشفيرات"""
+    return f'{student_id}{TEMPLATE_KEY_SEPARATOR}{slot}'
+
+
+def split_template_key(key):
+    """
+    تفكيك مفتاح القالب إلى (معرف الطالب، رقم القالب)
+
+    المفاتيح القديمة (تشفير واحد لكل طالب) تُعامل كقالب رقم 0.
+    """
+    student_id, separator, slot = key.rpartition(TEMPLATE_KEY_SEPARATOR)
+    if not separator or not slot.isdigit():
+        return key, 0
+    return student_id, int(slot)
+
+
+class TemplateBank:
+    def __init__(self, dim=512, max_templates=5, eviction='oldest', capacity=1024):
+        """
+        عدة قوالب لكل طالب (إضاءة مختلفة، نظارات...) مع مركز مخزن لكل طالب
+
+        قوالب الطالب صفوف متجاورة مطبّعة مسبقًا في مصفوفة واحدة
+        (طلاب x max_templates x dim)، فيُحسب تشابه الوجه مع كل قوالبه بضرب
+        واحد دون حلقة.
+
+        Args:
+            dim: طول التشفير
+            max_templates: أقصى عدد قوالب للطالب
+            eviction: سياسة الاستبدال عند الامتلاء: 'oldest' (الأقدم) أو
+                'least_used' (الأقل مطابقة، ثم الأقدم)
+            capacity: السعة الابتدائية بعدد الطلاب
+        """
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"سياسة استبدال غير معروفة: {eviction}")
+        self.dim = dim
+        self.max_templates = max_templates
+        self.eviction = eviction
+        self._templates = torch.zeros(capacity, max_templates, dim)
+        self._used = torch.zeros(capacity, max_templates, dtype=torch.bool)
+        self._added = torch.zeros(capacity, max_templates, dtype=torch.long)
+        self._hits = torch.zeros(capacity, max_templates, dtype=torch.long)
+        self._centroids = torch.zeros(capacity, dim)
+        self._ids = []
+        self._rows = {}
+        self._sequence = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, student_id):
+        return student_id in self._rows
+
+    @property
+    def ids(self):
+        """معرفات الطلاب بترتيب صفوف المراكز"""
+        return list(self._ids)
+
+    @property
+    def centroids(self):
+        """مراكز الطلاب المطبّعة (صف لكل طالب)"""
+        return self._centroids[:len(self._ids)]
+
+    def centroid(self, student_id):
+        """المركز المطبّع لقوالب طالب"""
+        return self._centroids[self._rows[student_id]]
+
+    def templates(self, student_id):
+        """قوالب الطالب المطبّعة المستخدمة فعلًا"""
+        with self._lock:
+            row = self._rows[student_id]
+            return self._templates[row][self._used[row]]
+
+    def add(self, student_id, embedding, slot=None):
+        """
+        إضافة قالب للطالب وتحديث مركزه
+
+        Args:
+            student_id: معرف الطالب
+            embedding: تشفير الوجه (غير مطبّع)
+            slot: رقم القالب (عند التحميل من المخزن)؛ None يختار خانة فارغة
+                أو يستبدل قالبًا حسب سياسة الاستبدال
+
+        Returns:
+            slot: رقم الخانة التي كُتب فيها القالب
+        """
+        unit = normalize_embedding(embedding)
+        with self._lock:
+            row = self._rows.get(student_id)
+            if row is None:
+                row = len(self._ids)
+                if row == self._templates.shape[0]:
+                    self._grow()
+                self._ids.append(student_id)
+                self._rows[student_id] = row
+            if slot is None:
+                slot = self._free_slot(row)
+
+            self._sequence += 1
+            self._templates[row, slot] = unit
+            self._used[row, slot] = True
+            self._added[row, slot] = self._sequence
+            self._hits[row, slot] = 0
+            self._update_centroid(row)
+            return slot
+
+    def load(self, embeddings):
+        """
+        تحميل القوالب من قاموس المخزن {مفتاح القالب: تشفير}
+
+        المفاتيح القديمة (تشفير واحد للطالب) تصبح القالب 0، والقوالب التي
+        تتجاوز max_templates تُهمل.
+
+        Args:
+            embeddings: قاموس المخزن كما أرجعه EmbeddingStore.load
+
+        Returns:
+            embeddings: قاموس بمفاتيح القوالب فقط يمثل ما حُمّل فعلًا
+        """
+        loaded = {}
+        for key, embedding in embeddings.items():
+            student_id, slot = split_template_key(key)
+            canonical = template_key(student_id, slot)
+            if slot >= self.max_templates:
+                continue
+            # المفتاح الجديد لنفس الخانة أحدث من المفتاح القديم
+            if key != canonical and canonical in embeddings:
+                continue
+            loaded[canonical] = embedding
+
+        with self._lock:
+            for key, embedding in loaded.items():
+                student_id, slot = split_template_key(key)
+                self.add(student_id, embedding, slot)
+        return loaded
+
+    def score(self, student_id, embedding, mode='max'):
+        """
+        تشابه الجيب تمام بين الوجه وقوالب الطالب
+
+        Args:
+            student_id: معرف الطالب
+            embedding: تشفير الوجه المدخل
+            mode: 'max' (أعلى تشابه مع أي قالب) أو 'centroid' (التشابه مع المركز)
+
+        Returns:
+            cosine: تشابه الجيب تمام (-1 إلى 1)
+        """
+        query = normalize_embedding(embedding)
+        with self._lock:
+            row = self._rows[student_id]
+            similarities = self._templates[row] @ query
+            similarities[~self._used[row]] = float('-inf')
+            best = torch.argmax(similarities)
+            # عدد المطابقات لكل قالب لسياسة الأقل استخدامًا
+            self._hits[row, best] += 1
+            if mode == 'centroid':
+                return torch.dot(self._centroids[row], query).item()
+            return similarities[best].item()
+
+    def _free_slot(self, row):
+        """أول خانة فارغة، أو الخانة التي تُستبدل حسب السياسة"""
+        free = torch.nonzero(~self._used[row])
+        if free.shape[0] > 0:
+            return free[0].item()
+        if self.eviction == 'least_used':
+            # الأقل مطابقة ثم الأقدم
+            order = self._hits[row] * (self._sequence + 1) + self._added[row]
+            return torch.argmin(order).item()
+        return torch.argmin(self._added[row]).item()
+
+    def _update_centroid(self, row):
+        total = self._templates[row][self._used[row]].sum(dim=0)
+        self._centroids[row] = F.normalize(total, p=2, dim=0)
+
+    def _grow(self):
+        """مضاعفة السعة بعدد الطلاب"""
+        size = self._templates.shape[0]
+
+        def grown(tensor):
+            result = torch.zeros((size * 2,) + tuple(tensor.shape[1:]), dtype=tensor.dtype)
+            result[:size] = tensor
+            return result
+
+        self._templates = grown(self._templates)
+        self._used = grown(self._used)
+        self._added = grown(self._added)
+        self._hits = grown(self._hits)
+        self._centroids = grown(self._centroids)
+
+
+class ImpostorCohorts:
+    def __init__(self, gallery, sample_size=0, seed=0):
+        """
+        مجموعات المقارنة (cohorts) لحساب هامش الأمان: طلاب المقرر بدل المعرض كاملًا
+
+        لكل مقرر قائمة طلابه ومجموع تشفيراتهم المطبّعة المحسوب مسبقًا، فمتوسط
+        التشابه مع زملاء المقرر ضرب نقطي واحد. يُعاد حساب المجموع عند تغيير
+        طلاب المقرر أو تغيير تشفير أحدهم.
+
+        Args:
+            gallery: معرض التشفيرات (FaceGallery)
+            sample_size: إذا كان أكبر من صفر تُستخدم عينة ثابتة بهذا الحجم من
+                طلاب المقرر، ومن المعرض كاملًا للطلبات التي لا تحدد مقررًا
+            seed: بذرة اختيار العينة
+        """
+        self.gallery = gallery
+        self.sample_size = sample_size
+        self.seed = seed
+        self._rosters = {}
+        self._sums = {}
+        self._members = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, course_id):
+        return course_id in self._rosters
+
+    def set_course(self, course_id, student_ids):
+        """تعيين طلاب المقرر (عند التسجيل أو إلغاء التسجيل)"""
+        with self._lock:
+            self._rosters[course_id] = list(dict.fromkeys(student_ids))
+            self._drop(course_id)
+
+    def remove_course(self, course_id):
+        with self._lock:
+            self._rosters.pop(course_id, None)
+            self._drop(course_id)
+
+    def replace_courses(self, rosters):
+        """
+        استبدال طلاب كل المقررات دفعة واحدة (مزامنة كاملة من الخادم الخلفي)
+
+        Args:
+            rosters: قاموس {معرف المقرر: قائمة الطلاب}؛ المقررات غير الموجودة فيه تُحذف
+        """
+        with self._lock:
+            for course_id in list(self._rosters):
+                self._drop(course_id)
+            self._rosters = {course_id: list(dict.fromkeys(student_ids)) for course_id, student_ids in rosters.items()}
+
+    @property
+    def course_count(self):
+        return len(self._rosters)
+
+    def invalidate(self, student_id):
+        """
+        إسقاط المجاميع المحفوظة التي تتأثر بتغيير تشفير طالب
+
+        العينة من المعرض كاملًا تُعاد أيضًا ما دامت أصغر من الحجم المطلوب
+        حتى يدخل فيها الطلاب الجدد.
+        """
+        with self._lock:
+            for course_id in [course_id for course_id, roster in self._rosters.items() if student_id in roster]:
+                self._drop(course_id)
+            members = self._members.get(None)
+            if members is not None and (student_id in members or len(members) < self.sample_size):
+                self._drop(None)
+
+    def mean_similarity(self, embedding, student_id, course_id=None):
+        """
+        متوسط التشابه بين التشفير وطلاب مجموعة المقارنة عدا الطالب المُدّعى
+
+        Args:
+            embedding: تشفير الوجه المدخل
+            student_id: معرف الطالب المُدّعى (يُستثنى من المتوسط)
+            course_id: المقرر؛ None أو مقرر غير معروف يستخدم العينة من المعرض
+                إن وُجد sample_size، وإلا المعرض كاملًا
+
+        Returns:
+            similarity: متوسط التشابه (0-1) أو None إذا لم يوجد طلاب آخرون
+        """
+        cohort = self._cohort(course_id)
+        if cohort is None:
+            return self.gallery.impostor_mean_similarity(embedding, student_id)
+
+        members, total = cohort
+        if student_id in members:
+            total = total - self.gallery.row(student_id).double()
+            count = len(members) - 1
+        else:
+            count = len(members)
+        if count == 0:
+            return None
+
+        query = normalize_embedding(embedding).double()
+        mean_cosine = torch.dot(query, total).item() / count
+        return (mean_cosine + 1) / 2
+
+    def _cohort(self, course_id):
+        """
+        أعضاء المجموعة المسجلون في المعرض ومجموع تشفيراتهم (يُحسب مرة ويُحفظ)
+
+        اختيار المجموعة يتم تحت القفل نفسه، فحذف المقرر أثناء الطلب يُرجعه
+        إلى المعرض بدل خطأ.
+
+        Returns:
+            (members, total)، أو None للمقارنة بالمعرض كاملًا دون عينة
+        """
+        with self._lock:
+            key = course_id if course_id in self._rosters else None
+            if key is None and self.sample_size <= 0:
+                return None
+            if key in self._sums:
+                return self._members[key], self._sums[key]
+            candidates = self._rosters[key] if key is not None else self.gallery.ids
+            ids, matrix = self.gallery.subset(candidates)
+            if 0 < self.sample_size < len(ids):
+                generator = torch.Generator().manual_seed(self.seed)
+                picked = torch.randperm(len(ids), generator=generator)[:self.sample_size]
+                ids, matrix = [ids[i] for i in picked.tolist()], matrix[picked]
+            members = frozenset(ids)
+            total = matrix.double().sum(dim=0)
+            self._members[key], self._sums[key] = members, total
+            return members, total
+
+    def _drop(self, key):
+        self._sums.pop(key, None)
+        self._members.pop(key, None)
@@ -0,0 +1,123 @@
+"""
+مجدول استدلال يجمع قصاصات الوجوه من الطلبات المتزامنة في دفعات
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import torch
+
+from face_metrics import percentiles
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceScheduler:
+    def __init__(self, model, max_batch_size=16, max_wait_ms=5.0, history_size=1024):
+        """
+        تهيئة المجدول
+
+        Args:
+            model: نموذج التشفير (InceptionResnetV1 أو TorchScript)
+            max_batch_size: أكبر عدد من الوجوه في تمريرة واحدة
+            max_wait_ms: أقصى انتظار لاكتمال الدفعة بعد وصول أول وجه
+            history_size: عدد العينات الأخيرة المحفوظة لحساب المئينات
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._batch_size_counts = {}
+        self._queue_wait_ms = deque(maxlen=history_size)
+        self._batch_ms = deque(maxlen=history_size)
+
+    def start(self):
+        """تشغيل خيط الاستدلال في الخلفية"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, face):
+        """
+        إضافة قصاصة وجه إلى قائمة الانتظار
+
+        Args:
+            face: قصاصة وجه محاذاة بحجم 3x160x160
+
+        Returns:
+            future: يُكمل بتشفير الوجه (512)
+        """
+        future = Future()
+        self._queue.put((face, future, time.perf_counter()))
+        return future
+
+    def embed(self, face, timeout=None):
+        """الحصول على تشفير وجه واحد مع الانتظار حتى تُعالج دفعته"""
+        return self.submit(face).result(timeout=timeout)
+
+    def metrics(self):
+        """مقاييس عمق قائمة الانتظار وأحجام الدفعات وأزمنتها"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'items': self._items,
+                'mean_batch_size': self._items / self._batches if self._batches else 0.0,
+                'batch_size_counts': dict(sorted(self._batch_size_counts.items())),
+                'queue_wait_ms': percentiles(self._queue_wait_ms),
+                'batch_ms': percentiles(self._batch_ms),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0
+            }
+
+    def _collect(self):
+        """انتظار أول وجه ثم جمع ما يصل حتى امتلاء الدفعة أو انتهاء المهلة"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """حلقة الاستدلال: تمريرة واحدة للنموذج لكل دفعة"""
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                with torch.no_grad():
+                    embeddings = self.model(torch.stack([face for face, _, _ in batch]))
+            except Exception as e:
+                logger.error(f"خطأ في استدلال الدفعة: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            for i, (_, future, _) in enumerate(batch):
+                # نسخة مستقلة حتى لا يبقى تشفير واحد ممسكًا بذاكرة الدفعة كاملة
+                future.set_result(embeddings[i].clone())
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_size_counts[len(batch)] = self._batch_size_counts.get(len(batch), 0) + 1
+                self._batch_ms.append((finished - started) * 1000)
+                for _, _, enqueued in batch:
+                    self._queue_wait_ms.append((started - enqueued) * 1000)
+
@@ -0,0 +1,178 @@
+"""
+قائمة مهام غير متزامنة لطلبات التسجيل والتحقق: الإرسال يُرجع معرف مهمة
+فورًا، وتُنفذ المهام في خيوط عمل محدودة، ويستعلم التطبيق عن النتيجة لاحقًا
+"""
+
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from face_metrics import SampleStats
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """قائمة الانتظار ممتلئة؛ يجب على العميل إعادة المحاولة لاحقًا"""
+
+
+class _Job:
+    def __init__(self, function, args):
+        self.id = uuid.uuid4().hex
+        self.function = function
+        self.args = args
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = threading.Event()
+
+    def to_dict(self):
+        """حالة المهمة مع زمن الانتظار في القائمة وزمن التنفيذ كلٌّ على حدة"""
+        queue_wait_ms = None
+        compute_ms = None
+        if self.started_at is not None:
+            queue_wait_ms = (self.started_at - self.submitted_at) * 1000
+        if self.finished_at is not None:
+            compute_ms = (self.finished_at - self.started_at) * 1000
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'queue_wait_ms': queue_wait_ms,
+            'compute_ms': compute_ms
+        }
+
+
+class JobQueue:
+    def __init__(self, workers=2, max_pending=256, ttl_seconds=300):
+        """
+        تهيئة قائمة المهام
+
+        Args:
+            workers: عدد خيوط التنفيذ
+            max_pending: أقصى عدد من المهام المنتظرة؛ بعده يُرفض الإرسال
+            ttl_seconds: مدة الاحتفاظ بنتيجة المهمة بعد انتهائها
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl_seconds
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._rejected = 0
+        self._expired = 0
+        self._queue_wait_ms = SampleStats()
+        self._compute_ms = SampleStats()
+
+    def start(self):
+        """تشغيل خيوط التنفيذ في الخلفية"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f'face-job-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, function, *args):
+        """
+        إضافة مهمة إلى القائمة
+
+        Args:
+            function: الدالة المنفذة؛ قيمتها المرجعة هي نتيجة المهمة
+            args: معاملاتها
+
+        Returns:
+            job_id: معرف المهمة
+
+        Raises:
+            JobQueueFull: إذا امتلأت القائمة
+        """
+        self._expire()
+        job = _Job(function, args)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self._rejected += 1
+            raise JobQueueFull()
+        return job.id
+
+    def get(self, job_id, wait=0):
+        """
+        حالة مهمة ونتيجتها، مع إمكانية الانتظار حتى انتهائها (long-poll)
+
+        Args:
+            job_id: معرف المهمة
+            wait: أقصى انتظار بالثواني لانتهاء المهمة
+
+        Returns:
+            job: قاموس حالة المهمة أو None إذا لم توجد أو انتهت صلاحيتها
+        """
+        self._expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if wait > 0:
+            job.finished.wait(wait)
+        return job.to_dict()
+
+    def metrics(self):
+        """عمق القائمة وعدد المهام بكل حالة وزمن الانتظار وزمن التنفيذ"""
+        with self._lock:
+            statuses = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                statuses[job.status] += 1
+            rejected, expired = self._rejected, self._expired
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_pending': self.max_pending,
+            'workers': self.workers,
+            'jobs': statuses,
+            'rejected': rejected,
+            'expired': expired,
+            'queue_wait_ms': self._queue_wait_ms.to_dict(),
+            'compute_ms': self._compute_ms.to_dict()
+        }
+
+    def _expire(self):
+        """حذف نتائج المهام المنتهية التي تجاوزت مدة الاحتفاظ"""
+        cutoff = time.perf_counter() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+            self._expired += len(expired)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.perf_counter()
+            job.status = RUNNING
+            try:
+                job.result = job.function(*job.args)
+                job.status = DONE
+            except Exception as e:
+                logger.error(f"خطأ في تنفيذ المهمة {job.id}: {e}")
+                job.error = str(e)
+                job.status = FAILED
+            job.finished_at = time.perf_counter()
+            job.finished.set()
+
+            self._queue_wait_ms.observe((job.started_at - job.submitted_at) * 1000)
+            self._compute_ms.observe((job.finished_at - job.started_at) * 1000)
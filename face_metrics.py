@@ -0,0 +1,123 @@
+"""
+مقاييس بسيطة لخادم التعرف على الوجه: عينات أخيرة ومئيناتها، ومدرجات
+تكرارية ومقاييس gauge بصيغة نص Prometheus
+"""
+
+import threading
+from collections import deque
+
+
+def percentiles(samples):
+    """p50 وp99 وأقصى قيمة لمجموعة عينات"""
+    if not samples:
+        return {'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+    ordered = sorted(samples)
+    return {
+        'p50': ordered[int(0.50 * (len(ordered) - 1))],
+        'p99': ordered[int(0.99 * (len(ordered) - 1))],
+        'max': ordered[-1]
+    }
+
+
+class SampleStats:
+    def __init__(self, history_size=1024):
+        """
+        عداد ومجموع لكل العينات مع نافذة من آخر العينات لحساب المئينات
+
+        Args:
+            history_size: عدد العينات الأخيرة المحفوظة
+        """
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self._samples.append(value)
+
+    def to_dict(self):
+        with self._lock:
+            result = {
+                'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0
+            }
+            result.update(percentiles(self._samples))
+            return result
+
+
+# حدود فئات المدرجات التكرارية بالثواني (من 1 مللي ثانية إلى 10 ثوانٍ)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_name, buckets=DEFAULT_BUCKETS):
+        """
+        مدرج تكراري بصيغة Prometheus مع وسم واحد (مثل stage)
+
+        Args:
+            name: اسم المقياس
+            documentation: وصف المقياس (HELP)
+            label_name: اسم الوسم
+            buckets: الحدود العليا للفئات
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        """أسطر صيغة النص لـ Prometheus"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    labels = _format_labels({self.label_name: label, 'le': repr(bound)})
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels({self.label_name: label, 'le': '+Inf'})
+                lines.append(f'{self.name}_bucket{labels} {series["count"]}')
+                labels = _format_labels({self.label_name: label})
+                lines.append(f'{self.name}_sum{labels} {series["sum"]}')
+                lines.append(f'{self.name}_count{labels} {series["count"]}')
+        return lines
+
+
+def render_gauge(name, documentation, values, label_name=None):
+    """
+    أسطر مقياس من نوع gauge بصيغة Prometheus
+
+    Args:
+        name: اسم المقياس
+        documentation: وصف المقياس
+        values: قيمة واحدة، أو قاموس {قيمة الوسم: القيمة} مع label_name
+        label_name: اسم الوسم عند تمرير قاموس
+    """
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} gauge']
+    if label_name is None:
+        lines.append(f'{name} {float(values)}')
+    else:
+        for label, value in sorted(values.items()):
+            lines.append(f'{name}{_format_labels({label_name: label})} {float(value)}')
+    return lines
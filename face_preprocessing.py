@@ -0,0 +1,231 @@
+"""
+فك ترميز الصور بدقتين: صورة مصغرة لاكتشاف الوجه وصورة أصلية لاقتصاصه،
+واقتصاص الوجه مباشرة من مربع يرسله التطبيق عند صلاحيته
+"""
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+class DecodedImage:
+    def __init__(self, image, proxy):
+        """
+        صورة مفكوكة الترميز مع نسختها المصغرة
+
+        Args:
+            image: الصورة بدقتها الأصلية (للاقتصاص)
+            proxy: نسخة مصغرة لاكتشاف الوجه (أو الصورة نفسها)
+        """
+        self.image = image
+        self.proxy = proxy
+        self.scale_x = image.width / proxy.width
+        self.scale_y = image.height / proxy.height
+
+
+def decode_image(source, max_detection_edge=None):
+    """
+    فك ترميز صورة مع نسخة مصغرة لا يتجاوز ضلعها الأطول max_detection_edge
+
+    صور JPEG تُفك مصغرة مباشرة بوضع draft (تقليص DCT بمعامل 1/2 إلى 1/8)
+    قبل تصغير نهائي، بدل فك الصورة كاملة ثم تصغيرها.
+
+    Args:
+        source: ملف أو BytesIO قابل للتنقل (seek)
+        max_detection_edge: أقصى طول لضلع صورة الاكتشاف (None أو 0 لتعطيله)
+
+    Returns:
+        decoded: DecodedImage
+    """
+    proxy = Image.open(source)
+    if not max_detection_edge or max(proxy.size) <= max_detection_edge:
+        proxy.load()
+        return DecodedImage(proxy, proxy)
+
+    scale = max_detection_edge / max(proxy.size)
+    target_size = (max(1, round(proxy.width * scale)), max(1, round(proxy.height * scale)))
+    if proxy.format == 'JPEG':
+        proxy.draft(proxy.mode, target_size)
+    proxy.load()
+    proxy.thumbnail((max_detection_edge, max_detection_edge), Image.BILINEAR)
+
+    # فك الصورة الأصلية للاقتصاص النهائي
+    source.seek(0)
+    image = Image.open(source)
+    image.load()
+    return DecodedImage(image, proxy)
+
+
+def detect_faces(mtcnn, decoded):
+    """
+    بديل mtcnn(image): الاكتشاف على الصورة المصغرة والاقتصاص من الأصلية
+
+    Args:
+        mtcnn: كاشف MTCNN (keep_all يحدد إرجاع وجه واحد أو كل الوجوه)
+        decoded: DecodedImage
+
+    Returns:
+        faces: قصاصة الوجه (أو قصاصات كل الوجوه) أو None
+    """
+    if decoded.proxy is decoded.image:
+        return mtcnn(decoded.image)
+
+    boxes, probs, points = mtcnn.detect(decoded.proxy, landmarks=True)
+    if boxes is None:
+        return None
+    if not mtcnn.keep_all:
+        boxes, probs, points = mtcnn.select_boxes(
+            boxes, probs, points, decoded.proxy, method=mtcnn.selection_method
+        )
+
+    # إرجاع المربعات إلى إحداثيات الصورة الأصلية
+    boxes = boxes * np.array([decoded.scale_x, decoded.scale_y, decoded.scale_x, decoded.scale_y])
+    return mtcnn.extract(decoded.image, boxes, None)
+
+
+def detect_faces_batch(mtcnn, decoded_images, method=None):
+    """
+    اكتشاف وجه واحد في كل صورة من عدة صور بتمريرة MTCNN واحدة لكل مقاس
+
+    MTCNN لا يجمع في دفعة إلا الصور المتساوية الأبعاد، فتُجمع الصور
+    المصغرة حسب مقاسها (لقطات الكاميرا نفسها تقع عادة في مجموعة واحدة)،
+    ثم يُقتص كل وجه من الصورة الأصلية بالمربع المكتشف دون إعادة الاكتشاف.
+
+    Args:
+        mtcnn: كاشف MTCNN
+        decoded_images: قائمة DecodedImage
+        method: طريقة اختيار الوجه في كل صورة (الافتراضي mtcnn.selection_method)
+
+    Returns:
+        faces: قائمة بطول الصور: قصاصة وجه (3x160x160) أو None لكل صورة
+    """
+    method = method or mtcnn.selection_method
+    faces = [None] * len(decoded_images)
+    groups = {}
+    for index, decoded in enumerate(decoded_images):
+        groups.setdefault(decoded.proxy.size, []).append(index)
+
+    for indices in groups.values():
+        proxies = [decoded_images[index].proxy for index in indices]
+        batch_boxes, batch_probs, batch_points = mtcnn.detect(proxies, landmarks=True)
+        for i, index in enumerate(indices):
+            if batch_boxes[i] is None:
+                continue
+            # الاختيار لكل صورة وحدها: select_boxes على مجموعة فيها صور بلا وجه
+            # تفشل في numpy >= 1.24 (مصفوفة غير متجانسة)
+            boxes, _, _ = mtcnn.select_boxes(batch_boxes[i:i + 1], batch_probs[i:i + 1], batch_points[i:i + 1],
+                                             [proxies[i]], method=method)
+            boxes = boxes[0]
+            if boxes is None:
+                continue
+            decoded = decoded_images[index]
+            boxes = boxes * np.array([decoded.scale_x, decoded.scale_y, decoded.scale_x, decoded.scale_y])
+            face = mtcnn.extract(decoded.image, boxes, None)
+            # مع keep_all تُرجع extract دفعة من وجه واحد
+            faces[index] = face[0] if face.dim() == 4 else face
+    return faces
+
+
+def parse_face_hint(face_box, landmarks=None):
+    """
+    قراءة مربع الوجه والمعالم الخمسة المرسلة من التطبيق
+
+    تقبل قوائم JSON أو نصوصًا مفصولة بفواصل (من multipart أو الترويسات).
+
+    Args:
+        face_box: [x1, y1, x2, y2] بإحداثيات الصورة المرسلة
+        landmarks: خمس نقاط [[x, y], ...] (العينان، الأنف، طرفا الفم) أو None
+
+    Returns:
+        hint: (box, points) كمصفوفات numpy أو None إذا كانت الصيغة غير صالحة
+    """
+    def to_floats(value):
+        if isinstance(value, str):
+            value = value.split(',')
+        return np.asarray(value, dtype=np.float32).reshape(-1)
+
+    try:
+        box = to_floats(face_box)
+        points = to_floats(landmarks).reshape(5, 2) if landmarks is not None else None
+    except (TypeError, ValueError):
+        return None
+    if box.shape[0] != 4 or not np.all(np.isfinite(box)):
+        return None
+    return box, points
+
+
+def _hint_geometry_is_valid(box, points, image_size, min_face_size, tolerance=0.1):
+    """فحص هندسي سريع: المربع داخل الصورة وبحجم معقول والمعالم في مواضعها"""
+    width, height = image_size
+    x1, y1, x2, y2 = box
+    face_width, face_height = x2 - x1, y2 - y1
+    if face_width < min_face_size or face_height < min_face_size:
+        return False
+    if x1 < -tolerance * face_width or y1 < -tolerance * face_height:
+        return False
+    if x2 > width + tolerance * face_width or y2 > height + tolerance * face_height:
+        return False
+    if not 0.5 <= face_height / face_width <= 2.0:
+        return False
+
+    if points is not None:
+        inside = (points[:, 0] >= x1) & (points[:, 0] <= x2) & (points[:, 1] >= y1) & (points[:, 1] <= y2)
+        left_eye, right_eye, nose, mouth_left, mouth_right = points
+        if not inside.all():
+            return False
+        if left_eye[0] >= right_eye[0] or mouth_left[0] >= mouth_right[0]:
+            return False
+        if max(left_eye[1], right_eye[1]) >= min(mouth_left[1], mouth_right[1]):
+            return False
+        if not min(left_eye[1], right_eye[1]) < nose[1] < max(mouth_left[1], mouth_right[1]):
+            return False
+    return True
+
+
+def _onet_probability(mtcnn, image, box):
+    """
+    احتمال أن يكون المربع وجهًا بتمريره عبر المرحلة الأخيرة من MTCNN (O-Net) فقط
+    """
+    # O-Net يعمل على مربعات مربعة كما في detect_face (rerec)
+    x1, y1, x2, y2 = box
+    side = max(x2 - x1, y2 - y1)
+    x1 = x1 + (x2 - x1) / 2 - side / 2
+    y1 = y1 + (y2 - y1) / 2 - side / 2
+    square = (x1, y1, x1 + side, y1 + side)
+
+    crop = image.convert('RGB').crop(tuple(int(round(v)) for v in square))
+    pixels = torch.as_tensor(np.asarray(crop, dtype=np.float32)).permute(2, 0, 1).unsqueeze(0)
+    pixels = torch.nn.functional.interpolate(pixels, size=(48, 48), mode='area')
+    pixels = (pixels - 127.5) * 0.0078125
+
+    with torch.no_grad():
+        _, _, probability = mtcnn.onet(pixels)
+    return probability[0, 1].item()
+
+
+def extract_hinted_face(mtcnn, decoded, hint):
+    """
+    اقتصاص الوجه من مربع أرسله التطبيق بدل تشغيل MTCNN كاملًا
+
+    يُقبل التلميح فقط إذا اجتاز الفحص الهندسي وأكدت O-Net أنه وجه بنفس
+    عتبة المرحلة الأخيرة للكاشف؛ ويُقتص الوجه بنفس طريقة MTCNN حتى تبقى
+    التشفيرات متوافقة مع المعرض المسجل.
+
+    Args:
+        mtcnn: كاشف MTCNN (لشبكة O-Net وإعدادات الاقتصاص)
+        decoded: DecodedImage
+        hint: ناتج parse_face_hint
+
+    Returns:
+        face: قصاصة الوجه أو None إذا رُفض التلميح
+    """
+    box, points = hint
+    image = decoded.image
+    if not _hint_geometry_is_valid(box, points, image.size, mtcnn.min_face_size):
+        return None
+
+    if _onet_probability(mtcnn, image, box) < mtcnn.thresholds[2]:
+        return None
+
+    # المربع المرسل هو المربع النهائي للكاشف، فلا يُعاد تصحيحه بانحدار O-Net
+    return mtcnn.extract(image, np.array([box]), None)
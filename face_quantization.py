@@ -0,0 +1,142 @@
+"""
+تكميم نموذج التشفير إلى int8 للاستدلال على المعالج
+
+    dynamic: تكميم ديناميكي للطبقات الخطية فقط (لا يحتاج معايرة، أثره محدود
+             لأن أغلب حساب InceptionResnetV1 في الالتفافات)
+    static:  تكميم ثابت للالتفافات والطبقات الخطية (FX) بعد معايرة على قصاصات وجوه
+
+تجهيز النموذج المكمم مرة واحدة قبل النشر:
+    python face_quantization.py --mode static --calibration-images data/calibration \
+        --output models/facenet_model.int8.pt
+ثم تشغيل الخادم مع FACE_EMBEDDER_PRECISION=int8
+"""
+
+import argparse
+import logging
+import os
+
+import numpy as np
+import torch
+from PIL import Image
+
+from face_startup import freeze_model
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ('dynamic', 'static')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+FACE_SIZE = 160
+
+
+def load_calibration_faces(folder, mtcnn, limit=256):
+    """
+    قصاصات وجوه للمعايرة من مجلد صور
+
+    الصور بحجم 160x160 تُعامل كقصاصات جاهزة، وغيرها يُقتص منها الوجه بـ MTCNN.
+
+    Args:
+        folder: مجلد الصور
+        mtcnn: كاشف MTCNN (post_process=True كما في الخادم)
+        limit: أقصى عدد قصاصات
+
+    Returns:
+        faces: مصفوفة القصاصات (N x 3 x 160 x 160)
+    """
+    faces = []
+    for name in sorted(os.listdir(folder)):
+        if len(faces) >= limit:
+            break
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = Image.open(os.path.join(folder, name)).convert('RGB')
+        if image.size == (FACE_SIZE, FACE_SIZE):
+            # نفس تطبيع MTCNN (post_process)
+            pixels = torch.as_tensor(np.asarray(image, dtype=np.float32)).permute(2, 0, 1)
+            faces.append((pixels - 127.5) / 128.0)
+        else:
+            face = mtcnn(image)
+            if face is not None:
+                faces.append(face[0] if face.dim() == 4 else face)
+
+    if not faces:
+        raise ValueError(f"لا توجد وجوه للمعايرة في {folder}")
+    return torch.stack(faces)
+
+
+def quantize_dynamic(model):
+    """تكميم ديناميكي للطبقات الخطية"""
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model, calibration_faces, backend='x86', batch_size=32):
+    """
+    تكميم ثابت بـ FX مع معايرة مدى التفعيلات على قصاصات وجوه حقيقية
+
+    Args:
+        model: نموذج InceptionResnetV1 (غير TorchScript)
+        calibration_faces: قصاصات المعايرة (N x 3 x 160 x 160)
+        backend: محرك التكميم ('x86' أو 'fbgemm' للخوادم، 'qnnpack' لـ ARM)
+        batch_size: حجم دفعة المعايرة
+
+    Returns:
+        quantized: النموذج المكمم
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = backend
+    model = model.eval()
+    prepared = prepare_fx(model, get_default_qconfig_mapping(backend), (calibration_faces[:1],))
+    with torch.no_grad():
+        for start in range(0, calibration_faces.shape[0], batch_size):
+            prepared(calibration_faces[start:start + batch_size])
+    return convert_fx(prepared)
+
+
+def quantize_embedder(model, mode, calibration_faces=None, backend='x86'):
+    """
+    تكميم نموذج التشفير بالطريقة المطلوبة
+
+    Args:
+        model: نموذج InceptionResnetV1
+        mode: 'dynamic' أو 'static'
+        calibration_faces: قصاصات المعايرة (مطلوبة لـ static)
+        backend: محرك التكميم
+
+    Returns:
+        quantized: النموذج المكمم
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"طريقة تكميم غير معروفة: {mode}")
+    if mode == 'dynamic':
+        return quantize_dynamic(model)
+    if calibration_faces is None:
+        raise ValueError("التكميم الثابت يتطلب قصاصات معايرة")
+    return quantize_static(model, calibration_faces, backend)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='تكميم نموذج التشفير إلى int8')
+    parser.add_argument('--mode', choices=QUANTIZATION_MODES, default='static')
+    parser.add_argument('--calibration-images', default=None, help='مجلد صور أو قصاصات 160x160 للمعايرة')
+    parser.add_argument('--calibration-limit', type=int, default=256)
+    parser.add_argument('--backend', default='x86')
+    parser.add_argument('--output', default='models/facenet_model.int8.pt')
+    args = parser.parse_args()
+
+    from facenet_pytorch import MTCNN, InceptionResnetV1
+    source = InceptionResnetV1(pretrained='vggface2').eval()
+
+    calibration_faces = None
+    if args.mode == 'static':
+        if not args.calibration_images:
+            parser.error('--calibration-images مطلوب مع --mode static')
+        mtcnn = MTCNN(image_size=160, margin=20, min_face_size=40, thresholds=[0.6, 0.7, 0.8],
+                      factor=0.709, post_process=True, device='cpu')
+        calibration_faces = load_calibration_faces(args.calibration_images, mtcnn, args.calibration_limit)
+        logger.info(f"المعايرة على {calibration_faces.shape[0]} قصاصة وجه")
+
+    quantized = quantize_embedder(source, args.mode, calibration_faces, args.backend)
+    freeze_model(quantized, args.output)
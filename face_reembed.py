@@ -0,0 +1,260 @@
+"""
+إعادة تشفير المعرض بنموذج جديد (مكمم أو معاد تدريبه) من قصاصات الوجوه
+المحفوظة عند التسجيل، دون أن يعيد الطلاب التسجيل
+
+    python face_reembed.py --model models/facenet_finetuned.pt --model-version facenet-ft-1 \
+        --batch-size 128
+
+يُبنى المعرض الجديد في data/galleries/<model-version>/ بجانب المعرض النشط
+الذي يستمر الخادم في خدمته. كل دفعة تُلحق بسجل المخزن الجديد ويُحفظ التقدم
+بعدها، فإيقاف المهمة وتشغيلها بنفس الأوامر يكمل من حيث توقفت. القوالب
+المسجلة أثناء التشغيل تُعالج في جولة لاحقة قبل الانتهاء.
+
+عند الاكتمال يُضغط المخزن الجديد وتُنسخ إليه نسخة من النموذج (ومن نسخته
+المكممة مع --quantized-model لخوادم FACE_EMBEDDER_PRECISION=int8) ثم يُستبدل
+المؤشر face_gallery.current ذريًا؛ يحمّل الخادم الإصدار الجديد مع نموذجه عند
+إعادة تشغيله، والمعرض القديم يبقى كما هو للرجوع إليه. الخادم الذي ما زال
+يعمل بالمعرض القديم يحفظ قصاصات كل تسجيل جديد، فيشفّر ما فاته منها بنموذج
+الإصدار الجديد عند إقلاعه (catch_up) قبل خدمة أي طلب.
+
+لا يُفعّل الإصدار ما دام في المعرض النشط طالب كل قوالبه بلا قصاصات محفوظة
+(سُجلت قبل حفظها) فيغيب عن المعرض الجديد؛ يعيد هؤلاء التسجيل ثم يُعاد تشغيل
+الأمر نفسه فيكمل من حيث توقف.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+
+import torch
+
+from face_crop_store import CropStore
+from face_embedding_store import (GALLERY_MODEL_FILE, GALLERY_QUANTIZED_MODEL_FILE, GALLERY_VERSIONS_DIR,
+                                  EmbeddingStore, activate_gallery, active_gallery_directory)
+from face_gallery import split_template_key, template_key
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_FILE = 'reembed.progress.json'
+# حجم ملف القصاصات عند إقلاع الخادم بهذا المعرض: ما بعده شفّره الخادم بنفسه
+SERVED_FILE = 'reembed.served'
+
+
+def load_progress(path):
+    """{مفتاح القالب: موضع سجل القصاصات الذي شُفّر منه}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_progress(path, progress):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_served_offset(directory):
+    """موضع ملف القصاصات الذي يبدأ بعده تشفير الخادم، أو None"""
+    path = os.path.join(directory, SERVED_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return int(f.read().strip())
+
+
+def save_served_offset(directory, offset):
+    path = os.path.join(directory, SERVED_FILE)
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _batches(crop_store, index, keys, batch_size):
+    """
+    تجميع قصاصات عدة قوالب في دفعات بحجم batch_size تقريبًا
+
+    Yields:
+        keys: مفاتيح القوالب في الدفعة
+        counts: عدد قصاصات كل قالب
+        faces: القصاصات المطبّعة متتالية
+    """
+    batch_keys, counts, faces = [], [], []
+    for key in keys:
+        crops = crop_store.read(index[key])
+        batch_keys.append(key)
+        counts.append(crops.shape[0])
+        faces.append(crops)
+        if sum(counts) >= batch_size:
+            yield batch_keys, counts, torch.cat(faces)
+            batch_keys, counts, faces = [], [], []
+    if batch_keys:
+        yield batch_keys, counts, torch.cat(faces)
+
+
+def reembed(model, crop_store, target_store, progress_path, batch_size=128):
+    """
+    تشفير كل القوالب التي لم تُشفّر من أحدث قصاصاتها بعد
+
+    يتكرر حتى لا يبقى قالب معلق، فيشمل ما سُجل أثناء التشغيل. القصاصات
+    المحفوظة بعد إقلاع الخادم بهذا المعرض شفّرها الخادم بالنموذج نفسه فتُتخطى.
+
+    Args:
+        model: نموذج التشفير الجديد
+        crop_store: مخزن القصاصات
+        target_store: مخزن تشفيرات الإصدار الجديد
+        progress_path: ملف التقدم بجانب المخزن الجديد
+        batch_size: عدد القصاصات في كل تمريرة
+
+    Returns:
+        count: عدد القوالب المشفرة في هذا التشغيل
+    """
+    progress = load_progress(progress_path)
+    served_offset = load_served_offset(os.path.dirname(progress_path))
+    count = 0
+    while True:
+        index = crop_store.index()
+        pending = [key for key, entry in index.items() if progress.get(key) != entry[0]
+                   and (served_offset is None or entry[0] < served_offset)]
+        if not pending:
+            return count
+
+        logger.info(f"إعادة تشفير {len(pending)} قالب (تم سابقًا {len(progress)})")
+        started = time.perf_counter()
+        for keys, counts, faces in _batches(crop_store, index, pending, batch_size):
+            with torch.no_grad():
+                embeddings = model(faces)
+            # قالب من عدة لقطات هو متوسط تشفيراتها كما عند التسجيل
+            for key, embedding in zip(keys, torch.split(embeddings, counts)):
+                target_store.append(key, embedding.mean(dim=0))
+                progress[key] = index[key][0]
+            save_progress(progress_path, progress)
+            count += len(keys)
+        logger.info(f"جولة إعادة التشفير استغرقت {time.perf_counter() - started:.1f} ثانية")
+
+
+def catch_up(model, crop_store, target_store, batch_size=128):
+    """
+    تشفير القصاصات التي حُفظت بعد بناء إصدار المعرض (عند إقلاع الخادم)
+
+    يفترض أن الخادم هو الكاتب الوحيد في المعرض بعد إقلاعه، فيُسجل حجم ملف
+    القصاصات حتى لا تُعاد القوالب التي يشفّرها بنفسه عند كل إعادة تشغيل.
+
+    Args:
+        model: نموذج الإصدار
+        crop_store: مخزن القصاصات
+        target_store: مخزن تشفيرات الإصدار
+        batch_size: عدد القصاصات في كل تمريرة
+
+    Returns:
+        count: عدد القوالب المشفرة، أو 0 إذا لم يُبنَ المعرض بهذه الأداة
+    """
+    progress_path = os.path.join(target_store.directory, PROGRESS_FILE)
+    if not os.path.exists(progress_path):
+        return 0
+    count = reembed(model, crop_store, target_store, progress_path, batch_size)
+    # من الآن يشفّر الخادم كل تسجيل بنفسه
+    crops_size = os.path.getsize(crop_store.path) if os.path.exists(crop_store.path) else 0
+    save_served_offset(target_store.directory, crops_size)
+    return count
+
+
+def _install_model(source_path, destination_path):
+    """نسخ نموذج إلى مجلد المعرض واستبداله ذريًا"""
+    if os.path.abspath(source_path) != os.path.abspath(destination_path):
+        shutil.copyfile(source_path, destination_path + '.tmp')
+        os.replace(destination_path + '.tmp', destination_path)
+
+
+def build_gallery_version(data_dir, model_path, model_version, batch_size=128, activate=True,
+                          quantized_model_path=None):
+    """
+    بناء إصدار معرض جديد من القصاصات المحفوظة ثم تفعيله
+
+    Args:
+        data_dir: مجلد البيانات الرئيسي
+        model_path: نموذج TorchScript الجديد
+        model_version: إصدار النموذج (اسم مجلد المعرض الجديد)
+        batch_size: عدد القصاصات في كل تمريرة
+        activate: استبدال مؤشر المعرض النشط عند الاكتمال
+        quantized_model_path: نسخة int8 من النموذج نفسه للخوادم المكممة
+
+    Returns:
+        directory: مجلد المعرض الجديد
+
+    Raises:
+        RuntimeError: إذا كان في المعرض النشط طلاب لا قصاصات محفوظة لأي من قوالبهم
+    """
+    directory = os.path.join(data_dir, GALLERY_VERSIONS_DIR, model_version)
+    source_directory = active_gallery_directory(data_dir)
+    is_active = os.path.abspath(directory) == os.path.abspath(source_directory)
+    if is_active:
+        logger.info(f"الإصدار {model_version} هو النشط؛ تُشفّر القوالب الجديدة فقط")
+
+    model = torch.jit.load(model_path).eval()
+    # الخادم يُلحق بملف القصاصات أثناء التشغيل، فلا يُقتطع منه هنا
+    crop_store = CropStore(data_dir, read_only=True)
+    target_store = EmbeddingStore(directory)
+
+    count = reembed(model, crop_store, target_store, os.path.join(directory, PROGRESS_FILE), batch_size)
+
+    # قوالب سُجلت قبل حفظ القصاصات لا يمكن إعادة تشفيرها
+    source_keys = {template_key(*split_template_key(key)) for key in EmbeddingStore(source_directory).load()}
+    crop_keys = set(crop_store.index())
+    missing = source_keys - crop_keys
+    covered = {split_template_key(key)[0] for key in crop_keys}
+    lost_students = sorted({split_template_key(key)[0] for key in missing} - covered)
+    if missing and not lost_students:
+        logger.warning(f"{len(missing)} قالب إضافي بلا قصاصات محفوظة لن يكون في المعرض الجديد؛ "
+                       f"لأصحابها قوالب أخرى أعيد تشفيرها")
+
+    # المعرض النشط يكتب فيه الخادم؛ ضغطه هنا قد يُسقط سجلات ألحقها أثناء الضغط
+    if not is_active:
+        target_store.compact(target_store.load())
+    target_store.set_model_version(model_version)
+
+    _install_model(model_path, os.path.join(directory, GALLERY_MODEL_FILE))
+    if quantized_model_path:
+        _install_model(quantized_model_path, os.path.join(directory, GALLERY_QUANTIZED_MODEL_FILE))
+
+    logger.info(f"المعرض {model_version}: {count} قالب أعيد تشفيره في {directory}")
+    if activate and lost_students and not is_active:
+        raise RuntimeError(f"لن يُفعّل المعرض {model_version}: {len(lost_students)} طالب بلا قصاصات محفوظة "
+                           f"({', '.join(lost_students[:10])}{'...' if len(lost_students) > 10 else ''})؛ "
+                           f"أعد تسجيلهم ثم أعد تشغيل الأمر")
+    if activate:
+        activate_gallery(data_dir, directory)
+        logger.info(f"تم تفعيل المعرض {model_version}؛ أعد تشغيل الخوادم لتحميله")
+    return directory
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='إعادة تشفير المعرض بنموذج جديد من القصاصات المحفوظة')
+    parser.add_argument('--model', required=True, help='نموذج TorchScript الجديد')
+    parser.add_argument('--model-version', required=True)
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--threads', type=int, default=0, help='خيوط torch (0 للقيمة الافتراضية)')
+    parser.add_argument('--no-activate', action='store_true', help='بناء الإصدار دون تفعيله')
+    parser.add_argument('--quantized-model', default=None,
+                        help='نسخة int8 من النموذج الجديد (python face_quantization.py) للخوادم المكممة')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    try:
+        build_gallery_version(args.data_dir, args.model, args.model_version, args.batch_size,
+                              activate=not args.no_activate, quantized_model_path=args.quantized_model)
+    except RuntimeError as e:
+        logger.error(str(e))
+        raise SystemExit(1)
@@ -0,0 +1,132 @@
+"""
+أدوات بدء تشغيل خادم التعرف على الوجه: توقيت المراحل وتثبيت الخيوط
+وتجميد نموذج TorchScript وتسخين النماذج قبل الإعلان عن الجاهزية
+
+تجهيز النموذج المجمد مرة واحدة قبل النشر:
+    python face_startup.py freeze --output models/facenet_model.frozen.pt
+"""
+
+import argparse
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class StartupState:
+    def __init__(self):
+        """حالة بدء التشغيل: زمن كل مرحلة وهل انتهى التسخين"""
+        self.phases = {}
+        self.ready = False
+        self.error = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """توقيت مرحلة بدء تشغيل وتسجيل مدتها"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.phases[name] = round(elapsed, 4)
+            logger.info(f"مرحلة بدء التشغيل '{name}' استغرقت {elapsed:.3f} ثانية")
+
+    def mark_ready(self):
+        self.ready = True
+        logger.info(f"الخادم جاهز بعد {time.perf_counter() - self._started:.3f} ثانية")
+
+    def mark_failed(self, error):
+        self.error = str(error)
+        logger.error(f"فشل بدء التشغيل: {error}")
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'error': self.error,
+                'phases': dict(self.phases)
+            }
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    تثبيت عدد خيوط torch
+
+    يجب استدعاؤها قبل أي عملية متوازية لأن torch لا يسمح بتغيير خيوط
+    inter-op بعد بدء استخدامها.
+
+    Args:
+        intra_op_threads: خيوط العملية الواحدة (None يترك القيمة الافتراضية)
+        inter_op_threads: خيوط التوازي بين العمليات
+    """
+    if inter_op_threads:
+        torch.set_num_interop_threads(inter_op_threads)
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    logger.info(f"خيوط torch: intra-op = {torch.get_num_threads()}, inter-op = {torch.get_num_interop_threads()}")
+
+
+def freeze_model(model, output_path):
+    """
+    تتبع النموذج وتجميده (دمج الأوزان كثوابت) وحفظه
+
+    Args:
+        model: نموذج InceptionResnetV1 أو نموذج TorchScript
+        output_path: مسار الملف الناتج
+    """
+    model = model.eval()
+    with torch.no_grad():
+        if not isinstance(model, torch.jit.ScriptModule):
+            model = torch.jit.trace(model, torch.randn(1, 3, 160, 160))
+        frozen = torch.jit.freeze(model)
+    frozen.save(output_path)
+    logger.info(f"تم حفظ النموذج المجمد في {output_path}")
+    return frozen
+
+
+def warm_up(mtcnn, resnet, iterations=3, batch_sizes=(1,), image_size=(640, 480)):
+    """
+    تسخين الكاشف ونموذج التشفير حتى لا يدفع أول طلب حقيقي ثمن
+    تهيئة الذاكرة وتحسينات JIT
+
+    Args:
+        mtcnn: كاشف الوجوه
+        resnet: نموذج التشفير
+        iterations: عدد مرات التشغيل لكل حجم دفعة
+        batch_sizes: أحجام الدفعات التي يُسخن عليها النموذج
+        image_size: أبعاد الصورة الاصطناعية لتسخين الكاشف
+    """
+    generator = np.random.default_rng(0)
+    image = Image.fromarray(generator.integers(0, 255, (image_size[1], image_size[0], 3), dtype=np.uint8))
+    with torch.no_grad():
+        for _ in range(iterations):
+            mtcnn.detect(image)
+            for batch_size in batch_sizes:
+                resnet(torch.randn(batch_size, 3, 160, 160))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='أدوات بدء تشغيل خادم التعرف على الوجه')
+    parser.add_argument('command', choices=['freeze'])
+    parser.add_argument('--source', default=None,
+                        help='نموذج TorchScript مصدر (الافتراضي: InceptionResnetV1 المدرب على vggface2)')
+    parser.add_argument('--output', default='models/facenet_model.frozen.pt')
+    args = parser.parse_args()
+
+    if args.source:
+        source = torch.jit.load(args.source)
+    else:
+        from facenet_pytorch import InceptionResnetV1
+        source = InceptionResnetV1(pretrained='vggface2')
+    freeze_model(source, args.output)
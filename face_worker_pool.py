@@ -0,0 +1,203 @@
+"""
+مجموعة عمليات استدلال: فك الترميز واكتشاف الوجه والتشفير في عمليات مستقلة
+حتى لا تتنافس خيوط Flask وخيوط torch على GIL واحد
+
+تُنشأ العمليات بـ fork بعد تحميل الكاشف والنموذج في العملية الأم، فتتشارك
+صفحات الأوزان (نسخ عند الكتابة) بدل تحميل نسخة لكل عامل. يبقى المعرض في
+العملية الأمامية وحدها: العامل يُرجع التشفير فقط والمطابقة ضرب نقطي رخيص.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import torch
+
+from face_crop_store import crops_from_uint8, crops_to_uint8
+from face_metrics import SampleStats
+from face_preprocessing import decode_image, detect_faces, extract_hinted_face
+from face_startup import warm_up
+
+logger = logging.getLogger(__name__)
+
+# يضبطها InferenceWorkerPool قبل fork فيرثها كل عامل دون تسلسل (pickle)
+_mtcnn = None
+_resnet = None
+
+
+def _init_worker(counter, threads_per_worker, pin_cpus, warmup_iterations):
+    """
+    تهيئة العامل: تثبيت خيوط torch وربطه بأنوية محددة ثم التسخين
+
+    Args:
+        counter: عداد مشترك لترقيم العمال
+        threads_per_worker: خيوط torch لكل عامل
+        pin_cpus: ربط كل عامل بمجموعة أنوية منفصلة
+        warmup_iterations: عدد مرات التسخين قبل أول مهمة
+    """
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+
+    torch.set_num_threads(threads_per_worker)
+    if pin_cpus and hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        start = index * threads_per_worker
+        if start + threads_per_worker <= len(cpus):
+            os.sched_setaffinity(0, cpus[start:start + threads_per_worker])
+
+    if warmup_iterations:
+        warm_up(_mtcnn, _resnet, warmup_iterations)
+    logger.info(f"عامل الاستدلال {index} جاهز (pid = {os.getpid()}, خيوط = {threads_per_worker})")
+
+
+def _embed_image_job(image_bytes, max_detection_edge, hint, keep_crop=False):
+    """
+    مهمة العامل: فك ترميز الصورة واقتصاص الوجه وتشفيره
+
+    Returns:
+        embedding: مصفوفة numpy بطول 512 أو None إذا لم يُكتشف وجه
+        hint_outcome: 'accepted' أو 'rejected' أو 'absent'
+        compute_ms: زمن المعالجة داخل العامل
+        crop: قصاصة الوجه uint8 عند keep_crop (ربع حجم float32 في النقل)، وإلا None
+    """
+    started = time.perf_counter()
+    decoded = decode_image(io.BytesIO(image_bytes), max_detection_edge)
+
+    face = None
+    if hint is None:
+        hint_outcome = 'absent'
+    else:
+        face = extract_hinted_face(_mtcnn, decoded, hint)
+        hint_outcome = 'rejected' if face is None else 'accepted'
+    if face is None:
+        face = detect_faces(_mtcnn, decoded)
+
+    embedding = None
+    crop = None
+    if face is not None:
+        with torch.no_grad():
+            embedding = _resnet(face.unsqueeze(0))[0].numpy()
+        if keep_crop:
+            crop = crops_to_uint8(face)
+    return embedding, hint_outcome, (time.perf_counter() - started) * 1000, crop
+
+
+class InferenceWorkerPool:
+    def __init__(self, mtcnn, resnet, workers, threads_per_worker=1, pin_cpus=True, warmup_iterations=0):
+        """
+        إنشاء العمال بـ fork
+
+        يجب إنشاؤها قبل تشغيل أي استدلال أو خيوط خلفية في العملية الأم،
+        وإلا قد يرث العامل مجمع خيوط torch في حالة غير صالحة.
+
+        Args:
+            mtcnn: كاشف الوجه (keep_all=False)
+            resnet: نموذج التشفير
+            workers: عدد العمليات
+            threads_per_worker: خيوط torch لكل عملية
+            pin_cpus: ربط كل عامل بأنويته (إذا كفت الأنوية)
+            warmup_iterations: عدد مرات تسخين كل عامل
+        """
+        global _mtcnn, _resnet
+        _mtcnn, _resnet = mtcnn, resnet
+
+        context = multiprocessing.get_context('fork')
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._pool = context.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(context.Value('i', 0), threads_per_worker, pin_cpus, warmup_iterations)
+        )
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._job_ms = SampleStats()
+        self._compute_ms = SampleStats()
+
+    def embed_image(self, image_bytes, max_detection_edge=None, hint=None, timeout=None, keep_crop=False):
+        """
+        تشفير الوجه في صورة داخل أحد العمال
+
+        Args:
+            image_bytes: بايتات الصورة كما وصلت في الطلب
+            max_detection_edge: أقصى ضلع لصورة الاكتشاف المصغرة
+            hint: مربع الوجه والمعالم من parse_face_hint أو None
+            timeout: أقصى انتظار بالثواني
+            keep_crop: إرجاع قصاصة الوجه أيضًا (لحفظها عند التسجيل)
+
+        Returns:
+            embedding: تشفير الوجه (512) أو None
+            hint_outcome: نتيجة استخدام مربع الوجه المرسل
+            face: قصاصة الوجه المطبّعة عند keep_crop، وإلا None
+        """
+        started = time.perf_counter()
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            embedding, hint_outcome, compute_ms, crop = self._pool.apply_async(
+                _embed_image_job, (image_bytes, max_detection_edge, hint, keep_crop)
+            ).get(timeout)
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+
+        self._job_ms.observe((time.perf_counter() - started) * 1000)
+        self._compute_ms.observe(compute_ms)
+
+        if embedding is not None:
+            embedding = torch.from_numpy(embedding)
+        face = crops_from_uint8(crop)[0] if crop is not None else None
+        return embedding, hint_outcome, face
+
+    def embed_images(self, images, max_detection_edge=None, timeout=None, keep_crop=False):
+        """
+        تشفير وجه كل صورة من عدة صور (لقطات طلب تسجيل واحد) موزعة على العمال معًا
+
+        Args:
+            images: قائمة بايتات الصور
+            max_detection_edge: أقصى ضلع لصورة الاكتشاف المصغرة
+            timeout: أقصى انتظار بالثواني لكل صورة
+            keep_crop: إرجاع قصاصات الوجوه أيضًا
+
+        Returns:
+            results: قائمة (تشفير أو None، قصاصة أو None) بترتيب الصور
+        """
+        started = time.perf_counter()
+        with self._stats_lock:
+            self._in_flight += len(images)
+        try:
+            jobs = [self._pool.apply_async(_embed_image_job, (image_bytes, max_detection_edge, None, keep_crop))
+                    for image_bytes in images]
+            outputs = [job.get(timeout) for job in jobs]
+        finally:
+            with self._stats_lock:
+                self._in_flight -= len(images)
+
+        job_ms = (time.perf_counter() - started) * 1000
+        results = []
+        for embedding, _, compute_ms, crop in outputs:
+            self._job_ms.observe(job_ms)
+            self._compute_ms.observe(compute_ms)
+            results.append((torch.from_numpy(embedding) if embedding is not None else None,
+                             crops_from_uint8(crop)[0] if crop is not None else None))
+        return results
+
+    def metrics(self):
+        """عدد المهام الجارية وزمن المهمة الكلي وزمن المعالجة داخل العامل"""
+        with self._stats_lock:
+            in_flight = self._in_flight
+        return {
+            'workers': self.workers,
+            'threads_per_worker': self.threads_per_worker,
+            'in_flight': in_flight,
+            'job_ms': self._job_ms.to_dict(),
+            'compute_ms': self._compute_ms.to_dict()
+        }
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
@@ -5,6 +5,13 @@ import logging
 import os
 import sys  # Add sys import
 import time
+import json
+import threading
+import queue
+import urllib.request
+from bisect import bisect_left, bisect_right
+from collections import Counter
+import click
 import jwt as pyjwt
 import datetime
 from datetime import timezone
@@ -32,7 +39,8 @@ def log_request_info():
 
 # إعداد قاعدة البيانات
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'database.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'database.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Add SECRET_KEY for JWT token generation
 app.config['SECRET_KEY'] = 'locate-me-secret-key'
@@ -111,8 +119,10 @@ class Course(db.Model):
     location = db.Column(db.String(100), nullable=True)
     isAttendanceOpen = db.Column(db.Boolean, default=False)
 
-    def to_dict(self):
-        students_count = StudentCourse.query.filter_by(course_id=self.id).count()
+    def to_dict(self, students_count=None):
+        # Lists pass counts from enrollment_counts() instead of one COUNT per course
+        if students_count is None:
+            students_count = StudentCourse.query.filter_by(course_id=self.id).count()
         return {
             'id': self.id,
             'code': self.code,
@@ -134,7 +144,26 @@ class StudentCourse(db.Model):
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
 
     # لضمان عدم تكرار تسجيل الطالب في نفس المقرر
-    __table_args__ = (db.UniqueConstraint('student_id', 'course_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id'),
+        # Rosters and enrollment counts look up by course
+        db.Index('ix_student_course_course_id_student_id', 'course_id', 'student_id'),
+    )
+
+def enrollment_counts(course_ids):
+    """Enrolled students per course for many courses in one grouped query"""
+    if not course_ids:
+        return {}
+    rows = db.session.query(StudentCourse.course_id, db.func.count(StudentCourse.id))\
+        .filter(StudentCourse.course_id.in_(course_ids))\
+        .group_by(StudentCourse.course_id)\
+        .all()
+    return dict(rows)
+
+def courses_to_dict(courses):
+    """Serialize a list of courses with a constant number of queries"""
+    counts = enrollment_counts([course.id for course in courses])
+    return [course.to_dict(students_count=counts.get(course.id, 0)) for course in courses]
 
 # Add after other models
 class StudentLocation(db.Model):
@@ -145,6 +174,11 @@ class StudentLocation(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.now(datetime.timezone.utc))
 
+    # Latest location check of a student for a course
+    __table_args__ = (
+        db.Index('ix_student_location_student_id_course_id_timestamp', 'student_id', 'course_id', 'timestamp'),
+    )
+
 # نموذج بيانات الحضور
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -159,12 +193,24 @@ class Attendance(db.Model):
     student = db.relationship('User', backref='attendances')
     course = db.relationship('Course', backref='attendances')
 
+    __table_args__ = (
+        # A course's attendance on one day (reports, lecture days, rollup upkeep)
+        db.Index('ix_attendance_course_id_date', 'course_id', 'date'),
+        # A student's attendance in a course (today's record, per-student history)
+        db.Index('ix_attendance_student_id_course_id_date', 'student_id', 'course_id', 'date'),
+    )
+
 # نموذج بيانات التعرف على الوجه
 class FaceRecognition(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.now(datetime.timezone.utc))
 
+    # Latest face verification of a student (SQLite reads the index backwards for DESC)
+    __table_args__ = (
+        db.Index('ix_face_recognition_student_id_timestamp', 'student_id', 'timestamp'),
+    )
+
 # نموذج بيانات جلسات المحاضرات
 class LectureSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -173,6 +219,609 @@ class LectureSession(db.Model):
     # Ensure only one session per course per day
     __table_args__ = (db.UniqueConstraint('course_id', 'date'),)
 
+# جداول التجميع: أيام الحضور المؤكد لكل (مقرر، طالب) وأيام المحاضرات لكل مقرر
+# تُحدَّث في نفس المعاملة مع كل كتابة على Attendance أو LectureSession (انظر
+# update_attendance_rollups)، فتصبح تقارير الفصل قراءة صف لكل طالب بدل المسح
+class AttendanceRollup(db.Model):
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    # Distinct dates with a face- and location-verified Attendance row
+    attended_days = db.Column(db.Integer, nullable=False, default=0)
+
+class LectureDayRollup(db.Model):
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    # Distinct dates with a LectureSession or any Attendance row
+    lecture_days = db.Column(db.Integer, nullable=False, default=0)
+
+# ترقيم أيام المحاضرات لكل مقرر وخريطة بتات لكل (مقرر، طالب): البت n مضبوط إذا
+# حضر الطالب يوم المحاضرة رقم n، فتُحسب نسبة أي فترة وسلاسل الغياب من البتات
+class LectureDay(db.Model):
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    # Bit position in AttendanceBitmap.bits, assigned in the order lecture days appear
+    number = db.Column(db.Integer, nullable=False)
+
+class AttendanceBitmap(db.Model):
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    # Little-endian bitset of attended LectureDay numbers (verified attendance only)
+    bits = db.Column(db.LargeBinary, nullable=False, default=b'')
+
+def bits_to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+def bits_from_bytes(data):
+    return int.from_bytes(data or b'', 'little')
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+def longest_run(bits):
+    """Length of the longest run of consecutive set bits"""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+# Columns of Attendance / LectureSession whose changes can move a rollup
+ATTENDANCE_ROLLUP_COLUMNS = ('course_id', 'student_id', 'date', 'face_verified', 'location_verified')
+LECTURE_ROLLUP_COLUMNS = ('course_id', 'date')
+
+def _flush_values(record, name):
+    """Every value a column holds in this flush: the new one and the stored one it replaces"""
+    values = {getattr(record, name), *db.inspect(record).attrs[name].history.deleted}
+    values.discard(None)
+    if not values:
+        # Not set yet: the column's scalar default is applied on INSERT
+        default = record.__table__.c[name].default
+        if default is not None and default.is_scalar:
+            values.add(default.arg)
+    if name in ('course_id', 'student_id'):
+        # Some routes pass ids straight from the query string
+        values = {int(value) for value in values}
+    return values
+
+def _rollup_changed(record, columns):
+    return any(db.inspect(record).attrs[name].history.has_changes() for name in columns)
+
+def verified_attendance_days(session, day_keys):
+    """The (course_id, student_id, date) keys that have a verified Attendance row"""
+    by_day = {}
+    for course_id, student_id, date in day_keys:
+        by_day.setdefault((course_id, date), set()).add(student_id)
+
+    present = set()
+    for (course_id, date), student_ids in by_day.items():
+        rows = session.query(Attendance.student_id).filter(
+            Attendance.course_id == course_id,
+            Attendance.date == date,
+            Attendance.face_verified.is_(True),
+            Attendance.location_verified.is_(True),
+            Attendance.student_id.in_(student_ids)
+        ).distinct()
+        present.update((course_id, row.student_id, date) for row in rows)
+    return present
+
+def held_lecture_days(session, lecture_keys):
+    """The (course_id, date) keys that count as lecture days (a session or any attendance)"""
+    present = set()
+    for course_id, date in lecture_keys:
+        if session.query(LectureSession.id).filter_by(course_id=course_id, date=date).first() or \
+                session.query(Attendance.id).filter_by(course_id=course_id, date=date).first():
+            present.add((course_id, date))
+    return present
+
+def _add_to_rollup(connection, model, column, key_names, deltas):
+    """
+    Add deltas to rollup counters in batches: one SELECT, one executemany
+    UPDATE and one executemany INSERT for counters seen for the first time.
+
+    Args:
+        deltas: {key tuple (in key_names order): change}
+    """
+    table = model.__table__
+    key_columns = [table.c[name] for name in key_names]
+    # Superset of the touched rows (IN per key column), narrowed by the set lookups below
+    existing = {tuple(row) for row in connection.execute(db.select(*key_columns).where(*(
+        key_column.in_({key[position] for key in deltas}) for position, key_column in enumerate(key_columns)
+    )))}
+
+    # Bound names must differ from the column names in an UPDATE
+    updates = [{**{'key_' + name: value for name, value in zip(key_names, key)}, 'delta': delta}
+               for key, delta in deltas.items() if key in existing]
+    inserts = [dict(zip(key_names, key), **{column: delta})
+               for key, delta in deltas.items() if key not in existing and delta > 0]
+    if updates:
+        connection.execute(
+            table.update()
+            .where(*(key_column == db.bindparam('key_' + name) for name, key_column in zip(key_names, key_columns)))
+            .values({column: table.c[column] + db.bindparam('delta')}),
+            updates
+        )
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+def number_lecture_days(connection, added):
+    """Give new lecture days the next bit numbers of their course, in date order"""
+    table = LectureDay.__table__
+    by_course = {}
+    for course_id, date in added:
+        by_course.setdefault(course_id, []).append(date)
+
+    rows = []
+    for course_id, dates in by_course.items():
+        last = connection.execute(db.select(db.func.max(table.c.number))
+                                  .where(table.c.course_id == course_id)).scalar()
+        first = 0 if last is None else last + 1
+        rows.extend({'course_id': course_id, 'date': date, 'number': first + offset}
+                    for offset, date in enumerate(sorted(dates)))
+    if rows:
+        connection.execute(table.insert(), rows)
+
+def update_attendance_bitmaps(connection, attended, missed):
+    """
+    Set the bits of days that became attended and clear those that no longer are.
+
+    Args:
+        attended, missed: sets of (course_id, student_id, date)
+    """
+    table = LectureDay.__table__
+    days = {(course_id, date) for course_id, student_id, date in attended | missed}
+    numbers = {
+        (row.course_id, row.date): row.number for row in connection.execute(
+            db.select(table.c.course_id, table.c.date, table.c.number).where(
+                table.c.course_id.in_({course_id for course_id, date in days}),
+                table.c.date.in_({date for course_id, date in days})
+            ))
+    }
+
+    set_masks, clear_masks = {}, {}
+    for masks, changed in ((set_masks, attended), (clear_masks, missed)):
+        for course_id, student_id, date in changed:
+            key = (course_id, student_id)
+            masks[key] = masks.get(key, 0) | 1 << numbers[(course_id, date)]
+    keys = set(set_masks) | set(clear_masks)
+
+    table = AttendanceBitmap.__table__
+    stored = {
+        (row.course_id, row.student_id): bits_from_bytes(row.bits) for row in connection.execute(
+            db.select(table).where(
+                table.c.course_id.in_({course_id for course_id, student_id in keys}),
+                table.c.student_id.in_({student_id for course_id, student_id in keys})
+            ))
+    }
+
+    updates, inserts = [], []
+    for key in keys:
+        bits = (stored.get(key, 0) | set_masks.get(key, 0)) & ~clear_masks.get(key, 0)
+        if key in stored:
+            updates.append({'key_course_id': key[0], 'key_student_id': key[1], 'new_bits': bits_to_bytes(bits)})
+        else:
+            inserts.append({'course_id': key[0], 'student_id': key[1], 'bits': bits_to_bytes(bits)})
+    if updates:
+        connection.execute(
+            table.update()
+            .where(table.c.course_id == db.bindparam('key_course_id'),
+                   table.c.student_id == db.bindparam('key_student_id'))
+            .values(bits=db.bindparam('new_bits')),
+            updates
+        )
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+@event.listens_for(db.session, 'before_flush')
+def collect_rollup_keys(session, flush_context, instances):
+    """
+    Record which attendance days and lecture days this flush touches, and
+    whether each one counted before the flush.
+
+    Routes insert and update Attendance / LectureSession rows in many places;
+    hooking the flush keeps the rollups in the same transaction as every one
+    of them. Query-level bulk update()/delete() bypass the hook.
+    """
+    session.info.pop('rollup_keys', None)
+    day_keys, lecture_keys = set(), set()
+
+    for record in [*session.new, *session.dirty, *session.deleted]:
+        if isinstance(record, Attendance):
+            if record in session.dirty and not _rollup_changed(record, ATTENDANCE_ROLLUP_COLUMNS):
+                continue
+            for course_id in _flush_values(record, 'course_id'):
+                for date in _flush_values(record, 'date'):
+                    lecture_keys.add((course_id, date))
+                    for student_id in _flush_values(record, 'student_id'):
+                        day_keys.add((course_id, student_id, date))
+        elif isinstance(record, LectureSession):
+            if record in session.dirty and not _rollup_changed(record, LECTURE_ROLLUP_COLUMNS):
+                continue
+            for course_id in _flush_values(record, 'course_id'):
+                for date in _flush_values(record, 'date'):
+                    lecture_keys.add((course_id, date))
+
+    if day_keys or lecture_keys:
+        session.info['rollup_keys'] = (day_keys, lecture_keys,
+                                       verified_attendance_days(session, day_keys),
+                                       held_lecture_days(session, lecture_keys))
+
+@event.listens_for(db.session, 'after_flush')
+def update_attendance_rollups(session, flush_context):
+    """Apply the +1/-1 changes of the keys collected before the flush"""
+    keys = session.info.pop('rollup_keys', None)
+    if not keys:
+        return
+    day_keys, lecture_keys, days_before, lectures_before = keys
+    days_after = verified_attendance_days(session, day_keys)
+    lectures_after = held_lecture_days(session, lecture_keys)
+
+    attended = Counter()
+    for course_id, student_id, date in days_after - days_before:
+        attended[(course_id, student_id)] += 1
+    for course_id, student_id, date in days_before - days_after:
+        attended[(course_id, student_id)] -= 1
+    lectures = Counter()
+    for course_id, date in lectures_after - lectures_before:
+        lectures[course_id] += 1
+    for course_id, date in lectures_before - lectures_after:
+        lectures[course_id] -= 1
+
+    connection = session.connection()
+    attended = {key: delta for key, delta in attended.items() if delta}
+    if attended:
+        _add_to_rollup(connection, AttendanceRollup, 'attended_days', ('course_id', 'student_id'), attended)
+    lectures = {(course_id,): delta for course_id, delta in lectures.items() if delta}
+    if lectures:
+        _add_to_rollup(connection, LectureDayRollup, 'lecture_days', ('course_id',), lectures)
+
+    # Bitmaps: number new lecture days first so their bits exist, and drop
+    # days no longer held last (no verified attendance can be left on them)
+    number_lecture_days(connection, lectures_after - lectures_before)
+    if days_after != days_before:
+        update_attendance_bitmaps(connection, days_after - days_before, days_before - days_after)
+    table = LectureDay.__table__
+    for course_id, date in lectures_before - lectures_after:
+        connection.execute(table.delete().where(table.c.course_id == course_id, table.c.date == date))
+
+    # In-memory indexes of these courses are dropped once the transaction commits
+    session.info.setdefault('attendance_index_courses', set()).update(
+        course_id for course_id, date in lecture_keys)
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_attendance_indexes(session):
+    for course_id in session.info.pop('attendance_index_courses', ()):
+        attendance_indexes.invalidate(course_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_attendance_index_courses(session):
+    session.info.pop('attendance_index_courses', None)
+
+def compute_attendance_rollups():
+    """
+    Rollup values recomputed from the raw Attendance and LectureSession rows.
+
+    Returns:
+        {(course_id, student_id): attended_days}, {course_id: lecture_days}
+    """
+    attended = db.session.query(Attendance.course_id, Attendance.student_id,
+                                db.func.count(db.distinct(Attendance.date)))\
+        .filter(Attendance.face_verified.is_(True), Attendance.location_verified.is_(True))\
+        .group_by(Attendance.course_id, Attendance.student_id)\
+        .all()
+
+    days = db.session.query(LectureSession.course_id.label('course_id'), LectureSession.date.label('date'))\
+        .union(db.session.query(Attendance.course_id.label('course_id'), Attendance.date.label('date')))\
+        .subquery()
+    lecture_days = db.session.query(days.c.course_id, db.func.count()).group_by(days.c.course_id).all()
+
+    return ({(course_id, student_id): count for course_id, student_id, count in attended},
+            {course_id: count for course_id, count in lecture_days})
+
+def compute_attendance_days():
+    """
+    Lecture dates and verified attendance dates from the raw rows.
+
+    Returns:
+        {course_id: sorted lecture dates}, {(course_id, student_id): set of attended dates}
+    """
+    days = db.session.query(LectureSession.course_id.label('course_id'), LectureSession.date.label('date'))\
+        .union(db.session.query(Attendance.course_id.label('course_id'), Attendance.date.label('date')))\
+        .subquery()
+    lecture_dates = {}
+    for course_id, date in db.session.query(days.c.course_id, days.c.date).order_by(days.c.course_id, days.c.date):
+        lecture_dates.setdefault(course_id, []).append(date)
+
+    attended_dates = {}
+    verified = db.session.query(Attendance.course_id, Attendance.student_id, Attendance.date)\
+        .filter(Attendance.face_verified.is_(True), Attendance.location_verified.is_(True))\
+        .distinct()
+    for course_id, student_id, date in verified:
+        attended_dates.setdefault((course_id, student_id), set()).add(date)
+    return lecture_dates, attended_dates
+
+def rebuild_attendance_rollups():
+    """Recompute the rollup and bitmap tables from scratch (backfill or repair)"""
+    # Delete first: on SQLite this takes the write lock, so no attendance write
+    # can land between the recount and the commit
+    AttendanceRollup.query.delete()
+    LectureDayRollup.query.delete()
+    LectureDay.query.delete()
+    AttendanceBitmap.query.delete()
+    attended, lecture_days = compute_attendance_rollups()
+    if attended:
+        db.session.execute(AttendanceRollup.__table__.insert(), [
+            {'course_id': course_id, 'student_id': student_id, 'attended_days': count}
+            for (course_id, student_id), count in attended.items()
+        ])
+    if lecture_days:
+        db.session.execute(LectureDayRollup.__table__.insert(), [
+            {'course_id': course_id, 'lecture_days': count} for course_id, count in lecture_days.items()
+        ])
+
+    # Rebuilt numbering follows date order, which lets indexes skip renumbering
+    lecture_dates, attended_dates = compute_attendance_days()
+    numbers = {(course_id, date): number for course_id, dates in lecture_dates.items()
+               for number, date in enumerate(dates)}
+    if numbers:
+        db.session.execute(LectureDay.__table__.insert(), [
+            {'course_id': course_id, 'date': date, 'number': number} for (course_id, date), number in numbers.items()
+        ])
+    if attended_dates:
+        db.session.execute(AttendanceBitmap.__table__.insert(), [
+            {'course_id': course_id, 'student_id': student_id,
+             'bits': bits_to_bytes(sum(1 << numbers[(course_id, date)] for date in dates))}
+            for (course_id, student_id), dates in attended_dates.items()
+        ])
+    db.session.commit()
+    attendance_indexes.clear()
+    return len(attended), len(lecture_days)
+
+def check_attendance_rollups():
+    """
+    Compare the rollup tables with the raw rows.
+
+    Returns:
+        list of mismatches, each {'table', 'key', 'stored', 'expected'}
+    """
+    attended, lecture_days = compute_attendance_rollups()
+    stored_attended = {(row.course_id, row.student_id): row.attended_days for row in AttendanceRollup.query.all()}
+    stored_lecture_days = {row.course_id: row.lecture_days for row in LectureDayRollup.query.all()}
+
+    mismatches = []
+    for table, expected, stored in (('attendance_rollup', attended, stored_attended),
+                                    ('lecture_day_rollup', lecture_days, stored_lecture_days)):
+        for key in sorted(set(expected) | set(stored)):
+            # A missing row and a zero counter mean the same thing
+            if expected.get(key, 0) != stored.get(key, 0):
+                mismatches.append({'table': table, 'key': key,
+                                   'stored': stored.get(key, 0), 'expected': expected.get(key, 0)})
+
+    # Bitmaps are compared as the dates they decode to; numbering may differ from a rebuild
+    lecture_dates, attended_dates = compute_attendance_days()
+    stored_dates, dates_by_number = {}, {}
+    for row in LectureDay.query.all():
+        stored_dates.setdefault(row.course_id, set()).add(row.date)
+        dates_by_number[(row.course_id, row.number)] = row.date
+    stored_attended_dates = {}
+    for row in AttendanceBitmap.query.all():
+        bits = bits_from_bytes(row.bits)
+        stored_attended_dates[(row.course_id, row.student_id)] = {
+            dates_by_number.get((row.course_id, number)) for number in range(bits.bit_length()) if bits >> number & 1
+        }
+    expected_dates = {course_id: set(dates) for course_id, dates in lecture_dates.items()}
+    for table, expected, stored in (('lecture_day', expected_dates, stored_dates),
+                                    ('attendance_bitmap', attended_dates, stored_attended_dates)):
+        for key in sorted(set(expected) | set(stored)):
+            if expected.get(key, set()) != stored.get(key, set()):
+                mismatches.append({'table': table, 'key': key,
+                                   'stored': sorted(str(date) for date in stored.get(key, set())),
+                                   'expected': sorted(str(date) for date in expected.get(key, set()))})
+    return mismatches
+
+class CourseAttendanceIndex:
+    """
+    A course's attendance bitmaps in memory, renumbered so bit i is the i-th
+    lecture day in date order: any date range is then a contiguous bit range,
+    percentages are masked popcounts and streaks are runs of bits.
+    """
+
+    def __init__(self, dates, bitmaps):
+        self.dates = dates        # Sorted lecture dates
+        self.bitmaps = bitmaps    # {student_id: bits}
+
+    @classmethod
+    def load(cls, course_id):
+        days = db.session.query(LectureDay.date, LectureDay.number)\
+            .filter(LectureDay.course_id == course_id)\
+            .order_by(LectureDay.date)\
+            .all()
+        numbers = [number for date, number in days]
+        # Days recorded out of date order (or removed) need their bits moved
+        in_order = numbers == list(range(len(numbers)))
+
+        bitmaps = {}
+        rows = db.session.query(AttendanceBitmap.student_id, AttendanceBitmap.bits)\
+            .filter(AttendanceBitmap.course_id == course_id)
+        for student_id, data in rows:
+            bits = bits_from_bytes(data)
+            if not in_order:
+                bits = sum(1 << position for position, number in enumerate(numbers) if bits >> number & 1)
+            bitmaps[student_id] = bits
+        return cls([date for date, number in days], bitmaps)
+
+    def lecture_range(self, date_from=None, date_to=None):
+        """Bit positions [start, end) of the lecture days inside an optional inclusive date range"""
+        start = bisect_left(self.dates, date_from) if date_from else 0
+        end = bisect_right(self.dates, date_to) if date_to else len(self.dates)
+        return start, max(start, end)
+
+    def attended_days(self, student_id, start, end):
+        return popcount(self.bitmaps.get(student_id, 0) & ((1 << end) - (1 << start)))
+
+    def student_stats(self, student_id, start, end):
+        """Attendance count and streaks of one student over lecture positions [start, end)"""
+        mask = (1 << end) - (1 << start)
+        attended = self.bitmaps.get(student_id, 0) & mask
+        missed = ~attended & mask
+        total = end - start
+        attended_count = popcount(attended)
+        return {
+            'attendance_count': attended_count,
+            'absence_count': total - attended_count,
+            'attendance_percentage': round(attended_count / total * 100, 2) if total else 0,
+            'longest_attendance_streak': longest_run(attended),
+            'longest_absence_streak': longest_run(missed),
+            # Lectures missed since the last one attended in the range
+            'current_absence_streak': end - max(attended.bit_length(), start)
+        }
+
+class AttendanceIndexCache:
+    """
+    CourseAttendanceIndex per course, loaded on first use and dropped when a
+    commit touches the course's attendance (see invalidate_attendance_indexes).
+
+    Invalidation is per process, which matches how the backend is run.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._generations = Counter()
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, course_id):
+        with self._lock:
+            index = self._indexes.get(course_id)
+            generation = (self._epoch, self._generations[course_id])
+        if index is None:
+            index = CourseAttendanceIndex.load(course_id)
+            with self._lock:
+                # A commit during the load may have changed what was read
+                if (self._epoch, self._generations[course_id]) == generation:
+                    self._indexes[course_id] = index
+        return index
+
+    def invalidate(self, course_id):
+        with self._lock:
+            self._indexes.pop(course_id, None)
+            self._generations[course_id] += 1
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._epoch += 1
+
+attendance_indexes = AttendanceIndexCache()
+
+# خادم التعرف على الوجه: يُرسل إليه طلاب كل مقرر عند تغييرهم ليقارن التحقق
+# بزملاء المقرر فقط (فارغ لتعطيل المزامنة)
+FACE_SERVER_URL = os.environ.get('FACE_SERVER_URL', '')
+# كل كم ثانية يُتحقق من أن الخادم لم يُعد تشغيله ولم يفشل إرسال سابق
+FACE_COHORT_SYNC_INTERVAL = int(os.environ.get('FACE_COHORT_SYNC_INTERVAL', 30))
+FACE_SERVER_RETRIES = 3
+
+# Run id of the face server at the last full sync, and whether a push failed since
+face_cohort_sync = {'instance_id': None, 'dirty': True}
+face_cohort_sync_lock = threading.Lock()
+# Held while a roster is read and sent, so the last push to land always
+# carries the latest committed roster (course pushes and full syncs alike)
+face_cohort_push_lock = threading.Lock()
+# Courses waiting for the single push worker; a course is queued once until sent
+face_cohort_queue = queue.Queue()
+face_cohort_pending = set()
+face_cohort_worker = None
+
+def face_server_request(method, path, payload=None, retries=FACE_SERVER_RETRIES):
+    """Call the face server, retrying with exponential backoff; returns the JSON response"""
+    for attempt in range(retries):
+        req = urllib.request.Request(
+            f"{FACE_SERVER_URL.rstrip('/')}{path}",
+            data=json.dumps(payload).encode() if payload is not None else None,
+            method=method,
+            headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=5) as response:
+                return json.loads(response.read() or b'{}')
+        except Exception:
+            if attempt == retries - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+def sync_face_cohort(course_id):
+    """Queue the course roster for a push to the face server (call after the commit)"""
+    global face_cohort_worker
+    if not FACE_SERVER_URL:
+        return
+    with face_cohort_sync_lock:
+        if face_cohort_worker is None:
+            face_cohort_worker = threading.Thread(target=push_face_cohorts, name='face-cohort-sync', daemon=True)
+            face_cohort_worker.start()
+        if course_id in face_cohort_pending:
+            return
+        face_cohort_pending.add(course_id)
+    face_cohort_queue.put(course_id)
+
+def push_face_cohorts():
+    """Push worker: sends queued courses one at a time, reading each roster when it is sent"""
+    while True:
+        course_id = face_cohort_queue.get()
+        with face_cohort_sync_lock:
+            # Removed before the read: a commit after this point queues the course again
+            face_cohort_pending.discard(course_id)
+        try:
+            with face_cohort_push_lock, app.app_context():
+                student_ids = [row.student_id for row in
+                               db.session.query(StudentCourse.student_id).filter_by(course_id=course_id).all()]
+                # مقرر بلا طلاب (أو محذوف) يُحذف من الخادم فيعود للمقارنة بالمعرض كاملًا
+                face_server_request('PUT' if student_ids else 'DELETE', f"/courses/{course_id}/cohort",
+                                    {'student_ids': student_ids} if student_ids else None)
+        except Exception as e:
+            logger.warning(f"Could not sync face cohort for course {course_id}, "
+                           f"a full sync will resend it: {e}")
+            with face_cohort_sync_lock:
+                face_cohort_sync['dirty'] = True
+
+def sync_all_face_cohorts():
+    """
+    Replace every course roster on the face server in one request.
+
+    Returns:
+        number of courses with enrolled students
+    """
+    with face_cohort_push_lock:
+        with face_cohort_sync_lock:
+            # Cleared before reading the rosters: a push that fails from here on
+            # marks the state dirty again for the next reconcile
+            face_cohort_sync['dirty'] = False
+        rosters = {}
+        for course_id, student_id in db.session.query(StudentCourse.course_id, StudentCourse.student_id)\
+                .order_by(StudentCourse.course_id, StudentCourse.student_id):
+            rosters.setdefault(str(course_id), []).append(student_id)
+        try:
+            response = face_server_request('PUT', '/courses/cohorts', {'courses': rosters})
+        except Exception:
+            with face_cohort_sync_lock:
+                face_cohort_sync['dirty'] = True
+            raise
+    with face_cohort_sync_lock:
+        face_cohort_sync['instance_id'] = response.get('instance_id')
+    logger.info(f"Synced face cohorts for {len(rosters)} courses")
+    return len(rosters)
+
+def reconcile_face_cohorts():
+    """Full sync after a failed push, on the first run, or when the face server restarted"""
+    if not FACE_SERVER_URL:
+        return
+    try:
+        with face_cohort_sync_lock:
+            dirty, instance_id = face_cohort_sync['dirty'], face_cohort_sync['instance_id']
+        if not dirty and face_server_request('GET', '/courses/cohorts', retries=1).get('instance_id') == instance_id:
+            return
+        with app.app_context():
+            sync_all_face_cohorts()
+    except Exception as e:
+        logger.warning(f"Could not reconcile face cohorts, retrying in {FACE_COHORT_SYNC_INTERVAL}s: {e}")
+
 # الراوترز
 @app.route('/', methods=['GET'])
 def health_check():
@@ -456,7 +1105,7 @@ def add_course():
         return jsonify({
             'success': True,
             'message': 'Course added successfully',
-            'course': new_course.to_dict()
+            'course': new_course.to_dict(students_count=0)
         }), 201
 
     except Exception as e:
@@ -496,7 +1145,7 @@ def get_doctor_courses(doctor_id):
 
         return jsonify({
             'success': True,
-            'courses': [course.to_dict() for course in courses]
+            'courses': courses_to_dict(courses)
         }), 200
 
     except Exception as e:
@@ -541,6 +1190,8 @@ def delete_course(course_id):
         db.session.delete(course)
         db.session.commit()
 
+        sync_face_cohort(course_id)
+
         return jsonify({
             'success': True,
             'message': 'Course deleted successfully'
@@ -630,6 +1281,8 @@ def enroll_in_course():
                 if retry_count >= max_retries:
                     raise
 
+        sync_face_cohort(course.id)
+
         return jsonify({
             'success': True,
             'message': 'Successfully enrolled in course',
@@ -675,7 +1328,7 @@ def get_student_courses(student_id):
 
         return jsonify({
             'success': True,
-            'courses': [course.to_dict() for course in courses]
+            'courses': courses_to_dict(courses)
         }), 200
 
     except Exception as e:
@@ -754,6 +1407,8 @@ def unenroll_from_course():
         db.session.delete(enrollment)
         db.session.commit()
 
+        sync_face_cohort(course_id)
+
         return jsonify({
             'success': True,
             'message': 'Unenrolled from course successfully'
@@ -1321,6 +1976,97 @@ def confirm_attendance():
             'message': f'Server error: {str(e)}'
         }), 500
 
+# Bulk attendance from a classroom photo matched by the face server
+@app.route('/doctor/classroom-attendance', methods=['POST'])
+def record_classroom_attendance():
+    try:
+        data = request.get_json()
+        course_id = data.get('course_id')
+        doctor_id = data.get('doctor_id')
+        student_ids = data.get('student_ids', [])
+
+        if not course_id or not doctor_id:
+            return jsonify({
+                'success': False,
+                'message': 'Missing course_id or doctor_id'
+            }), 400
+
+        course = db.session.get(Course, course_id)
+        if not course:
+            return jsonify({
+                'success': False,
+                'message': 'Course not found'
+            }), 404
+
+        # Only the course owner can record attendance from a classroom photo
+        if course.doctor_id != int(doctor_id):
+            return jsonify({
+                'success': False,
+                'message': 'Unauthorized: You can only record attendance for your own courses'
+            }), 403
+
+        student_ids = {int(student_id) for student_id in student_ids}
+        now = datetime.datetime.now(datetime.timezone.utc)
+        today = now.date()
+
+        # Keep only students enrolled in this course (one query)
+        enrolled_ids = {
+            row.student_id for row in db.session.query(StudentCourse.student_id).filter(
+                StudentCourse.course_id == course_id,
+                StudentCourse.student_id.in_(student_ids)
+            )
+        }
+
+        # Existing attendance rows for today (one query)
+        existing = {
+            record.student_id: record for record in Attendance.query.filter(
+                Attendance.course_id == course_id,
+                Attendance.date == today,
+                Attendance.student_id.in_(enrolled_ids)
+            )
+        }
+
+        if not LectureSession.query.filter_by(course_id=course_id, date=today).first():
+            db.session.add(LectureSession(course_id=course_id, date=today))
+
+        new_records = []
+        for student_id in enrolled_ids:
+            record = existing.get(student_id)
+            if record:
+                record.face_verified = True
+                record.location_verified = True
+                record.timestamp = now
+            else:
+                new_records.append(Attendance(
+                    student_id=student_id,
+                    course_id=course_id,
+                    face_verified=True,
+                    location_verified=True,
+                    date=today,
+                    timestamp=now
+                ))
+        db.session.add_all(new_records)
+        db.session.commit()
+
+        logger.info(f"Classroom attendance for course {course_id} on {today}: {len(new_records)} recorded, {len(existing)} updated")
+
+        return jsonify({
+            'success': True,
+            'course_id': course_id,
+            'date': today.strftime("%Y-%m-%d"),
+            'recorded': len(new_records),
+            'updated': len(existing),
+            'not_enrolled': sorted(student_ids - enrolled_ids)
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error recording classroom attendance: {e}")
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
 @app.route('/attendance/send-to-doctor', methods=['POST'])
 def send_attendance_to_doctor():
     try:
@@ -1711,6 +2457,90 @@ def get_course_attendance_by_date(course_id, date):
         app.logger.error(f"Error getting attendance records by date: {e}")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+def parse_date_arg(name):
+    """Optional YYYY-MM-DD query argument; raises ValueError on a bad format"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+def course_attendance_summary(course_id, date_from=None, date_to=None):
+    """
+    Attendance totals for every student enrolled in a course.
+
+    The whole-semester report reads the rollup tables (one row per student);
+    a date range is answered from the course's in-memory attendance bitmaps.
+
+    Returns:
+        total_lecture_days, list of per-student summaries
+    """
+    if date_from is None and date_to is None:
+        total_lecture_days, rows = rollup_attendance_summary(course_id)
+    else:
+        total_lecture_days, rows = ranged_attendance_summary(course_id, date_from, date_to)
+
+    students_summary = []
+    for user_id, student_number, name, attendance_count in rows:
+        students_summary.append({
+            'student_id': user_id,
+            'student_number': student_number,
+            'student_name': name,
+            'total_lectures': total_lecture_days,
+            'attendance_count': attendance_count,
+            'absence_count': total_lecture_days - attendance_count,
+            'attendance_percentage': round(attendance_count / total_lecture_days * 100, 2)
+        })
+
+    return total_lecture_days, students_summary
+
+def rollup_attendance_summary(course_id):
+    """Lecture days and (id, number, name, attended days) per enrolled student from the rollups"""
+    lecture_days = db.session.query(LectureDayRollup.lecture_days).filter_by(course_id=course_id).scalar() or 0
+
+    # Today always counts as a lecture day for an active course
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    if not held_lecture_days(db.session, {(course_id, today)}):
+        lecture_days += 1
+
+    rows = db.session.query(User.id, User.student_id, User.name,
+                            db.func.coalesce(AttendanceRollup.attended_days, 0))\
+        .join(StudentCourse, StudentCourse.student_id == User.id)\
+        .outerjoin(AttendanceRollup, db.and_(
+            AttendanceRollup.student_id == User.id,
+            AttendanceRollup.course_id == course_id
+        ))\
+        .filter(StudentCourse.course_id == course_id)\
+        .order_by(User.id)\
+        .all()
+    return lecture_days, rows
+
+def ranged_attendance_summary(course_id, date_from, date_to):
+    """Lecture days and (id, number, name, attended days) per enrolled student within a date range"""
+    index = attendance_indexes.get(course_id)
+    start, end = index.lecture_range(date_from, date_to)
+    lecture_days = end - start
+
+    # Today always counts as a lecture day for an active course (when inside the range)
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    if (not date_from or today >= date_from) and (not date_to or today <= date_to) \
+            and today not in index.dates[start:end]:
+        lecture_days += 1
+
+    # If we still have zero lecture days but the course exists, set it to at least 1
+    total_lecture_days = max(lecture_days, 1)
+
+    rows = [(user_id, student_number, name, index.attended_days(user_id, start, end))
+            for user_id, student_number, name in course_roster(course_id)]
+    return total_lecture_days, rows
+
+def course_roster(course_id):
+    """(id, student number, name) of every student enrolled in a course, by id"""
+    return db.session.query(User.id, User.student_id, User.name)\
+        .join(StudentCourse, StudentCourse.student_id == User.id)\
+        .filter(StudentCourse.course_id == course_id)\
+        .order_by(User.id)\
+        .all()
+
 @app.route('/doctor/course-attendance/summary', methods=['GET'])
 def get_course_attendance_summary():
     try:
@@ -1722,6 +2552,16 @@ def get_course_attendance_summary():
                 'message': 'Missing course_id parameter'
             }), 400
 
+        # Optional date range (inclusive)
+        try:
+            date_from = parse_date_arg('from')
+            date_to = parse_date_arg('to')
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid date format, use YYYY-MM-DD'
+            }), 400
+
         # Check if course exists
         course = Course.query.get(course_id)
         if not course:
@@ -1730,143 +2570,98 @@ def get_course_attendance_summary():
                 'message': 'Course not found'
             }), 404
 
-        # Get all students enrolled in the course
-        enrollments = StudentCourse.query.filter_by(course_id=course_id).all()
-        student_ids = [enrollment.student_id for enrollment in enrollments]
-
-        # Get student details
-        students = User.query.filter(User.id.in_(student_ids)).all()
+        total_lecture_days, students_summary = course_attendance_summary(course.id, date_from, date_to)
+        logger.info(f"Attendance summary for course {course_id}: {len(students_summary)} students, "
+                    f"{total_lecture_days} lecture days")
 
-        # Get unique lecture session dates (distinct dates from LectureSession table)
-        lecture_dates = db.session.query(LectureSession.date)\
-            .filter(LectureSession.course_id == course_id)\
-            .distinct()\
-            .all()
-
-        # Get unique attendance dates as well (in case there are attendances without lecture sessions)
-        attendance_dates = db.session.query(db.func.distinct(Attendance.date))\
-            .filter(Attendance.course_id == course_id)\
-            .all()
-
-        # Combine both sets of dates to get the total number of lecture days
-        all_dates = set()
-        for date_tuple in lecture_dates:
-            all_dates.add(date_tuple[0])
-        for date_tuple in attendance_dates:
-            all_dates.add(date_tuple[0])
-
-        total_lecture_days = len(all_dates)
-
-        # If we still have zero lecture days but the course exists, set it to at least 1
-        if total_lecture_days == 0:
-            total_lecture_days = 1
-
-        logger.info(f"Total lecture days for course {course_id}: {total_lecture_days}")
-
-        # Get today's date to check if there's a lecture today (use UTC to avoid timezone issues)
-        today = datetime.datetime.now(datetime.timezone.utc).date()
-        logger.info(f"Today's date (UTC): {today}")
-
-        if today not in all_dates:
-            # Check if there are any attendance records for today
-            today_attendance = db.session.query(Attendance)\
-                .filter(Attendance.course_id == course_id, Attendance.date == today)\
-                .first()
-            if today_attendance:
-                # If there are attendance records for today, add today to the lecture days
-                all_dates.add(today)
-                total_lecture_days = len(all_dates)
-                logger.info(f"Added today to lecture days. New total: {total_lecture_days}")
-            else:
-                # Even if there are no attendance records, we should still add today as a lecture day
-                # if the course is active
-                all_dates.add(today)
-                total_lecture_days = len(all_dates)
-                logger.info(f"Added today as a lecture day even without attendance. New total: {total_lecture_days}")
-
-        # Prepare student attendance summary
-        students_summary = []
-
-        for student in students:
-            # Get all attendance records for the student and course
-            # We'll count each unique date as one attendance
-            attendance_records = Attendance.query.filter(
-                Attendance.student_id == student.id,
-                Attendance.course_id == course_id
-            ).all()
-
-            # Log all attendance records for debugging
-            logger.info(f"Found {len(attendance_records)} total attendance records for student {student.id} in course {course_id}")
-            for record in attendance_records:
-                logger.info(f"Record: date={record.date}, face_verified={record.face_verified}, location_verified={record.location_verified}")
-
-            # Filter for verified records only
-            verified_records = [record for record in attendance_records if record.face_verified and record.location_verified]
-            logger.info(f"After filtering, found {len(verified_records)} verified attendance records")
-
-            # Use verified records for further processing
-            attendance_records = verified_records
-
-            # Get unique dates from attendance records
-            attended_dates = set()
-            for record in attendance_records:
-                attended_dates.add(record.date)
-
-            # This gives us the actual number of days the student attended
-            attendance_count = len(attended_dates)
-
-            # Log the attendance count for debugging
-            logger.info(f"Student {student.id} ({student.name}) has attended {attendance_count} days for course {course_id}")
-            logger.info(f"Attended dates: {attended_dates}")
-
-            # Make sure we have at least one lecture session
-            if total_lecture_days == 0 and attendance_count > 0:
-                # If we have attendance records but no lecture sessions, use the attendance count as total
-                total_lecture_days = attendance_count
-
-            # Check if the student has attended today
-            if today in attended_dates:
-                logger.info(f"Student {student.id} ({student.name}) has attended today!")
-            else:
-                logger.info(f"Student {student.id} ({student.name}) has NOT attended today.")
+        return jsonify({
+            'success': True,
+            'course_id': course_id,
+            'course_name': course.name,
+            'course_code': course.code,
+            'total_students': len(students_summary),
+            'total_lectures': total_lecture_days,
+            'from': date_from.isoformat() if date_from else None,
+            'to': date_to.isoformat() if date_to else None,
+            'students': students_summary
+        }), 200
 
-            # Calculate absence count
-            absence_count = total_lecture_days - attendance_count
+    except Exception as e:
+        logger.error(f"Error getting course attendance summary: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
 
-            # Calculate attendance percentage
-            attendance_percentage = (attendance_count / total_lecture_days * 100) if total_lecture_days > 0 else 0
+# Attendance over any date range with streaks, from the in-memory bitmaps
+@app.route('/doctor/course-attendance/analytics', methods=['GET'])
+def get_course_attendance_analytics():
+    try:
+        course_id = request.args.get('course_id')
+        student_id = request.args.get('student_id')  # Optional
 
-            # Add student data and attendance statistics
-            student_data = {
-                'student_id': student.id,
-                'student_number': student.student_id,  # Student number
-                'student_name': student.name,
-                'total_lectures': total_lecture_days,
-                'attendance_count': attendance_count,
-                'absence_count': absence_count,
-                'attendance_percentage': round(attendance_percentage, 2)
-            }
+        if not course_id:
+            return jsonify({
+                'success': False,
+                'message': 'Missing course_id parameter'
+            }), 400
 
-            # Log the student data for debugging
-            logger.info(f"Student data for {student.name}: {student_data}")
+        # Optional date range (inclusive)
+        try:
+            date_from = parse_date_arg('from')
+            date_to = parse_date_arg('to')
+            student_id = int(student_id) if student_id else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid date or student_id format'
+            }), 400
 
-            students_summary.append(student_data)
+        course = Course.query.get(course_id)
+        if not course:
+            return jsonify({
+                'success': False,
+                'message': 'Course not found'
+            }), 404
 
-        # Calculate overall attendance statistics for the course
-        total_students = len(students)
+        roster = course_roster(course.id)
+        if student_id is not None:
+            roster = [row for row in roster if row[0] == student_id]
+            if not roster:
+                return jsonify({
+                    'success': False,
+                    'message': 'Student not enrolled in this course'
+                }), 404
+
+        # Only lecture days actually held count here (no implicit "today")
+        index = attendance_indexes.get(course.id)
+        start, end = index.lecture_range(date_from, date_to)
+
+        students = []
+        for user_id, student_number, name in roster:
+            students.append({
+                'student_id': user_id,
+                'student_number': student_number,
+                'student_name': name,
+                **index.student_stats(user_id, start, end)
+            })
+        percentages = [student['attendance_percentage'] for student in students]
 
         return jsonify({
             'success': True,
-            'course_id': course_id,
+            'course_id': course.id,
             'course_name': course.name,
-            'course_code': course.code,
-            'total_students': total_students,
-            'total_lectures': total_lecture_days,
-            'students': students_summary
+            'from': date_from.isoformat() if date_from else None,
+            'to': date_to.isoformat() if date_to else None,
+            'total_lectures': end - start,
+            'first_lecture': index.dates[start].isoformat() if end > start else None,
+            'last_lecture': index.dates[end - 1].isoformat() if end > start else None,
+            'average_attendance_percentage': round(sum(percentages) / len(percentages), 2) if percentages else 0,
+            'students': students
         }), 200
 
     except Exception as e:
-        logger.error(f"Error getting course attendance summary: {e}")
+        logger.error(f"Error getting course attendance analytics: {e}")
         return jsonify({
             'success': False,
             'message': f'Server error: {str(e)}'
@@ -1903,6 +2698,33 @@ def get_network_interfaces():
 
     return interfaces
 
+@app.cli.command('sync-face-cohorts')
+def sync_face_cohorts_command():
+    """Push every course roster to the face server."""
+    if not FACE_SERVER_URL:
+        click.echo("FACE_SERVER_URL is not set")
+        sys.exit(1)
+    courses = sync_all_face_cohorts()
+    click.echo(f"Synced face cohorts for {courses} courses")
+
+@app.cli.command('rebuild-attendance-rollups')
+def rebuild_attendance_rollups_command():
+    """Backfill the attendance rollup and bitmap tables from the raw attendance rows."""
+    students, courses = rebuild_attendance_rollups()
+    click.echo(f"Rebuilt attendance rollups: {students} course/student rows, {courses} courses")
+
+@app.cli.command('check-attendance-rollups')
+def check_attendance_rollups_command():
+    """Report rollups and bitmaps that disagree with the raw attendance rows."""
+    mismatches = check_attendance_rollups()
+    for mismatch in mismatches:
+        click.echo(f"{mismatch['table']} {mismatch['key']}: stored {mismatch['stored']}, "
+                   f"expected {mismatch['expected']}")
+    if mismatches:
+        click.echo(f"{len(mismatches)} mismatches; run `flask rebuild-attendance-rollups`")
+        sys.exit(1)
+    click.echo("Attendance rollups are consistent")
+
 if __name__ == '__main__':
     try:
         # Mostrar información de las interfaces de red
@@ -1917,6 +2739,11 @@ if __name__ == '__main__':
             db.create_all()
             logger.info("Database initialized successfully")
 
+            # Existing databases get their rollups backfilled on the first start
+            if not LectureDay.query.first() and (LectureSession.query.first() or Attendance.query.first()):
+                students, courses = rebuild_attendance_rollups()
+                logger.info(f"Backfilled attendance rollups: {students} course/student rows, {courses} courses")
+
         # Add periodic cleanup to prevent database locking
         def cleanup_app():
             with app.app_context():
@@ -1930,6 +2757,9 @@ if __name__ == '__main__':
         from apscheduler.schedulers.background import BackgroundScheduler
         scheduler = BackgroundScheduler()
         scheduler.add_job(func=cleanup_app, trigger="interval", seconds=60)
+        # Full roster sync at startup, then again whenever a push failed or the face server restarted
+        scheduler.add_job(func=reconcile_face_cohorts, trigger="interval", seconds=FACE_COHORT_SYNC_INTERVAL,
+                          next_run_time=datetime.datetime.now())
         scheduler.start()
 
         # Run the application
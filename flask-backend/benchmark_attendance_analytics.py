@@ -0,0 +1,130 @@
+"""
+Benchmark for /doctor/course-attendance/analytics: date-range attendance and
+streaks from the in-memory bitmaps against a grouped scan of Attendance.
+
+Runs on a throwaway SQLite database:
+    python benchmark_attendance_analytics.py --students 1000 3000 --lecture-days 60
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Point the app at a temporary database before it is imported
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'benchmark.db')
+
+import logging
+
+from app import (app, db, attendance_indexes, rebuild_attendance_rollups, Attendance, Course,
+                 CourseAttendanceIndex, LectureSession, StudentCourse, User)
+
+
+def seed_course(index, students, lecture_days, attendance_rate):
+    """Bulk-insert a course's rows (bypassing the flush hook), then backfill the bitmaps"""
+    doctor = User(email=f'doctor{index}@example.com', password='x', student_id=f'D{index}',
+                  name=f'Doctor {index}', role='doctor')
+    db.session.add(doctor)
+    db.session.flush()
+    course = Course(name=f'Course {index}', code=f'C{index}', doctor_id=doctor.id,
+                    enrollment_code=f'E{index}')
+    db.session.add(course)
+    db.session.flush()
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    dates = [today - datetime.timedelta(days=2 * day) for day in range(lecture_days, 0, -1)]
+    db.session.execute(LectureSession.__table__.insert(),
+                       [{'course_id': course.id, 'date': date} for date in dates])
+
+    db.session.execute(User.__table__.insert(), [
+        {'email': f's{index}_{number}@example.com', 'password': 'x', 'student_id': f'S{index}_{number}',
+         'name': f'Student {number}', 'role': 'student'}
+        for number in range(students)
+    ])
+    student_ids = [row.id for row in db.session.query(User.id).filter(User.student_id.like(f'S{index}_%'))]
+    db.session.execute(StudentCourse.__table__.insert(),
+                       [{'student_id': student_id, 'course_id': course.id} for student_id in student_ids])
+
+    generator = random.Random(index)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    db.session.execute(Attendance.__table__.insert(), [
+        {'student_id': student_id, 'course_id': course.id, 'date': date, 'timestamp': now,
+         'face_verified': True, 'location_verified': True}
+        for student_id in student_ids for date in dates if generator.random() < attendance_rate
+    ])
+    db.session.commit()
+    rebuild_attendance_rollups()
+    return course.id, dates
+
+
+def scan_range(course_id, date_from, date_to):
+    """The query pattern without bitmaps: verified days per enrolled student for one range"""
+    return db.session.query(User.id, db.func.count(db.distinct(Attendance.date)))\
+        .join(StudentCourse, StudentCourse.student_id == User.id)\
+        .outerjoin(Attendance, db.and_(
+            Attendance.student_id == User.id,
+            Attendance.course_id == course_id,
+            Attendance.face_verified.is_(True),
+            Attendance.location_verified.is_(True),
+            Attendance.date >= date_from,
+            Attendance.date <= date_to
+        ))\
+        .filter(StudentCourse.course_id == course_id)\
+        .group_by(User.id)\
+        .all()
+
+
+def median_ms(function, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Attendance range analytics latency')
+    parser.add_argument('--students', type=int, nargs='+', default=[1000, 3000])
+    parser.add_argument('--lecture-days', type=int, default=60)
+    parser.add_argument('--attendance-rate', type=float, default=0.8)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    # The app logs every request at DEBUG; keep the benchmark output readable
+    logging.disable(logging.INFO)
+
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+
+        print(f"{'students':>8} {'load_ms':>8} {'stats_ms':>9} {'endpoint_ms':>12} {'scan_ms':>8}")
+        for index, students in enumerate(args.students):
+            course_id, dates = seed_course(index, students, args.lecture_days, args.attendance_rate)
+            # Second half of the semester ("since midterm")
+            date_from, date_to = dates[len(dates) // 2], dates[-1]
+
+            load_ms = median_ms(lambda: CourseAttendanceIndex.load(course_id), args.iterations)
+
+            course_index = attendance_indexes.get(course_id)
+            start, end = course_index.lecture_range(date_from, date_to)
+            stats_ms = median_ms(lambda: [course_index.student_stats(student_id, start, end)
+                                          for student_id in course_index.bitmaps], args.iterations)
+
+            def analytics():
+                response = client.get(f'/doctor/course-attendance/analytics?course_id={course_id}'
+                                      f'&from={date_from}&to={date_to}')
+                assert response.status_code == 200, response.get_json()
+
+            endpoint_ms = median_ms(analytics, args.iterations)
+            scan_ms = median_ms(lambda: scan_range(course_id, date_from, date_to), args.iterations)
+            print(f"{students:>8} {load_ms:>8.1f} {stats_ms:>9.1f} {endpoint_ms:>12.1f} {scan_ms:>8.1f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
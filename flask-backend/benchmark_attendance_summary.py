@@ -0,0 +1,123 @@
+"""
+Benchmark for /doctor/course-attendance/summary: number of SQL queries and
+latency as course enrollment grows, against the previous per-student loop.
+
+Runs on a throwaway SQLite database:
+    python benchmark_attendance_summary.py --students 10 100 300 1000
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Point the app at a temporary database before it is imported
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'benchmark.db')
+
+import logging
+from sqlalchemy import event
+
+from app import app, db, Attendance, Course, LectureSession, StudentCourse, User
+
+
+def seed_course(index, students, lecture_days, attendance_rate):
+    """Create a course with enrolled students, lecture sessions and attendance"""
+    doctor = User(email=f'doctor{index}@example.com', password='x', student_id=f'D{index}',
+                  name=f'Doctor {index}', role='doctor')
+    db.session.add(doctor)
+    db.session.flush()
+    course = Course(name=f'Course {index}', code=f'C{index}', doctor_id=doctor.id,
+                    enrollment_code=f'E{index}')
+    db.session.add(course)
+    db.session.flush()
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    dates = [today - datetime.timedelta(days=7 * week) for week in range(1, lecture_days + 1)]
+    db.session.add_all([LectureSession(course_id=course.id, date=date) for date in dates])
+
+    generator = random.Random(index)
+    for number in range(students):
+        student = User(email=f's{index}_{number}@example.com', password='x',
+                       student_id=f'S{index}_{number}', name=f'Student {number}', role='student')
+        db.session.add(student)
+        db.session.flush()
+        db.session.add(StudentCourse(student_id=student.id, course_id=course.id))
+        for date in dates:
+            if generator.random() < attendance_rate:
+                db.session.add(Attendance(student_id=student.id, course_id=course.id, date=date,
+                                          face_verified=True, location_verified=True))
+    db.session.commit()
+    return course.id
+
+
+def legacy_summary(course_id):
+    """The previous implementation's query pattern: one attendance query per student"""
+    student_ids = [enrollment.student_id for enrollment in StudentCourse.query.filter_by(course_id=course_id).all()]
+    students = User.query.filter(User.id.in_(student_ids)).all()
+    db.session.query(LectureSession.date).filter(LectureSession.course_id == course_id).distinct().all()
+    db.session.query(db.func.distinct(Attendance.date)).filter(Attendance.course_id == course_id).all()
+    result = {}
+    for student in students:
+        records = Attendance.query.filter(Attendance.student_id == student.id,
+                                          Attendance.course_id == course_id).all()
+        result[student.id] = len({record.date for record in records
+                                  if record.face_verified and record.location_verified})
+    return result
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def measure(counter, function, iterations):
+    """(queries per call, median milliseconds)"""
+    samples = []
+    counter.count = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return counter.count // iterations, samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Attendance summary query count and latency')
+    parser.add_argument('--students', type=int, nargs='+', default=[10, 100, 300, 1000])
+    parser.add_argument('--lecture-days', type=int, default=30)
+    parser.add_argument('--attendance-rate', type=float, default=0.8)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    # The app logs every request at DEBUG; keep the benchmark output readable
+    logging.disable(logging.INFO)
+
+    with app.app_context():
+        db.create_all()
+        counter = QueryCounter(db.engine)
+        client = app.test_client()
+
+        print(f"{'students':>8} {'queries':>8} {'ms':>8} {'legacy_q':>9} {'legacy_ms':>10}")
+        for index, students in enumerate(args.students):
+            course_id = seed_course(index, students, args.lecture_days, args.attendance_rate)
+
+            def summary():
+                response = client.get(f'/doctor/course-attendance/summary?course_id={course_id}')
+                assert response.status_code == 200, response.get_json()
+
+            queries, ms = measure(counter, summary, args.iterations)
+            legacy_queries, legacy_ms = measure(counter, lambda: legacy_summary(course_id), args.iterations)
+            print(f"{students:>8} {queries:>8} {ms:>8.1f} {legacy_queries:>9} {legacy_ms:>10.1f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
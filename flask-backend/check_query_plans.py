@@ -0,0 +1,186 @@
+"""
+Query plan regression check: drives the hot attendance endpoints against a
+seeded throwaway SQLite database, runs EXPLAIN QUERY PLAN on every statement
+they issue, and fails when one of them falls back to a full scan of a table
+that grows with the semester's history.
+
+    python check_query_plans.py             # exit code 1 on a full scan
+    python check_query_plans.py --verbose   # print every plan
+"""
+
+import argparse
+import datetime
+import os
+import random
+import re
+import sys
+import tempfile
+
+# Point the app at a temporary database before it is imported
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'query_plans.db')
+
+import logging
+from sqlalchemy import event
+
+from app import (app, db, rebuild_attendance_rollups, Attendance, Course, FaceRecognition, LectureSession,
+                 StudentCourse, StudentLocation, User)
+
+# Tables that grow with enrollments and every lecture; small lookup tables
+# (user, course) are not guarded
+GUARDED_TABLES = ('attendance', 'face_recognition', 'student_location', 'student_course', 'lecture_session',
+                  'attendance_rollup', 'lecture_day_rollup', 'lecture_day', 'attendance_bitmap')
+FULL_SCAN = re.compile(r'^SCAN (\w+?)(?:_\d+)?(?: |$)')
+
+
+def seed(courses, students, lecture_days, attendance_rate):
+    """Bulk-insert courses, students, lectures, attendance and verification history"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    today = now.date()
+    dates = [today - datetime.timedelta(days=7 * week) for week in range(lecture_days, 0, -1)]
+
+    db.session.execute(User.__table__.insert(), [
+        {'email': f'doctor{index}@example.com', 'password': 'x', 'student_id': f'D{index}',
+         'name': f'Doctor {index}', 'role': 'doctor'} for index in range(courses)
+    ] + [
+        {'email': f's{number}@example.com', 'password': 'x', 'student_id': f'S{number}',
+         'name': f'Student {number}', 'role': 'student'} for number in range(students)
+    ])
+    doctor_ids = [row.id for row in db.session.query(User.id).filter_by(role='doctor').order_by(User.id)]
+    student_ids = [row.id for row in db.session.query(User.id).filter_by(role='student').order_by(User.id)]
+
+    db.session.execute(Course.__table__.insert(), [
+        {'name': f'Course {index}', 'code': f'C{index}', 'doctor_id': doctor_id, 'enrollment_code': f'E{index}'}
+        for index, doctor_id in enumerate(doctor_ids)
+    ])
+    course_ids = [row.id for row in db.session.query(Course.id).order_by(Course.id)]
+
+    generator = random.Random(0)
+    enrollments = {course_id: generator.sample(student_ids, len(student_ids) // 2) for course_id in course_ids}
+    db.session.execute(StudentCourse.__table__.insert(), [
+        {'student_id': student_id, 'course_id': course_id}
+        for course_id, enrolled in enrollments.items() for student_id in enrolled
+    ])
+    db.session.execute(LectureSession.__table__.insert(), [
+        {'course_id': course_id, 'date': date} for course_id in course_ids for date in dates
+    ])
+    db.session.execute(Attendance.__table__.insert(), [
+        {'student_id': student_id, 'course_id': course_id, 'date': date, 'timestamp': now,
+         'face_verified': True, 'location_verified': True}
+        for course_id, enrolled in enrollments.items() for student_id in enrolled for date in dates
+        if generator.random() < attendance_rate
+    ])
+    # Verification history: several older records per student, the newest one fresh
+    db.session.execute(FaceRecognition.__table__.insert(), [
+        {'student_id': student_id, 'timestamp': now - datetime.timedelta(days=7 * age)}
+        for student_id in student_ids for age in range(lecture_days, -1, -1)
+    ])
+    db.session.execute(StudentLocation.__table__.insert(), [
+        {'student_id': student_id, 'course_id': course_id, 'latitude': 0.0, 'longitude': 0.0,
+         'timestamp': now - datetime.timedelta(days=7 * age)}
+        for course_id, enrolled in enrollments.items() for student_id in enrolled
+        for age in range(lecture_days, -1, -1)
+    ])
+    db.session.commit()
+    rebuild_attendance_rollups()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+    return course_ids[0], doctor_ids[0], enrollments[course_ids[0]], dates
+
+
+def hot_requests(course_id, doctor_id, enrolled, dates):
+    """(name, method, url, json) for the endpoints on the attendance hot path"""
+    student_id = enrolled[0]
+    return [
+        ('verify', 'POST', '/attendance/verify',
+         {'student_id': student_id, 'course_id': course_id, 'face_verified': True, 'location_verified': True}),
+        ('confirm', 'POST', '/attendance/confirm', {'student_id': enrolled[1], 'course_id': course_id}),
+        ('classroom', 'POST', '/doctor/classroom-attendance',
+         {'course_id': course_id, 'doctor_id': doctor_id, 'student_ids': enrolled[:20]}),
+        ('course attendance', 'GET', f'/doctor/course-attendance?course_id={course_id}&date={dates[-1]}', None),
+        ('attendance by date', 'GET', f'/attendance/course/{course_id}/date/{dates[-1]}', None),
+        ('send to doctor', 'POST', '/attendance/send-to-doctor', {'course_id': course_id, 'date': str(dates[-1])}),
+        ('attendance dates', 'GET', f'/doctor/course-attendance/dates?course_id={course_id}', None),
+        ('summary', 'GET', f'/doctor/course-attendance/summary?course_id={course_id}', None),
+        ('summary range', 'GET',
+         f'/doctor/course-attendance/summary?course_id={course_id}&from={dates[len(dates) // 2]}', None),
+        ('analytics', 'GET', f'/doctor/course-attendance/analytics?course_id={course_id}&from={dates[0]}', None),
+        ('course students', 'GET', f'/courses/{course_id}/students', None),
+        ('student courses', 'GET', f'/courses/student/{student_id}', None),
+        ('doctor courses', 'GET', f'/courses/doctor/{doctor_id}', None),
+    ]
+
+
+class StatementRecorder:
+    """Collects the statements the app sends to the database"""
+
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            # EXPLAIN one parameter set of an executemany
+            self.statements.append((statement, parameters[0] if executemany else parameters))
+
+
+def full_scans(plan):
+    """Guarded tables the plan reads in full"""
+    tables = []
+    for detail in plan:
+        match = FULL_SCAN.match(detail)
+        if match and match.group(1) in GUARDED_TABLES:
+            tables.append(match.group(1))
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN QUERY PLAN check for the hot attendance queries')
+    parser.add_argument('--courses', type=int, default=5)
+    parser.add_argument('--students', type=int, default=400)
+    parser.add_argument('--lecture-days', type=int, default=14)
+    parser.add_argument('--attendance-rate', type=float, default=0.8)
+    parser.add_argument('--verbose', action='store_true', help='print every statement and its plan')
+    args = parser.parse_args()
+
+    # The app logs every request at DEBUG; keep the report readable
+    logging.disable(logging.INFO)
+
+    failures = []
+    with app.app_context():
+        db.create_all()
+        course_id, doctor_id, enrolled, dates = seed(args.courses, args.students, args.lecture_days,
+                                                     args.attendance_rate)
+        client = app.test_client()
+        recorder = StatementRecorder(db.engine)
+
+        for name, method, url, body in hot_requests(course_id, doctor_id, enrolled, dates):
+            recorder.statements.clear()
+            response = client.open(url, method=method, json=body)
+            assert response.status_code < 400, (name, response.status_code, response.get_json())
+
+            # Plans are taken after the request; they do not depend on the rows it wrote
+            explained = []
+            for statement, parameters in recorder.statements:
+                rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+                explained.append((statement, [row[-1] for row in rows]))
+            db.session.rollback()
+
+            scans = [(statement, plan, full_scans(plan)) for statement, plan in explained]
+            failed = [scan for scan in scans if scan[2]]
+            print(f"{'FAIL' if failed else 'ok':<4} {name:<20} {len(explained):>3} statements")
+            for statement, plan, tables in (scans if args.verbose else failed):
+                print(f"     {' '.join(statement.split())[:160]}")
+                for detail in plan:
+                    print(f"       {detail}")
+            failures.extend((name, table) for statement, plan, tables in failed for table in tables)
+
+    if failures:
+        print(f"\n{len(failures)} full scans: " + ', '.join(f'{name} ({table})' for name, table in failures))
+        return 1
+    print("\nNo full scans of guarded tables")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""attendance indexes
+
+Revision ID: 890e72d9f555
+Revises: 6cff9a683eee
+Create Date: 2026-10-17 20:35:31.634870
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '890e72d9f555'
+down_revision = '6cff9a683eee'
+branch_labels = None
+depends_on = None
+
+
+# Existing databases predate these indexes; databases created by db.create_all()
+# after they were added to the models already have them
+INDEXES = [
+    ('ix_attendance_course_id_date', 'attendance', ['course_id', 'date']),
+    ('ix_attendance_student_id_course_id_date', 'attendance', ['student_id', 'course_id', 'date']),
+    ('ix_student_course_course_id_student_id', 'student_course', ['course_id', 'student_id']),
+    ('ix_face_recognition_student_id_timestamp', 'face_recognition', ['student_id', 'timestamp']),
+    ('ix_student_location_student_id_course_id_timestamp', 'student_location',
+     ['student_id', 'course_id', 'timestamp']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
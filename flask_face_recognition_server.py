@@ -2,18 +2,34 @@
 خادم Flask للتعرف على الوجه باستخدام PyTorch وFaceNet
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify
 from flask_cors import CORS
 import torch
 import numpy as np
-from PIL import Image
 import io
 import base64
 import os
-import json
+import atexit
 import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from facenet_pytorch import MTCNN, InceptionResnetV1
+from face_gallery import (FaceGallery, ImpostorCohorts, TemplateBank, match_faces_to_roster,
+                          normalize_embedding, pairwise_similarity, template_key)
+from face_crop_store import CropStore
+from face_embedding_store import (GALLERY_MODEL_FILE, GALLERY_QUANTIZED_MODEL_FILE, EmbeddingStore,
+                                  active_gallery_directory)
+from face_reembed import catch_up
+from face_inference_scheduler import InferenceScheduler
+from face_ann_index import IVFIndex
+from face_startup import StartupState, configure_threads, warm_up
+from face_metrics import Histogram, SampleStats, render_gauge
+from face_preprocessing import decode_image, detect_faces, detect_faces_batch, extract_hinted_face, parse_face_hint
+from face_worker_pool import InferenceWorkerPool
+from face_jobs import JobQueue, JobQueueFull
 
 # إعداد التسجيل
 logging.basicConfig(
@@ -22,71 +38,514 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# زمن كل مرحلة من مراحل بدء التشغيل وحالة الجاهزية
+startup_state = StartupState()
+
+# تثبيت خيوط torch قبل أي عملية متوازية (0 يترك القيمة الافتراضية)
+INTRA_OP_THREADS = int(os.environ.get('FACE_INTRA_OP_THREADS', 0))
+INTER_OP_THREADS = int(os.environ.get('FACE_INTER_OP_THREADS', 0))
+with startup_state.phase('threads'):
+    configure_threads(INTRA_OP_THREADS, INTER_OP_THREADS)
+
 app = Flask(__name__)
 CORS(app)
 
+# زمن كل مرحلة (decode، detect، embed، match...) لصفحة /metrics بصيغة Prometheus
+stage_seconds = Histogram('face_stage_duration_seconds', 'Time spent in each face pipeline stage', 'stage')
+request_seconds = Histogram('face_request_duration_seconds', 'Face server request latency', 'endpoint')
+requests_in_flight = 0
+requests_in_flight_lock = threading.Lock()
+# إضافة الترويسة Server-Timing بأزمنة المراحل إلى كل استجابة
+SERVER_TIMING = os.environ.get('FACE_SERVER_TIMING', '0') == '1'
+
+@contextmanager
+def stage_timer(stage):
+    """توقيت مرحلة وتسجيلها في المدرج وفي Server-Timing للطلب الحالي"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(stage, elapsed)
+        if has_request_context():
+            g.setdefault('stage_timings', []).append((stage, elapsed))
+
+@app.before_request
+def start_request_timer():
+    global requests_in_flight
+    g.request_started = time.perf_counter()
+    with requests_in_flight_lock:
+        requests_in_flight += 1
+
+@app.after_request
+def add_server_timing(response):
+    if SERVER_TIMING and g.get('stage_timings'):
+        response.headers['Server-Timing'] = ', '.join(
+            f'{stage};dur={elapsed * 1000:.1f}' for stage, elapsed in g.stage_timings
+        )
+    return response
+
+@app.teardown_request
+def finish_request_timer(exception=None):
+    global requests_in_flight
+    with requests_in_flight_lock:
+        requests_in_flight -= 1
+    if 'request_started' in g:
+        request_seconds.observe(request.endpoint or 'unknown', time.perf_counter() - g.request_started)
+
 # مسارات الملفات
 MODELS_DIR = 'models'
 DATA_DIR = 'data'
-EMBEDDINGS_FILE = os.path.join(DATA_DIR, 'face_embeddings.json')
+# ملف JSON القديم يُستورد مرة واحدة إلى المخزن الثنائي
+LEGACY_EMBEDDINGS_FILE = os.path.join(DATA_DIR, 'face_embeddings.json')
+# عدد سجلات الإلحاق التي يُضغط بعدها المخزن في الخلفية
+EMBEDDINGS_COMPACT_EVERY = int(os.environ.get('FACE_EMBEDDINGS_COMPACT_EVERY', 1000))
+# نموذج TorchScript مجمد جاهز مسبقًا (python face_startup.py freeze)
+FROZEN_MODEL_PATH = os.environ.get('FACE_FROZEN_MODEL_PATH', os.path.join(MODELS_DIR, 'facenet_model.frozen.pt'))
+# عند التفعيل لا يُحمّل النموذج إلا من الملف المجمد، دون تنزيل أو تتبع عند الإقلاع
+REQUIRE_FROZEN_MODEL = os.environ.get('FACE_REQUIRE_FROZEN_MODEL', '0') == '1'
+# دقة نموذج التشفير: 'fp32' أو 'int8' (نموذج مكمم مسبقًا: python face_quantization.py)
+EMBEDDER_PRECISION = os.environ.get('FACE_EMBEDDER_PRECISION', 'fp32')
+QUANTIZED_MODEL_PATH = os.environ.get('FACE_QUANTIZED_MODEL_PATH', os.path.join(MODELS_DIR, 'facenet_model.int8.pt'))
+QUANTIZED_ENGINE = os.environ.get('FACE_QUANTIZED_ENGINE', 'x86')
+# إصدار نموذج التشفير؛ التشفيرات المرسلة من التطبيق يجب أن تحمل نفس إصدار المعرض
+MODEL_VERSION = os.environ.get('FACE_MODEL_VERSION', 'inception-resnet-v1-vggface2')
+EMBEDDING_DIM = 512
+# إصدار المعرض النشط: مجلد البيانات نفسه، أو إصدار بناه face_reembed.py
+# بنموذج جديد (يُحمّل النموذج المحفوظ معه لأن تشفيراته لا تصح مع غيره)
+GALLERY_DIR = active_gallery_directory(DATA_DIR)
+GALLERY_MODEL_PATH = os.path.join(GALLERY_DIR, GALLERY_MODEL_FILE)
+GALLERY_QUANTIZED_MODEL_PATH = os.path.join(GALLERY_DIR, GALLERY_QUANTIZED_MODEL_FILE)
+# عدد مرات تسخين الكاشف والنموذج قبل الإعلان عن الجاهزية
+WARMUP_ITERATIONS = int(os.environ.get('FACE_WARMUP_ITERATIONS', 3))
 
 # إنشاء المجلدات إذا لم تكن موجودة
 os.makedirs(MODELS_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# أقصى طول لضلع الصورة المصغرة التي يعمل عليها الكاشف (0 للدقة الأصلية)
+MAX_DETECTION_EDGE = int(os.environ.get('FACE_MAX_DETECTION_EDGE', 800))
+CLASSROOM_MAX_DETECTION_EDGE = int(os.environ.get('FACE_CLASSROOM_MAX_DETECTION_EDGE', 1600))
+
+# أصغر وجه يُكتشف في صور الفصل (الوجوه فيها أصغر من صور السيلفي)
+CLASSROOM_MIN_FACE_SIZE = int(os.environ.get('FACE_CLASSROOM_MIN_FACE_SIZE', 20))
+
 # تهيئة نماذج التعرف على الوجه
-mtcnn = MTCNN(
-    image_size=160, 
-    margin=20,
-    keep_all=False,
-    min_face_size=40,
-    thresholds=[0.6, 0.7, 0.8],
-    factor=0.709,
-    post_process=True,
-    device='cpu'  # استخدم 'cuda' إذا كان متاحًا
-)
+with startup_state.phase('detector'):
+    mtcnn = MTCNN(
+        image_size=160, 
+        margin=20,
+        keep_all=False,
+        min_face_size=40,
+        thresholds=[0.6, 0.7, 0.8],
+        factor=0.709,
+        post_process=True,
+        device='cpu'  # استخدم 'cuda' إذا كان متاحًا
+    )
+
+    # كاشف الصور الجماعية: يُرجع كل الوجوه بدل الوجه الأفضل فقط
+    classroom_mtcnn = MTCNN(
+        image_size=160, 
+        margin=20,
+        keep_all=True,
+        min_face_size=CLASSROOM_MIN_FACE_SIZE,
+        thresholds=[0.6, 0.7, 0.8],
+        factor=0.709,
+        post_process=True,
+        device='cpu'
+    )
+
+# عدد القصاصات في كل تمريرة للنموذج عند معالجة صور الفصل
+CLASSROOM_EMBED_BATCH_SIZE = 64
 
 # تحميل نموذج InceptionResnetV1 المدرب مسبقًا
 model_path = os.path.join(MODELS_DIR, 'facenet_model.pt')
-if os.path.exists(model_path):
-    logger.info(f"تحميل النموذج من {model_path}")
-    resnet = torch.jit.load(model_path)
-else:
-    logger.info("تحميل نموذج InceptionResnetV1 المدرب مسبقًا")
-    resnet = InceptionResnetV1(pretrained='vggface2').eval()
-    
-    # تصدير النموذج لاستخدامه لاحقًا
-    dummy_input = torch.randn(1, 3, 160, 160)
-    traced_script_module = torch.jit.trace(resnet, dummy_input)
-    traced_script_module.save(model_path)
-    logger.info(f"تم حفظ النموذج في {model_path}")
+with startup_state.phase('embedder'):
+    if os.path.exists(GALLERY_MODEL_PATH):
+        # تشفيرات المعرض المعاد تشفيره لا تصح إلا مع نموذجه أو نسخته المكممة
+        MODEL_VERSION = EmbeddingStore(GALLERY_DIR).model_version() or MODEL_VERSION
+        if EMBEDDER_PRECISION == 'int8':
+            if not os.path.exists(GALLERY_QUANTIZED_MODEL_PATH):
+                raise RuntimeError(f"لا يوجد نموذج مكمم لإصدار المعرض {MODEL_VERSION}: "
+                                   f"{GALLERY_QUANTIZED_MODEL_PATH} (face_reembed.py --quantized-model)")
+            logger.info(f"تحميل نموذج المعرض المكمم (int8) من {GALLERY_QUANTIZED_MODEL_PATH}")
+            torch.backends.quantized.engine = QUANTIZED_ENGINE
+            resnet = torch.jit.load(GALLERY_QUANTIZED_MODEL_PATH).eval()
+        else:
+            logger.info(f"تحميل نموذج المعرض من {GALLERY_MODEL_PATH}")
+            resnet = torch.jit.load(GALLERY_MODEL_PATH).eval()
+    elif EMBEDDER_PRECISION == 'int8':
+        if not os.path.exists(QUANTIZED_MODEL_PATH):
+            raise RuntimeError(f"النموذج المكمم غير موجود: {QUANTIZED_MODEL_PATH}")
+        logger.info(f"تحميل النموذج المكمم (int8) من {QUANTIZED_MODEL_PATH}")
+        torch.backends.quantized.engine = QUANTIZED_ENGINE
+        resnet = torch.jit.load(QUANTIZED_MODEL_PATH).eval()
+    elif os.path.exists(FROZEN_MODEL_PATH):
+        logger.info(f"تحميل النموذج المجمد من {FROZEN_MODEL_PATH}")
+        resnet = torch.jit.load(FROZEN_MODEL_PATH).eval()
+    elif REQUIRE_FROZEN_MODEL:
+        raise RuntimeError(f"النموذج المجمد غير موجود: {FROZEN_MODEL_PATH}")
+    elif os.path.exists(model_path):
+        logger.info(f"تحميل النموذج من {model_path}")
+        resnet = torch.jit.load(model_path)
+    else:
+        logger.info("تحميل نموذج InceptionResnetV1 المدرب مسبقًا")
+        resnet = InceptionResnetV1(pretrained='vggface2').eval()
+        
+        # تصدير النموذج لاستخدامه لاحقًا
+        dummy_input = torch.randn(1, 3, 160, 160)
+        traced_script_module = torch.jit.trace(resnet, dummy_input)
+        traced_script_module.save(model_path)
+        logger.info(f"تم حفظ النموذج في {model_path}")
+
+# عمليات استدلال مستقلة لطلبات الوجه الواحد (0 يُبقي الاستدلال داخل خيوط Flask)؛
+# تُنشأ بـ fork بعد تحميل النموذج وقبل أي استدلال أو خيوط خلفية
+INFERENCE_WORKERS = int(os.environ.get('FACE_INFERENCE_WORKERS', 0))
+WORKER_THREADS = int(os.environ.get('FACE_WORKER_THREADS', 1))
+WORKER_PIN_CPUS = os.environ.get('FACE_WORKER_PIN_CPUS', '1') == '1'
+inference_pool = None
+if INFERENCE_WORKERS > 0:
+    with startup_state.phase('worker_pool'):
+        inference_pool = InferenceWorkerPool(
+            mtcnn, resnet, INFERENCE_WORKERS,
+            threads_per_worker=WORKER_THREADS,
+            pin_cpus=WORKER_PIN_CPUS,
+            warmup_iterations=WARMUP_ITERATIONS
+        )
+    atexit.register(inference_pool.close)
+
+# تجميع قصاصات الوجوه من الطلبات المتزامنة في دفعات لتمريرة واحدة للنموذج
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get('FACE_INFERENCE_MAX_BATCH_SIZE', 16))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('FACE_INFERENCE_MAX_WAIT_MS', 5))
+inference_scheduler = InferenceScheduler(
+    resnet,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=INFERENCE_MAX_WAIT_MS
+).start()
+
+# مهام التسجيل والتحقق غير المتزامنة (/jobs/...)
+JOB_WORKERS = int(os.environ.get('FACE_JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('FACE_JOB_MAX_PENDING', 256))
+JOB_TTL_SECONDS = float(os.environ.get('FACE_JOB_TTL_SECONDS', 300))
+JOB_MAX_WAIT_SECONDS = 30
+JOB_RETRY_AFTER_SECONDS = 2
+face_jobs = JobQueue(JOB_WORKERS, JOB_MAX_PENDING, JOB_TTL_SECONDS).start()
+
+# عدة قوالب لكل طالب: أقصى عدد وسياسة الاستبدال وطريقة حساب التشابه ('max' أو 'centroid')
+MAX_TEMPLATES = int(os.environ.get('FACE_MAX_TEMPLATES', 5))
+TEMPLATE_EVICTION = os.environ.get('FACE_TEMPLATE_EVICTION', 'oldest')
+TEMPLATE_SCORING = os.environ.get('FACE_TEMPLATE_SCORING', 'max')
 
 # تحميل تشفيرات الوجوه المخزنة
-face_embeddings = {}
-if os.path.exists(EMBEDDINGS_FILE):
+with startup_state.phase('gallery'):
+    embedding_store = EmbeddingStore(GALLERY_DIR, compact_every=EMBEDDINGS_COMPACT_EVERY)
+    # قصاصات الوجوه المسجلة لإعادة تشفير المعرض بنموذج جديد (face_reembed.py)
+    crop_store = CropStore(DATA_DIR)
+    # حالة المخزن: {مفتاح القالب: تشفير}
+    face_embeddings = {}
+    templates = TemplateBank(max_templates=MAX_TEMPLATES, eviction=TEMPLATE_EVICTION)
+    # مركز قوالب كل طالب مع مجموعها التراكمي لحساب هامش الأمان
+    gallery = FaceGallery()
+    try:
+        # اقتطاع سجل قصاصات انقطعت كتابته قبل أي إلحاق جديد
+        crop_store.index()
+    except Exception as e:
+        logger.error(f"خطأ في فحص مخزن القصاصات: {e}")
+    try:
+        # تسجيلات وصلت الخادم القديم بعد بناء هذا الإصدار أو تفعيله
+        caught_up = catch_up(resnet, crop_store, embedding_store)
+        if caught_up:
+            logger.info(f"تم تشفير {caught_up} قالب سُجل بعد بناء المعرض {GALLERY_DIR}")
+    except Exception as e:
+        logger.error(f"خطأ في تشفير القوالب المسجلة بعد بناء المعرض: {e}")
     try:
-        with open(EMBEDDINGS_FILE, 'r') as f:
-            data = json.load(f)
-            for student_id, embedding_list in data.items():
-                face_embeddings[student_id] = torch.tensor(embedding_list)
-        logger.info(f"تم تحميل {len(face_embeddings)} تشفير وجه من {EMBEDDINGS_FILE}")
+        if not embedding_store.exists() and os.path.exists(LEGACY_EMBEDDINGS_FILE):
+            embedding_store.import_json(LEGACY_EMBEDDINGS_FILE)
+        face_embeddings = templates.load(embedding_store.load())
+        if len(templates):
+            gallery.add_many(templates.ids, templates.centroids)
+        logger.info(f"تم تحميل {len(face_embeddings)} قالب وجه لـ {len(templates)} طالب من {embedding_store.directory}")
     except Exception as e:
         logger.error(f"خطأ في تحميل تشفيرات الوجوه: {e}")
+    
+    # إصدار النموذج الذي سُجلت به تشفيرات المعرض
+    gallery_model_version = embedding_store.model_version()
+    if gallery_model_version is None or not face_embeddings:
+        gallery_model_version = MODEL_VERSION
+        embedding_store.set_model_version(MODEL_VERSION)
+    elif gallery_model_version != MODEL_VERSION:
+        logger.warning(f"المعرض مسجل بالنموذج {gallery_model_version} بينما النموذج المحمل {MODEL_VERSION}")
+
+# مجموعات المقارنة لهامش الأمان: زملاء المقرر بدل كل طلاب الجامعة. قوائم
+# طلاب كل مقرر يرسلها الخادم الخلفي عند التسجيل وإلغاء التسجيل، و
+# FACE_IMPOSTOR_COHORT_SIZE > 0 يحد المجموعة بعينة ثابتة بهذا الحجم
+IMPOSTOR_COHORT_SIZE = int(os.environ.get('FACE_IMPOSTOR_COHORT_SIZE', 0))
+impostor_cohorts = ImpostorCohorts(gallery, IMPOSTOR_COHORT_SIZE)
+
+# معرف هذا التشغيل: يتغير مع كل إعادة تشغيل فيعرف الخادم الخلفي أن القوائم
+# فُقدت ويعيد إرسالها كاملة
+INSTANCE_ID = uuid.uuid4().hex
+
+# فهرس تقريبي للبحث عن هوية الوجه في المعرض كاملًا (1:N)
+IDENTIFY_N_PROBE = int(os.environ.get('FACE_IDENTIFY_N_PROBE', 8))
+IDENTIFY_MAX_TOP_K = 20
+ann_index = IVFIndex(n_probe=IDENTIFY_N_PROBE)
+with startup_state.phase('ann_index'):
+    ann_index.build(gallery.ids, gallery.matrix)
+
+def _warm_up_models():
+    """تسخين الكاشف والنموذج في الخلفية ثم إعلان الجاهزية على /health"""
+    try:
+        with startup_state.phase('warmup'):
+            warm_up(mtcnn, resnet, WARMUP_ITERATIONS, batch_sizes=(1, INFERENCE_MAX_BATCH_SIZE))
+        startup_state.mark_ready()
+    except Exception as e:
+        startup_state.mark_failed(e)
+
+threading.Thread(target=_warm_up_models, name='warmup', daemon=True).start()
 
 # عتبات التشابه
 SIMILARITY_THRESHOLD = 0.80
 SECURITY_MARGIN = 0.30
+# أقصى عدد لقطات في طلب تسجيل واحد
+REGISTRATION_MAX_IMAGES = 10
 
-def save_embeddings():
-    """حفظ تشفيرات الوجوه في ملف"""
-    data = {}
-    for student_id, embedding in face_embeddings.items():
-        data[student_id] = embedding.tolist()
+def save_embedding(key, embedding):
+    """إلحاق تشفير وجه (بمفتاح القالب) بالمخزن وضغطه في الخلفية عند الحاجة"""
+    embedding_store.append(key, embedding)
+    
+    if embedding_store.needs_compaction():
+        threading.Thread(
+            target=embedding_store.compact,
+            args=(face_embeddings,),
+            daemon=True
+        ).start()
+
+# حقول البيانات التي تُرسل في الترويسات مع جسم صورة خام (image/jpeg)
+IMAGE_METADATA_HEADERS = {
+    'student_id': 'X-Student-Id',
+    'course_id': 'X-Course-Id',
+    'student_ids': 'X-Student-Ids',
+    'top_k': 'X-Top-K',
+    'face_box': 'X-Face-Box',
+    'landmarks': 'X-Face-Landmarks'
+}
+# حقول طلب التحقق بتشفير محسوب على الجهاز مع جسم application/octet-stream
+EMBEDDING_METADATA_HEADERS = {
+    'student_id': 'X-Student-Id',
+    'course_id': 'X-Course-Id',
+    'model_version': 'X-Model-Version'
+}
+# حقول القوائم: مفصولة بفواصل في الترويسات أو حقول متكررة في multipart
+LIST_FIELDS = ('student_ids',)
+
+# حجم الطلب وزمن قراءته وفك ترميز الصورة لكل صيغة رفع
+UPLOAD_PATHS = ('json', 'multipart', 'raw')
+upload_request_bytes = {path: SampleStats() for path in UPLOAD_PATHS}
+upload_decode_ms = {path: SampleStats() for path in UPLOAD_PATHS}
+
+def _split_list(values):
+    """تفكيك قيم القوائم المرسلة كنص مفصول بفواصل"""
+    return [item for value in values for item in str(value).split(',') if item]
+
+def read_image_request(multiple=False, max_detection_edge=MAX_DETECTION_EDGE, decode=True):
+    """
+    قراءة بيانات الطلب والصور بأي من الصيغ المدعومة: JSON مع صور base64
+    (للإصدارات القديمة من التطبيق)، أو multipart/form-data، أو جسم صورة
+    خام (image/jpeg) مع البيانات في الترويسات
+    
+    Args:
+        multiple: قراءة عدة صور (الحقل images) بدل صورة واحدة (الحقل image)
+        max_detection_edge: أقصى ضلع للنسخة المصغرة المستخدمة في الاكتشاف
+        decode: فك ترميز الصور هنا؛ بدونه تُرجع البايتات لتُفك في عامل استدلال
+        
+    Returns:
+        data: قاموس حقول الطلب
+        image: DecodedImage أو بايتات أو None (قائمة عند multiple)
+    """
+    started = time.perf_counter()
+    field = 'images' if multiple else 'image'
+    
+    if request.mimetype == 'multipart/form-data':
+        path = 'multipart'
+        data = request.form.to_dict()
+        for key in LIST_FIELDS:
+            if key in request.form:
+                data[key] = _split_list(request.form.getlist(key))
+        # قراءة الملف مباشرة من مخزن werkzeug دون نسخة base64 وسيطة
+        sources = [upload.stream for upload in request.files.getlist(field)]
+    elif request.mimetype.startswith('image/'):
+        path = 'raw'
+        data = {
+            key: request.headers[header]
+            for key, header in IMAGE_METADATA_HEADERS.items() if header in request.headers
+        }
+        for key in LIST_FIELDS:
+            if key in data:
+                data[key] = _split_list([data[key]])
+        body = request.get_data(cache=False)
+        sources = [io.BytesIO(body)] if body else []
+    else:
+        path = 'json'
+        data = request.json
+        encoded = data.get(field) or []
+        if not multiple:
+            encoded = [encoded] if encoded else []
+        sources = [io.BytesIO(base64.b64decode(image_data)) for image_data in encoded]
+    
+    if decode:
+        with stage_timer('decode'):
+            images = [decode_image(source, max_detection_edge) for source in sources]
+    else:
+        images = [source.read() for source in sources]
+    
+    upload_request_bytes[path].observe(request.content_length or 0)
+    upload_decode_ms[path].observe((time.perf_counter() - started) * 1000)
+    
+    if multiple:
+        return data, images
+    return data, images[0] if images else None
+
+# عدد الطلبات التي استُخدم فيها مربع الوجه المرسل من التطبيق أو رُفض
+face_hint_counts = {'accepted': 0, 'rejected': 0, 'absent': 0}
+face_hint_lock = threading.Lock()
+
+def detect_request_face(data, image):
+    """
+    اقتصاص الوجه من المربع والمعالم المرسلة من التطبيق (face_box و landmarks)
+    إذا اجتازت الفحص، وإلا تشغيل MTCNN كاملًا
+    
+    Args:
+        data: قاموس حقول الطلب
+        image: DecodedImage
+        
+    Returns:
+        face: قصاصة الوجه أو None
+    """
+    face = None
+    if data.get('face_box') is None:
+        outcome = 'absent'
+    else:
+        hint = parse_face_hint(data['face_box'], data.get('landmarks'))
+        if hint is not None:
+            with stage_timer('hint'):
+                face = extract_hinted_face(mtcnn, image, hint)
+        outcome = 'rejected' if face is None else 'accepted'
+    
+    count_face_hint(outcome)
+    
+    if face is None:
+        with stage_timer('detect'):
+            face = detect_faces(mtcnn, image)
+    return face
+
+def count_face_hint(outcome):
+    with face_hint_lock:
+        face_hint_counts[outcome] += 1
+
+def embed_request_face(data, image, keep_crop=False):
+    """
+    تشفير وجه الطلب: في عمال الاستدلال إذا كانوا مفعلين، وإلا بالاقتصاص هنا
+    ثم التشفير ضمن دفعة مشتركة مع الطلبات المتزامنة
+    
+    Args:
+        data: قاموس حقول الطلب
+        image: DecodedImage، أو بايتات الصورة عند تفعيل العمال
+        keep_crop: إرجاع قصاصة الوجه من العمال أيضًا (لحفظها عند التسجيل)
+        
+    Returns:
+        embedding: تشفير الوجه أو None إذا لم يُكتشف وجه
+        face: قصاصة الوجه المحاذاة (قد تكون None من العمال دون keep_crop)
+    """
+    if inference_pool is None:
+        face = detect_request_face(data, image)
+        if face is None:
+            return None, None
+        with stage_timer('embed'):
+            return inference_scheduler.embed(face), face
+    
+    hint = None
+    if data.get('face_box') is not None:
+        hint = parse_face_hint(data['face_box'], data.get('landmarks'))
+    # فك الترميز والاكتشاف والتشفير كلها داخل العامل
+    with stage_timer('worker'):
+        embedding, outcome, face = inference_pool.embed_image(image, MAX_DETECTION_EDGE, hint,
+                                                              keep_crop=keep_crop)
+    if hint is None and data.get('face_box') is not None:
+        outcome = 'rejected'
+    count_face_hint(outcome)
+    return embedding, face
+
+def embed_registration_faces(images):
+    """
+    تشفير وجه واحد من كل لقطة في طلب تسجيل: موزعة على عمال الاستدلال إذا
+    كانوا مفعلين، وإلا باكتشاف دفعي هنا ثم التشفير عبر المجدول مع الطلبات
+    المتزامنة، فلا يشغّل خيط Flask النموذج بنفسه
+    
+    Args:
+        images: قائمة DecodedImage، أو بايتات الصور عند تفعيل العمال
+        
+    Returns:
+        embeddings: تشفيرات الوجوه المكتشفة (N x 512) أو None إذا لم يُكتشف وجه
+        faces: قصاصات الوجوه المحاذاة (N x 3 x 160 x 160)
+    """
+    if inference_pool is None:
+        with stage_timer('detect'):
+            faces = [face for face in detect_faces_batch(mtcnn, images) if face is not None]
+        if len(faces) == 0:
+            return None, None
+        with stage_timer('embed'):
+            futures = [inference_scheduler.submit(face) for face in faces]
+            embeddings = [future.result() for future in futures]
+    else:
+        with stage_timer('worker'):
+            results = [(embedding, face) for embedding, face in
+                       inference_pool.embed_images(images, MAX_DETECTION_EDGE, keep_crop=True)
+                       if embedding is not None]
+        if len(results) == 0:
+            return None, None
+        embeddings, faces = zip(*results)
+    return torch.stack(embeddings), torch.stack(faces)
+
+def read_embedding_request():
+    """
+    قراءة تشفير محسوب على الجهاز: JSON بحقل embedding (قائمة أو base64
+    لـ float32 little-endian) أو جسم application/octet-stream بطول 2048 بايت
+    مع البيانات في الترويسات
+    
+    Returns:
+        data: قاموس حقول الطلب
+        embedding: تشفير بطول EMBEDDING_DIM
+        
+    Raises:
+        ValueError: إذا كان التشفير مفقودًا أو بطول غير صحيح أو قيم غير منتهية
+    """
+    if request.mimetype == 'application/octet-stream':
+        data = {
+            key: request.headers[header]
+            for key, header in EMBEDDING_METADATA_HEADERS.items() if header in request.headers
+        }
+        encoded = request.get_data(cache=False)
+    else:
+        data = request.json
+        encoded = data.get('embedding')
+        if isinstance(encoded, str):
+            encoded = base64.b64decode(encoded)
     
-    with open(EMBEDDINGS_FILE, 'w') as f:
-        json.dump(data, f)
+    if encoded is None or len(encoded) == 0:
+        raise ValueError('التشفير مطلوب')
+    if isinstance(encoded, (bytes, bytearray)):
+        if len(encoded) != EMBEDDING_DIM * 4:
+            raise ValueError(f'طول التشفير يجب أن يكون {EMBEDDING_DIM * 4} بايت')
+        embedding = torch.from_numpy(np.frombuffer(encoded, dtype='<f4').copy())
+    else:
+        embedding = torch.tensor(encoded, dtype=torch.float32).reshape(-1)
     
-    logger.info(f"تم حفظ {len(data)} تشفير وجه في {EMBEDDINGS_FILE}")
+    if embedding.shape[0] != EMBEDDING_DIM:
+        raise ValueError(f'طول التشفير يجب أن يكون {EMBEDDING_DIM}')
+    if not torch.isfinite(embedding).all() or embedding.norm() == 0:
+        raise ValueError('قيم التشفير غير صالحة')
+    return data, embedding
 
 def calculate_similarity(embedding1, embedding2):
     """حساب التشابه بين تشفيرين"""
@@ -104,48 +563,109 @@ def calculate_similarity(embedding1, embedding2):
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """التحقق من حالة الخادم"""
+    """التحقق من حالة الخادم (جاهز فقط بعد انتهاء التسخين)"""
+    state = startup_state.to_dict()
+    if state['ready']:
+        status = 'ok'
+    else:
+        status = 'error' if state['error'] else 'starting'
+    
+    # إصدار فعّله face_reembed.py بعد إقلاع الخادم: يُحمّل عند إعادة التشغيل
+    active_directory = active_gallery_directory(DATA_DIR)
     return jsonify({
-        'status': 'ok',
+        'status': status,
+        'startup': state,
+        'model_version': gallery_model_version,
+        'pending_gallery': active_directory if active_directory != GALLERY_DIR else None,
         'timestamp': datetime.now(timezone.utc).isoformat()
-    })
+    }), 200 if state['ready'] else 503
+
+@app.route('/inference/metrics', methods=['GET'])
+def inference_metrics():
+    """مقاييس مجدول الاستدلال: عمق قائمة الانتظار وأحجام الدفعات، وعمال الاستدلال إن وجدوا"""
+    metrics = inference_scheduler.metrics()
+    if inference_pool is not None:
+        metrics['worker_pool'] = inference_pool.metrics()
+    return jsonify(metrics)
+
+@app.route('/upload/metrics', methods=['GET'])
+def upload_metrics():
+    """حجم الطلبات وزمن فك ترميز الصور لكل صيغة رفع، ونتائج مربعات الوجه المرسلة"""
+    metrics = {
+        path: {
+            'request_bytes': upload_request_bytes[path].to_dict(),
+            'decode_ms': upload_decode_ms[path].to_dict()
+        }
+        for path in UPLOAD_PATHS
+    }
+    with face_hint_lock:
+        metrics['face_hints'] = dict(face_hint_counts)
+    return jsonify(metrics)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """كل المقاييس بصيغة نص Prometheus: أزمنة المراحل والطلبات، والطوابير، وحجم المعرض، وزمن بدء التشغيل"""
+    state = startup_state.to_dict()
+    lines = stage_seconds.render() + request_seconds.render()
+    lines += render_gauge('face_requests_in_flight', 'Requests currently being handled', requests_in_flight)
+    lines += render_gauge('face_inference_queue_depth', 'Faces waiting for a batched forward pass',
+                          inference_scheduler.metrics()['queue_depth'])
+    lines += render_gauge('face_jobs_queued', 'Async jobs waiting for a worker', face_jobs.metrics()['queue_depth'])
+    if inference_pool is not None:
+        lines += render_gauge('face_worker_pool_in_flight', 'Images being processed by inference workers',
+                              inference_pool.metrics()['in_flight'])
+    lines += render_gauge('face_gallery_students', 'Registered students', len(templates))
+    lines += render_gauge('face_gallery_templates', 'Stored face templates', len(face_embeddings))
+    lines += render_gauge('face_cohort_courses', 'Courses with a synced impostor cohort', impostor_cohorts.course_count)
+    lines += render_gauge('face_startup_phase_seconds', 'Duration of each startup phase (model load, warm-up...)',
+                          state['phases'], 'phase')
+    lines += render_gauge('face_ready', 'Whether warm-up has finished', state['ready'])
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def register_embedding(student_id, embedding, faces=None):
+    """
+    إضافة قالب للطالب وتحديث مركزه في المعرض والفهرس وحفظه
+    
+    Args:
+        student_id: معرف الطالب
+        embedding: تشفير القالب
+        faces: القصاصات التي حُسب منها التشفير، تُحفظ لإعادة التشفير لاحقًا
+    """
+    slot = templates.add(student_id, embedding)
+    key = template_key(student_id, slot)
+    if faces is not None:
+        crop_store.append(key, faces)
+    face_embeddings[key] = embedding
+    gallery.add(student_id, templates.centroid(student_id))
+    impostor_cohorts.invalidate(student_id)
+    ann_index.add(student_id, gallery.row(student_id))
+    
+    # حفظ التشفير
+    save_embedding(key, embedding)
 
 @app.route('/register-face', methods=['POST'])
 def register_face():
     """تسجيل وجه جديد"""
     try:
-        data = request.json
+        data, image = read_image_request(decode=inference_pool is None)
         student_id = data.get('student_id')
-        image_data = data.get('image')
         
-        if not student_id or not image_data:
+        if not student_id or image is None:
             return jsonify({
                 'success': False,
                 'message': 'معرف الطالب والصورة مطلوبان'
             }), 400
         
-        # فك تشفير الصورة
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # اكتشاف الوجه واستخراج التشفير
-        face = mtcnn(image)
+        # اقتصاص الوجه من المربع المرسل أو اكتشافه واستخراج التشفير
+        embedding, face = embed_request_face(data, image, keep_crop=True)
         
-        if face is None:
+        if embedding is None:
             return jsonify({
                 'success': False,
                 'message': 'لم يتم اكتشاف وجه في الصورة'
             }), 400
         
-        # الحصول على التشفير
-        with torch.no_grad():
-            embedding = resnet(face.unsqueeze(0))[0]
-        
-        # تخزين التشفير
-        face_embeddings[student_id] = embedding
-        
-        # حفظ التشفيرات
-        save_embeddings()
+        register_embedding(student_id, embedding, face)
         
         return jsonify({
             'success': True,
@@ -159,80 +679,455 @@ def register_face():
             'message': f'خطأ في الخادم: {str(e)}'
         }), 500
 
+@app.route('/register-face/batch', methods=['POST'])
+def register_face_batch():
+    """تسجيل وجه من عدة لقطات في طلب واحد (اكتشاف دفعي وتمريرة واحدة للنموذج)"""
+    try:
+        data, images = read_image_request(multiple=True, decode=inference_pool is None)
+        student_id = data.get('student_id')
+        
+        if not student_id or len(images) == 0:
+            return jsonify({
+                'success': False,
+                'message': 'معرف الطالب والصور مطلوبة'
+            }), 400
+        
+        if len(images) > REGISTRATION_MAX_IMAGES:
+            return jsonify({
+                'success': False,
+                'message': f'الحد الأقصى {REGISTRATION_MAX_IMAGES} صور'
+            }), 400
+        
+        # وجه واحد من كل لقطة
+        embeddings, faces = embed_registration_faces(images)
+        
+        if embeddings is None:
+            return jsonify({
+                'success': False,
+                'message': 'لم يتم اكتشاف وجه في الصور'
+            }), 400
+        
+        # التحقق من أن جميع اللقطات لنفس الشخص
+        _, min_similarity = pairwise_similarity(embeddings)
+        if min_similarity < SIMILARITY_THRESHOLD:
+            return jsonify({
+                'success': False,
+                'message': 'الصور لا تنتمي لنفس الشخص',
+                'min_similarity': min_similarity
+            }), 400
+        
+        register_embedding(student_id, embeddings.mean(dim=0), faces)
+        
+        return jsonify({
+            'success': True,
+            'message': 'تم تسجيل الوجه بنجاح',
+            'images_received': len(images),
+            'faces_detected': len(faces),
+            'min_similarity': min_similarity
+        })
+    
+    except Exception as e:
+        logger.error(f"خطأ في تسجيل الوجه من عدة صور: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في الخادم: {str(e)}'
+        }), 500
+
+def score_verification(student_id, embedding, course_id=None):
+    """
+    مقارنة تشفير بالوجه المسجل للطالب وبمتوسط تشابهه مع زملائه
+    
+    Args:
+        student_id: معرف الطالب المُدّعى
+        embedding: تشفير الوجه
+        course_id: المقرر الذي يُحسب مع طلابه هامش الأمان؛ None أو مقرر لم
+            تُرسل قائمة طلابه يقارن بالمعرض كاملًا (أو بعينة منه)
+    
+    Returns:
+        result: نتيجة التحقق كما تُرجعها نقاط التحقق
+    """
+    with stage_timer('match'):
+        # حساب التشابه مع قوالب الطالب المسجلة (أعلاها أو المركز) وتحويله إلى نطاق 0-1
+        similarity = (templates.score(student_id, embedding, TEMPLATE_SCORING) + 1) / 2
+        
+        # حساب متوسط التشابه مع باقي طلاب المقرر (أو المعرض)
+        avg_other_similarity = impostor_cohorts.mean_similarity(
+            embedding, student_id, None if course_id is None else str(course_id))
+    
+    # إذا لم تكن هناك وجوه أخرى مسجلة، نستخدم فقط عتبة التشابه
+    if avg_other_similarity is None:
+        verified = similarity >= SIMILARITY_THRESHOLD
+    else:
+        # التحقق من أن التشابه مع الوجه المسجل أعلى بكثير من التشابه مع الوجوه الأخرى
+        verified = (similarity >= SIMILARITY_THRESHOLD) and (similarity > avg_other_similarity + SECURITY_MARGIN)
+    
+    logger.info(f"التحقق من الوجه للطالب {student_id}: التشابه = {similarity:.4f}, النتيجة = {verified}")
+    
+    return {
+        'success': True,
+        'verified': verified,
+        'similarity': similarity,
+        'threshold': SIMILARITY_THRESHOLD,
+        'security_margin': SECURITY_MARGIN
+    }
+
 @app.route('/attendance/verify-face', methods=['POST'])
 def verify_face():
     """التحقق من وجه الطالب"""
     try:
-        data = request.json
+        data, image = read_image_request(decode=inference_pool is None)
         student_id = data.get('student_id')
-        image_data = data.get('image')
         
-        if not student_id or not image_data:
+        if not student_id or image is None:
             return jsonify({
                 'success': False,
                 'message': 'معرف الطالب والصورة مطلوبان'
             }), 400
         
         # التحقق من وجود تشفير مسجل للطالب
-        if student_id not in face_embeddings:
+        if student_id not in templates:
             return jsonify({
                 'success': False,
                 'message': 'لم يتم تسجيل وجه لهذا الطالب'
             }), 400
         
-        # فك تشفير الصورة
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
+        # اقتصاص الوجه من المربع المرسل أو اكتشافه واستخراج التشفير
+        embedding, _ = embed_request_face(data, image)
         
-        # اكتشاف الوجه واستخراج التشفير
-        face = mtcnn(image)
+        if embedding is None:
+            return jsonify({
+                'success': False,
+                'message': 'لم يتم اكتشاف وجه في الصورة'
+            }), 400
         
-        if face is None:
+        # تسجيل التحقق في قاعدة البيانات
+        # (هنا يمكن إضافة كود لتسجيل عملية التحقق في قاعدة البيانات)
+        
+        return jsonify(score_verification(student_id, embedding, data.get('course_id')))
+    
+    except Exception as e:
+        logger.error(f"خطأ في التحقق من الوجه: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في الخادم: {str(e)}'
+        }), 500
+
+@app.route('/attendance/verify-embedding', methods=['POST'])
+def verify_embedding():
+    """التحقق من تشفير حسبه التطبيق بالنموذج المصدَّر (مطابقة فقط دون تمريرة للنموذج)"""
+    try:
+        try:
+            data, embedding = read_embedding_request()
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        student_id = data.get('student_id')
+        model_version = data.get('model_version')
+        
+        if not student_id or not model_version:
+            return jsonify({
+                'success': False,
+                'message': 'معرف الطالب وإصدار النموذج مطلوبان'
+            }), 400
+        
+        # تشفيرات نموذج آخر ليست في نفس الفضاء ولا تصح مقارنتها بالمعرض
+        if model_version != gallery_model_version:
+            return jsonify({
+                'success': False,
+                'message': 'إصدار النموذج لا يطابق إصدار المعرض',
+                'model_version': gallery_model_version
+            }), 400
+        
+        if student_id not in templates:
+            return jsonify({
+                'success': False,
+                'message': 'لم يتم تسجيل وجه لهذا الطالب'
+            }), 400
+        
+        return jsonify(score_verification(student_id, embedding, data.get('course_id')))
+    
+    except Exception as e:
+        logger.error(f"خطأ في التحقق من التشفير: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في الخادم: {str(e)}'
+        }), 500
+
+def run_face_job(action, data, image_bytes):
+    """
+    تنفيذ مهمة تسجيل أو تحقق غير متزامنة في خيط من قائمة المهام
+    
+    Returns:
+        result: نفس استجابة النقطة المتزامنة المقابلة
+    """
+    image = image_bytes
+    if inference_pool is None:
+        with stage_timer('decode'):
+            image = decode_image(io.BytesIO(image_bytes), MAX_DETECTION_EDGE)
+    
+    embedding, face = embed_request_face(data, image, keep_crop=action == 'register')
+    if embedding is None:
+        return {
+            'success': False,
+            'message': 'لم يتم اكتشاف وجه في الصورة'
+        }
+    
+    student_id = data['student_id']
+    if action == 'register':
+        register_embedding(student_id, embedding, face)
+        return {
+            'success': True,
+            'message': 'تم تسجيل الوجه بنجاح'
+        }
+    return score_verification(student_id, embedding, data.get('course_id'))
+
+def submit_face_job(action):
+    """قراءة الطلب والتحقق من حقوله ثم إضافته إلى قائمة المهام"""
+    try:
+        data, image = read_image_request(decode=False)
+        student_id = data.get('student_id')
+        
+        if not student_id or image is None:
+            return jsonify({
+                'success': False,
+                'message': 'معرف الطالب والصورة مطلوبان'
+            }), 400
+        
+        if action == 'verify' and student_id not in templates:
+            return jsonify({
+                'success': False,
+                'message': 'لم يتم تسجيل وجه لهذا الطالب'
+            }), 400
+        
+        # الصورة الخام فقط؛ حقول الطلب الأخرى تبقى كما هي
+        data = {key: value for key, value in data.items() if key != 'image'}
+        try:
+            job_id = face_jobs.submit(run_face_job, action, data, image)
+        except JobQueueFull:
+            response = jsonify({
+                'success': False,
+                'message': 'الخادم مشغول، أعد المحاولة لاحقًا'
+            })
+            response.headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+            return response, 503
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued'
+        }), 202
+    
+    except Exception as e:
+        logger.error(f"خطأ في إرسال المهمة: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في الخادم: {str(e)}'
+        }), 500
+
+@app.route('/jobs/register-face', methods=['POST'])
+def submit_register_face_job():
+    """تسجيل وجه كمهمة غير متزامنة"""
+    return submit_face_job('register')
+
+@app.route('/jobs/verify-face', methods=['POST'])
+def submit_verify_face_job():
+    """التحقق من وجه كمهمة غير متزامنة"""
+    return submit_face_job('verify')
+
+@app.route('/jobs/metrics', methods=['GET'])
+def job_metrics():
+    """مقاييس قائمة المهام: العمق والمرفوض وزمن الانتظار منفصلًا عن زمن التنفيذ"""
+    return jsonify(face_jobs.metrics())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_face_job(job_id):
+    """حالة المهمة ونتيجتها؛ wait (بالثواني) ينتظر حتى انتهائها"""
+    wait = min(float(request.args.get('wait', 0)), JOB_MAX_WAIT_SECONDS)
+    job = face_jobs.get(job_id, wait)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': 'المهمة غير موجودة أو انتهت صلاحيتها'
+        }), 404
+    
+    job['success'] = True
+    return jsonify(job)
+
+@app.route('/courses/<course_id>/cohort', methods=['PUT'])
+def set_course_cohort(course_id):
+    """تحديث قائمة طلاب المقرر لهامش الأمان (يستدعيه الخادم الخلفي عند التسجيل وإلغاء التسجيل)"""
+    data = request.get_json(silent=True) or {}
+    student_ids = data.get('student_ids')
+    if not isinstance(student_ids, list):
+        return jsonify({
+            'success': False,
+            'message': 'قائمة الطلاب مطلوبة'
+        }), 400
+    
+    impostor_cohorts.set_course(course_id, [str(student_id) for student_id in student_ids])
+    logger.info(f"مجموعة المقارنة للمقرر {course_id}: {len(student_ids)} طالب")
+    return jsonify({
+        'success': True,
+        'course_id': course_id,
+        'students': len(student_ids)
+    })
+
+@app.route('/courses/cohorts', methods=['GET'])
+def get_course_cohorts():
+    """معرف التشغيل وعدد المقررات المعروفة (يستطلعه الخادم الخلفي ليعرف متى يعيد المزامنة)"""
+    return jsonify({
+        'success': True,
+        'instance_id': INSTANCE_ID,
+        'courses': impostor_cohorts.course_count
+    })
+
+@app.route('/courses/cohorts', methods=['PUT'])
+def replace_course_cohorts():
+    """استبدال قوائم طلاب كل المقررات (مزامنة كاملة عند بدء التشغيل أو بعد فشل إرسال)"""
+    data = request.get_json(silent=True) or {}
+    courses = data.get('courses')
+    if not isinstance(courses, dict) or not all(isinstance(ids, list) for ids in courses.values()):
+        return jsonify({
+            'success': False,
+            'message': 'قاموس المقررات وطلابها مطلوب'
+        }), 400
+    
+    impostor_cohorts.replace_courses({
+        str(course_id): [str(student_id) for student_id in student_ids]
+        for course_id, student_ids in courses.items() if student_ids
+    })
+    logger.info(f"مزامنة كاملة لمجموعات المقارنة: {impostor_cohorts.course_count} مقرر")
+    return jsonify({
+        'success': True,
+        'instance_id': INSTANCE_ID,
+        'courses': impostor_cohorts.course_count
+    })
+
+@app.route('/courses/<course_id>/cohort', methods=['DELETE'])
+def delete_course_cohort(course_id):
+    """حذف مجموعة المقارنة للمقرر (يعود التحقق للمقارنة بالمعرض كاملًا)"""
+    impostor_cohorts.remove_course(course_id)
+    return jsonify({'success': True, 'course_id': course_id})
+
+@app.route('/attendance/identify-face', methods=['POST'])
+def identify_face():
+    """البحث عن هوية الوجه بين جميع الطلاب المسجلين"""
+    try:
+        data, image = read_image_request(decode=inference_pool is None)
+        top_k = min(int(data.get('top_k', 5)), IDENTIFY_MAX_TOP_K)
+        
+        if image is None:
+            return jsonify({
+                'success': False,
+                'message': 'الصورة مطلوبة'
+            }), 400
+        
+        # اقتصاص الوجه من المربع المرسل أو اكتشافه واستخراج التشفير
+        embedding, _ = embed_request_face(data, image)
+        
+        if embedding is None:
             return jsonify({
                 'success': False,
                 'message': 'لم يتم اكتشاف وجه في الصورة'
             }), 400
         
-        # الحصول على التشفير
-        with torch.no_grad():
-            embedding = resnet(face.unsqueeze(0))[0]
+        # البحث عن أقرب المرشحين وتحويل التشابه إلى نطاق 0-1
+        with stage_timer('match'):
+            candidates = [
+                {'student_id': candidate_id, 'similarity': (cosine_similarity + 1) / 2}
+                for candidate_id, cosine_similarity in ann_index.search(normalize_embedding(embedding), top_k)
+            ]
         
-        # حساب التشابه مع الوجه المسجل
-        known_embedding = face_embeddings[student_id]
-        similarity = calculate_similarity(embedding, known_embedding)
+        best = candidates[0] if candidates else None
+        identified = best is not None and best['similarity'] >= SIMILARITY_THRESHOLD
         
-        # حساب متوسط التشابه مع جميع الوجوه الأخرى المسجلة
-        other_similarities = []
-        for other_id, other_embedding in face_embeddings.items():
-            if other_id != student_id:
-                other_similarity = calculate_similarity(embedding, other_embedding)
-                other_similarities.append(other_similarity)
+        logger.info(f"التعرف على الوجه: أفضل مرشح = {best}, النتيجة = {identified}")
         
-        # إذا لم تكن هناك وجوه أخرى مسجلة، نستخدم فقط عتبة التشابه
-        if len(other_similarities) == 0:
-            verified = similarity >= SIMILARITY_THRESHOLD
-        else:
-            # حساب متوسط التشابه مع الوجوه الأخرى
-            avg_other_similarity = sum(other_similarities) / len(other_similarities)
-            
-            # التحقق من أن التشابه مع الوجه المسجل أعلى بكثير من التشابه مع الوجوه الأخرى
-            verified = (similarity >= SIMILARITY_THRESHOLD) and (similarity > avg_other_similarity + SECURITY_MARGIN)
+        return jsonify({
+            'success': True,
+            'identified': identified,
+            'student_id': best['student_id'] if identified else None,
+            'candidates': candidates,
+            'threshold': SIMILARITY_THRESHOLD
+        })
+    
+    except Exception as e:
+        logger.error(f"خطأ في التعرف على الوجه: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في الخادم: {str(e)}'
+        }), 500
+
+@app.route('/attendance/classroom-photo', methods=['POST'])
+def classroom_photo_attendance():
+    """مطابقة كل الوجوه في صور الفصل مع طلاب المقرر المسجلين دفعة واحدة"""
+    try:
+        data, images = read_image_request(multiple=True, max_detection_edge=CLASSROOM_MAX_DETECTION_EDGE)
+        course_id = data.get('course_id')
+        student_ids = [str(student_id) for student_id in data.get('student_ids', [])]
         
-        logger.info(f"التحقق من الوجه للطالب {student_id}: التشابه = {similarity:.4f}, النتيجة = {verified}")
+        if not course_id or not student_ids or not images:
+            return jsonify({
+                'success': False,
+                'message': 'معرف المقرر وقائمة الطلاب والصور مطلوبة'
+            }), 400
         
-        # تسجيل التحقق في قاعدة البيانات
-        # (هنا يمكن إضافة كود لتسجيل عملية التحقق في قاعدة البيانات)
+        # اكتشاف كل الوجوه في كل صورة
+        crops = []
+        crop_images = []
+        for image_index, image in enumerate(images):
+            with stage_timer('detect'):
+                faces = detect_faces(classroom_mtcnn, image)
+            if faces is not None:
+                crops.append(faces)
+                crop_images.extend([image_index] * faces.shape[0])
+        
+        if not crops:
+            return jsonify({
+                'success': False,
+                'message': 'لم يتم اكتشاف وجوه في الصور'
+            }), 400
+        
+        # تشفير كل القصاصات في تمريرات مجمعة
+        crops = torch.cat(crops)
+        with stage_timer('embed'), torch.no_grad():
+            embeddings = torch.cat([
+                resnet(crops[start:start + CLASSROOM_EMBED_BATCH_SIZE])
+                for start in range(0, crops.shape[0], CLASSROOM_EMBED_BATCH_SIZE)
+            ])
+        probes = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        
+        # مطابقة الوجوه مع طلاب المقرر فقط بمصفوفة تشابه واحدة
+        with stage_timer('match'):
+            roster_ids, roster = gallery.subset(student_ids)
+            matches = match_faces_to_roster(probes, roster, SIMILARITY_THRESHOLD)
+        
+        present = [
+            {
+                'student_id': roster_ids[student_index],
+                'similarity': similarity,
+                'image_index': crop_images[probe_index]
+            }
+            for probe_index, student_index, similarity in matches
+        ]
+        
+        logger.info(f"صور الفصل للمقرر {course_id}: {crops.shape[0]} وجه، {len(present)} طالب حاضر")
         
         return jsonify({
             'success': True,
-            'verified': verified,
-            'similarity': similarity,
-            'threshold': SIMILARITY_THRESHOLD,
-            'security_margin': SECURITY_MARGIN
+            'course_id': course_id,
+            'faces_detected': crops.shape[0],
+            'present': present,
+            'unmatched_faces': crops.shape[0] - len(present),
+            'not_registered': [student_id for student_id in student_ids if student_id not in gallery],
+            'threshold': SIMILARITY_THRESHOLD
         })
     
     except Exception as e:
-        logger.error(f"خطأ في التحقق من الوجه: {e}")
+        logger.error(f"خطأ في معالجة صور الفصل: {e}")
         return jsonify({
             'success': False,
             'message': f'خطأ في الخادم: {str(e)}'
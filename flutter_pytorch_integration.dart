@@ -143,6 +143,7 @@ class _FaceRecognitionScreenState extends State<FaceRecognitionScreen> {
       headers: {'Content-Type': 'application/json'},
       body: jsonEncode({
         'student_id': widget.studentId,
+        'course_id': widget.courseId,
         'image': base64Image,
       }),
     );
@@ -7,6 +7,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch.utils.mobile_optimizer import optimize_for_mobile
 from facenet_pytorch import MTCNN, InceptionResnetV1
+from face_gallery import FaceGallery, TemplateBank, match_faces_to_roster, pairwise_similarity
+from face_preprocessing import DecodedImage, detect_faces_batch
 import numpy as np
 from PIL import Image
 import os
@@ -45,6 +47,12 @@ class FaceRecognitionSystem:
         
         # قاموس لتخزين تشفيرات الوجوه المعروفة
         self.known_face_encodings = {}
+        
+        # عدة قوالب لكل طالب (كل تسجيل يضيف قالبًا) مع مركزها
+        self.templates = TemplateBank(max_templates=5)
+        
+        # مراكز القوالب مع مجموعها التراكمي لحساب هامش الأمان
+        self.gallery = FaceGallery()
     
     def detect_faces(self, image):
         """
@@ -97,35 +105,29 @@ class FaceRecognitionSystem:
         Returns:
             success: نجاح العملية
         """
-        encodings = []
-        
-        for image in images:
-            boxes, probs, _ = self.detect_faces(image)
-            
-            if boxes is None or len(boxes) == 0:
-                continue
-                
-            # استخدام الوجه ذو الاحتمالية الأعلى
-            best_box_idx = np.argmax(probs)
-            encoding = self.get_face_encoding(image, boxes[best_box_idx])
-            
-            if encoding is not None:
-                encodings.append(encoding)
+        # اكتشاف الوجه الأعلى احتمالية في كل الصور دفعة واحدة
+        faces = detect_faces_batch(
+            self.mtcnn, [DecodedImage(image, image) for image in images], method='probability'
+        )
+        faces = [face for face in faces if face is not None]
         
-        if len(encodings) == 0:
+        if len(faces) == 0:
             return False
         
-        # التحقق من أن جميع الصور تنتمي لنفس الشخص
-        if len(encodings) > 1:
-            for i in range(len(encodings) - 1):
-                for j in range(i + 1, len(encodings)):
-                    similarity = self.calculate_similarity(encodings[i], encodings[j])
-                    if similarity < self.similarity_threshold:
-                        return False  # الصور لا تنتمي لنفس الشخص
+        # تشفير كل القصاصات في تمريرة واحدة
+        with torch.no_grad():
+            encodings = self.resnet(torch.stack(faces))
+        
+        # التحقق من أن جميع الصور تنتمي لنفس الشخص (مصفوفة تشابه k x k)
+        _, min_similarity = pairwise_similarity(encodings)
+        if min_similarity < self.similarity_threshold:
+            return False  # الصور لا تنتمي لنفس الشخص
         
-        # تخزين متوسط التشفيرات
-        avg_encoding = torch.mean(torch.stack(encodings), dim=0)
-        self.known_face_encodings[student_id] = avg_encoding
+        # تخزين متوسط التشفيرات كقالب جديد للطالب
+        avg_encoding = torch.mean(encodings, dim=0)
+        self.templates.add(student_id, avg_encoding)
+        self.known_face_encodings[student_id] = self.templates.centroid(student_id)
+        self.gallery.add(student_id, self.known_face_encodings[student_id])
         
         return True
     
@@ -156,30 +158,46 @@ class FaceRecognitionSystem:
         if encoding is None:
             return False, 0.0
         
-        # حساب التشابه مع الوجه المسجل
-        known_encoding = self.known_face_encodings[student_id]
-        similarity = self.calculate_similarity(encoding, known_encoding)
+        # حساب أعلى تشابه مع قوالب الطالب المسجلة وتحويله إلى نطاق 0-1
+        similarity = (self.templates.score(student_id, encoding) + 1) / 2
         
         # حساب متوسط التشابه مع جميع الوجوه الأخرى المسجلة
-        other_similarities = []
-        for other_id, other_encoding in self.known_face_encodings.items():
-            if other_id != student_id:
-                other_similarity = self.calculate_similarity(encoding, other_encoding)
-                other_similarities.append(other_similarity)
+        avg_other_similarity = self.gallery.impostor_mean_similarity(encoding, student_id)
         
         # إذا لم تكن هناك وجوه أخرى مسجلة، نستخدم فقط عتبة التشابه
-        if len(other_similarities) == 0:
+        if avg_other_similarity is None:
             return similarity >= self.similarity_threshold, similarity
         
-        # حساب متوسط التشابه مع الوجوه الأخرى
-        avg_other_similarity = sum(other_similarities) / len(other_similarities)
-        
         # التحقق من أن التشابه مع الوجه المسجل أعلى بكثير من التشابه مع الوجوه الأخرى
         security_margin = 0.30  # هامش أمان عالي
         verified = (similarity >= self.similarity_threshold) and (similarity > avg_other_similarity + security_margin)
         
         return verified, similarity
     
+    def match_classroom(self, images, student_ids):
+        """
+        مطابقة كل الوجوه في صور الفصل مع طلاب مقرر واحد
+        
+        Args:
+            images: قائمة من صور PIL للفصل
+            student_ids: معرفات الطلاب المسجلين في المقرر
+            
+        Returns:
+            matches: قاموس {معرف الطالب: درجة التشابه} للطلاب الحاضرين
+        """
+        # اكتشاف كل الوجوه (keep_all=True) ثم تشفيرها في تمريرة واحدة
+        crops = [faces for faces in (self.mtcnn(image) for image in images) if faces is not None]
+        if len(crops) == 0:
+            return {}
+        
+        with torch.no_grad():
+            encodings = self.resnet(torch.cat(crops))
+        
+        roster_ids, roster = self.gallery.subset(student_ids)
+        matches = match_faces_to_roster(F.normalize(encodings, p=2, dim=1), roster, self.similarity_threshold)
+        
+        return {roster_ids[student_index]: similarity for _, student_index, similarity in matches}
+    
     def calculate_similarity(self, encoding1, encoding2):
         """
         حساب التشابه بين تشفيرين
@@ -202,12 +220,15 @@ class FaceRecognitionSystem:
         
         return similarity
     
-    def export_model(self, output_path):
+    def export_model(self, output_path, model_version='inception-resnet-v1-vggface2'):
         """
         تصدير النموذج لاستخدامه في تطبيق محمول
         
         Args:
             output_path: مسار الملف الناتج
+            model_version: إصدار النموذج (FACE_MODEL_VERSION على الخادم)؛ يُحفظ
+                داخل الملف في model_version ويُرسل مع التشفيرات إلى
+                /attendance/verify-embedding
         """
         # إنشاء مدخل وهمي للنموذج
         dummy_input = torch.randn(1, 3, 160, 160)
@@ -219,7 +240,9 @@ class FaceRecognitionSystem:
         traced_script_module_optimized = optimize_for_mobile(traced_script_module)
         
         # حفظ النموذج
-        traced_script_module_optimized._save_for_lite_interpreter(output_path)
+        traced_script_module_optimized._save_for_lite_interpreter(
+            output_path, _extra_files={'model_version': model_version}
+        )
         
         print(f"تم تصدير النموذج إلى {output_path}")
 
@@ -0,0 +1,66 @@
+"""
+اختبارات سجل القصاصات في face_crop_store
+
+    python -m pytest tests
+"""
+
+import os
+
+import torch
+
+from face_crop_store import CropStore
+
+
+def _crops(count=1, value=0.5):
+    return torch.full((count, 3, 160, 160), value)
+
+
+def test_index_returns_latest_record_per_key(tmp_path):
+    store = CropStore(str(tmp_path))
+    store.append('s1#0', _crops(value=0.1))
+    store.append('s2#0', _crops(2))
+    store.append('s1#0', _crops(value=0.9))
+
+    index = store.index()
+
+    assert sorted(index) == ['s1#0', 's2#0']
+    assert index['s2#0'][1] == 2
+    assert torch.allclose(store.read(index['s1#0']), _crops(value=0.9), atol=1 / 128)
+
+
+def test_torn_record_is_truncated_before_new_appends(tmp_path):
+    store = CropStore(str(tmp_path))
+    store.append('s1#0', _crops())
+    good_size = os.path.getsize(store.path)
+    with open(store.path, 'ab') as f:
+        f.write(b'\x04\x00s2#0\x01\x00' + b'\x00' * 1000)
+
+    assert sorted(store.index()) == ['s1#0']
+    assert os.path.getsize(store.path) == good_size
+
+    store.append('s3#0', _crops())
+    assert sorted(store.index()) == ['s1#0', 's3#0']
+
+
+def test_corrupt_record_stops_index_and_is_cut(tmp_path):
+    store = CropStore(str(tmp_path))
+    store.append('s1#0', _crops())
+    store.append('s2#0', _crops())
+    with open(store.path, 'r+b') as f:
+        f.seek(-10, os.SEEK_END)
+        f.write(b'\xff')
+
+    assert sorted(store.index()) == ['s1#0']
+    store.append('s2#0', _crops())
+    assert sorted(store.index()) == ['s1#0', 's2#0']
+
+
+def test_read_only_store_leaves_the_file_alone(tmp_path):
+    CropStore(str(tmp_path)).append('s1#0', _crops())
+    path = os.path.join(str(tmp_path), 'face_crops.bin')
+    with open(path, 'ab') as f:
+        f.write(b'\x04\x00')
+    size = os.path.getsize(path)
+
+    assert sorted(CropStore(str(tmp_path), read_only=True).index()) == ['s1#0']
+    assert os.path.getsize(path) == size
@@ -0,0 +1,70 @@
+"""
+اختبارات ضغط مخزن التشفيرات في face_embedding_store
+
+    python -m pytest tests
+"""
+
+import os
+
+import torch
+
+import face_embedding_store
+from face_embedding_store import SNAPSHOT_FILE, EmbeddingStore
+
+
+def _snapshots(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.bin'))
+
+
+def _vector(value):
+    return torch.full((512,), float(value))
+
+
+def test_compact_keeps_loaded_views_valid(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.compact({'a#0': _vector(1), 'b#0': _vector(2)})
+    loaded = store.load()
+
+    # اللقطة الحالية مربوطة بالذاكرة عبر loaded أثناء الضغط
+    store.append('c#0', _vector(3))
+    store.compact(dict(loaded, **{'c#0': _vector(3)}))
+
+    assert torch.equal(loaded['a#0'], _vector(1))
+    assert len(_snapshots(str(tmp_path))) == 1
+    reloaded = EmbeddingStore(str(tmp_path)).load()
+    assert sorted(reloaded) == ['a#0', 'b#0', 'c#0']
+    assert torch.equal(reloaded['c#0'], _vector(3))
+
+
+def test_legacy_snapshot_is_replaced_by_a_generation(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.compact({'a#0': _vector(1)})
+    os.replace(store.snapshot_path, os.path.join(str(tmp_path), SNAPSHOT_FILE))
+    os.remove(store.snapshot_pointer_path)
+
+    assert sorted(store.load()) == ['a#0']
+    store.compact(store.load())
+    assert _snapshots(str(tmp_path)) == ['face_embeddings.1.bin']
+
+
+def test_snapshot_still_mapped_is_removed_on_a_later_compaction(tmp_path, monkeypatch):
+    store = EmbeddingStore(str(tmp_path))
+    store.compact({'a#0': _vector(1)})
+    mapped = store.snapshot_path
+
+    real_remove = os.remove
+
+    def remove(path):
+        # كما على Windows: لا يُحذف ملف مربوط بالذاكرة
+        if path == mapped:
+            raise PermissionError(path)
+        real_remove(path)
+
+    monkeypatch.setattr(face_embedding_store.os, 'remove', remove)
+    store.compact(store.load())
+    assert len(_snapshots(str(tmp_path))) == 2
+    assert sorted(EmbeddingStore(str(tmp_path)).load()) == ['a#0']
+
+    monkeypatch.setattr(face_embedding_store.os, 'remove', real_remove)
+    store.compact(store.load())
+    assert len(_snapshots(str(tmp_path))) == 1
@@ -0,0 +1,54 @@
+"""
+اختبارات الاكتشاف الدفعي في face_preprocessing
+
+    python -m pytest tests
+"""
+
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from face_preprocessing import decode_image, detect_faces_batch
+
+FACE_IMAGE = os.path.join(os.path.dirname(__file__), '..', 'assets', 'images',
+                          'WhatsApp Image 2025-03-10 at 20.48.39_ce574561.jpg')
+
+
+@pytest.fixture(scope='module')
+def mtcnn():
+    facenet_pytorch = pytest.importorskip('facenet_pytorch')
+    return facenet_pytorch.MTCNN(image_size=160, margin=20, keep_all=False, min_face_size=40,
+                                 thresholds=[0.6, 0.7, 0.8], factor=0.709, post_process=True, device='cpu')
+
+
+def _decoded(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    buffer.seek(0)
+    return decode_image(buffer, 800)
+
+
+@pytest.fixture(scope='module')
+def face():
+    return Image.open(FACE_IMAGE).convert('RGB')
+
+
+@pytest.fixture(scope='module')
+def blank(face):
+    # نفس المقاس حتى تقع اللقطتان في مجموعة MTCNN واحدة
+    return Image.new('RGB', face.size, (128, 128, 128))
+
+
+def test_mixed_face_and_faceless_shots(mtcnn, face, blank):
+    faces = detect_faces_batch(mtcnn, [_decoded(face), _decoded(blank), _decoded(face)])
+
+    assert faces[1] is None
+    for crop in (faces[0], faces[2]):
+        assert crop is not None
+        assert tuple(crop.shape) == (3, 160, 160)
+
+
+def test_faceless_shots_only(mtcnn, blank):
+    assert detect_faces_batch(mtcnn, [_decoded(blank), _decoded(blank)]) == [None, None]